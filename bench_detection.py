@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+# bench_detection.py — бенчмарк и регрессия распознавания на img/test
+"""
+Запуск:
+    python bench_detection.py                              # конфигурация по умолчанию
+    python bench_detection.py --imgsz 1600 1280 960 --tta 1 0
+    python bench_detection.py --model yolov8s_playing_cards.pt yolov8s_playing_cards.onnx
+    python bench_detection.py --save-baseline              # зафиксировать bench/detection_baseline.json
+
+Разметка — img/test/labels.json: {"1.jpg": "N:AKQ.… … … …", …} (PBN, руки от
+указанной руки по часовой). null — фото без разметки: для него меряем только время.
+
+По каждой конфигурации: время по этапам (profiling.StageTimer), пиковый RSS,
+точность/полнота по картам (карта в правильной руке), доля карт в правильной
+руке среди найденных (и то же с точностью до поворота стола — его пользователь
+исправляет кнопкой). Итог сравнивается с базовой линией; при регрессии код выхода 1.
+"""
+
+from __future__ import annotations
+
+import argparse
+import itertools
+import json
+import statistics
+import sys
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Dict, List
+
+from detection import (BridgeCardDetector, DetectorConfig, DEFAULT_CONFIG,
+                       ALL_CARDS, ORDER, _get_model)
+from metrics import rss_bytes
+from profiling import StageTimer
+
+# ──────────── настройки ────────────
+IMG_DIR = Path("img/test")
+LABELS = IMG_DIR / "labels.json"
+BASELINE = Path("bench/detection_baseline.json")
+LAST_RUN = Path("bench/detection_last.json")
+IMG_EXT = (".jpg", ".jpeg", ".png")
+RSS_SAMPLE_SEC = 0.005
+LATENCY_TOLERANCE = 0.10     # +10 % к среднему времени — регрессия
+ACCURACY_TOLERANCE = 0.005   # −0.5 п.п. точности/полноты — регрессия
+
+
+# ──────────── замеры ────────────
+class PeakRss:
+    """Пиковый RSS за время блока: фоновый поток опрашивает /proc."""
+
+    def __enter__(self):
+        self.peak = rss_bytes()
+        self._stop = threading.Event()
+        self._thr = threading.Thread(target=self._poll, daemon=True)
+        self._thr.start()
+        return self
+
+    def _poll(self):
+        while not self._stop.wait(RSS_SAMPLE_SEC):
+            self.peak = max(self.peak, rss_bytes())
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thr.join()
+        self.peak = max(self.peak, rss_bytes())
+        return False
+
+
+def _rotate(hands: Dict[str, set], k: int) -> Dict[str, set]:
+    return {ORDER[(ORDER.index(p) + k) % 4]: cards for p, cards in hands.items()}
+
+
+def _owner(hands: Dict[str, set]) -> Dict[str, str]:
+    return {c: p for p, cards in hands.items() for c in cards}
+
+
+def score(found: Dict[str, set], truth: Dict[str, set]) -> dict:
+    """Сравнение рук детектора с разметкой."""
+    want = _owner(truth)
+    got = _owner(found)
+    correct = [c for c, p in got.items() if want.get(c) == p]
+    best_rot = max(sum(want.get(c) == p for c, p in _owner(_rotate(found, k)).items())
+                   for k in range(4))
+    return {
+        "found": len(got),
+        "correct": len(correct),
+        "correct_rot": best_rot,
+        "wrong_hand": sorted(c for c in got if c not in correct),
+        "missed": sorted(c for c in want if c not in got),
+    }
+
+
+def _image_paths(only: List[str]) -> List[Path]:
+    if only:
+        return [Path(p) for p in only]
+    return sorted(p for p in IMG_DIR.iterdir()
+                  if p.suffix.lower() in IMG_EXT and "_annotated" not in p.stem)
+
+
+def _load_labels() -> Dict[str, Dict[str, set]]:
+    if not LABELS.exists():
+        return {}
+    raw = json.loads(LABELS.read_text(encoding="utf-8"))
+    return {name: BridgeCardDetector.from_pbn(pbn).hands
+            for name, pbn in raw.items() if pbn and not name.startswith("_")}
+
+
+def run_config(cfg: DetectorConfig, paths: List[Path], labels, repeat: int) -> dict:
+    t0 = time.perf_counter()
+    _get_model(cfg.model)
+    model_load = time.perf_counter() - t0
+    BridgeCardDetector(str(paths[0]), config=cfg)          # прогрев (CUDA/ONNX сессии, кэши)
+
+    images, stage_sum = [], Counter()
+    tp, fp, fn = Counter(), Counter(), Counter()
+    for path in paths:
+        walls, peak, det, timer = [], 0.0, None, None
+        for _ in range(repeat):
+            timer = StageTimer("bench")
+            with PeakRss() as mem:
+                w0 = time.perf_counter()
+                det = BridgeCardDetector(str(path), config=cfg, timer=timer)
+                walls.append(time.perf_counter() - w0)
+            peak = max(peak, mem.peak)
+        for name, (wall, _) in timer.stages.items():
+            stage_sum[name] += wall
+        row = {"image": path.name, "seconds": statistics.median(walls),
+               "peak_rss_mb": round(peak / 2 ** 20, 1),
+               "stages": {n: round(w, 4) for n, (w, _) in timer.stages.items()}}
+        truth = labels.get(path.name)
+        if truth is not None:
+            sc = score(det.hands, truth)
+            row.update(sc)
+            want, got = _owner(truth), _owner(det.hands)
+            for c in ALL_CARDS:
+                if c in got and got[c] == want.get(c):
+                    tp[c] += 1
+                else:
+                    fn[c] += c in want
+                    fp[c] += c in got
+        images.append(row)
+        print(f"  {path.name:<14}{row['seconds'] * 1000:>8.0f} мс{row['peak_rss_mb']:>9.0f} МБ"
+              + (f"  карт {row['found']:>2}, в своей руке {row['correct']:>2}" if truth else "  (без разметки)"))
+
+    secs = [r["seconds"] for r in images]
+    res = {
+        "config": cfg.label(),
+        "model_load_seconds": round(model_load, 3),
+        "images": images,
+        "latency": {"mean": statistics.mean(secs), "p50": statistics.median(secs),
+                    "max": max(secs)},
+        "stages_mean": {n: round(v / len(images), 4) for n, v in stage_sum.most_common()},
+        "peak_rss_mb": max(r["peak_rss_mb"] for r in images),
+        "labelled": sum(1 for r in images if "found" in r),
+    }
+    if res["labelled"]:
+        t, p, n = sum(tp.values()), sum(fp.values()), sum(fn.values())
+        lab = [r for r in images if "found" in r]
+        res["accuracy"] = {
+            "precision": t / max(1, t + p),
+            "recall": t / max(1, t + n),
+            "hand_accuracy": sum(r["correct"] for r in lab) / max(1, sum(r["found"] for r in lab)),
+            "hand_accuracy_rot": sum(r["correct_rot"] for r in lab) / max(1, sum(r["found"] for r in lab)),
+        }
+        res["worst_cards"] = sorted(
+            ({"card": c, "recall": tp[c] / max(1, tp[c] + fn[c]),
+              "precision": tp[c] / max(1, tp[c] + fp[c])} for c in ALL_CARDS if fn[c] or fp[c]),
+            key=lambda x: (x["recall"], x["precision"]))[:10]
+    return res
+
+
+# ──────────── сравнение с базовой линией ────────────
+def compare(current: dict, baseline: dict) -> List[str]:
+    """Список регрессий (пустой — всё в порядке); попутно печатает дельты."""
+    problems = []
+    base = {r["config"]: r for r in baseline.get("runs", [])}
+    for run in current["runs"]:
+        old = base.get(run["config"])
+        if old is None:
+            print(f"{run['config']}: в базовой линии нет — сравнивать не с чем")
+            continue
+        d = run["latency"]["mean"] / old["latency"]["mean"] - 1
+        print(f"{run['config']}: время {d:+.1%}, RSS {run['peak_rss_mb'] - old['peak_rss_mb']:+.0f} МБ")
+        if d > LATENCY_TOLERANCE:
+            problems.append(f"{run['config']}: среднее время выросло на {d:.1%}")
+        for k, v in run.get("accuracy", {}).items():
+            was = old.get("accuracy", {}).get(k)
+            if was is None:
+                continue
+            print(f"    {k}: {was:.3f} → {v:.3f}")
+            if v < was - ACCURACY_TOLERANCE:
+                problems.append(f"{run['config']}: {k} упала {was:.3f} → {v:.3f}")
+    return problems
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description="Бенчмарк BridgeCardDetector на img/test")
+    ap.add_argument("images", nargs="*", help="фото (по умолчанию — все из img/test)")
+    ap.add_argument("--model", nargs="+", default=[DEFAULT_CONFIG.model],
+                    help=".pt / .onnx / *_openvino_model / .engine")
+    ap.add_argument("--imgsz", nargs="+", type=int, default=[DEFAULT_CONFIG.imgsz])
+    ap.add_argument("--tta", nargs="+", type=int, choices=(0, 1), default=[1])
+    ap.add_argument("--second-pass", nargs="+", type=int, choices=(0, 1), default=[1])
+    ap.add_argument("--repeat", type=int, default=1, help="прогонов на фото (берём медиану)")
+    ap.add_argument("--baseline", type=Path, default=BASELINE)
+    ap.add_argument("--save-baseline", action="store_true")
+    ap.add_argument("--json", type=Path, default=LAST_RUN)
+    args = ap.parse_args(argv)
+
+    paths = _image_paths(args.images)
+    labels = _load_labels()
+    print(f"фото: {len(paths)}, с разметкой: {sum(p.name in labels for p in paths)}")
+
+    runs = []
+    for model, imgsz, tta, sp in itertools.product(args.model, args.imgsz, args.tta, args.second_pass):
+        cfg = DetectorConfig(model=model, imgsz=imgsz, augment=bool(tta), second_pass=bool(sp))
+        print(cfg.label())
+        run = run_config(cfg, paths, labels, max(1, args.repeat))
+        lat, acc = run["latency"], run.get("accuracy")
+        print(f"  среднее {lat['mean'] * 1000:.0f} мс, p50 {lat['p50'] * 1000:.0f} мс, "
+              f"пик RSS {run['peak_rss_mb']:.0f} МБ")
+        print("  этапы: " + ", ".join(f"{n} {v * 1000:.0f}" for n, v in run["stages_mean"].items()))
+        if acc:
+            print("  " + ", ".join(f"{k} {v:.3f}" for k, v in acc.items()))
+        runs.append(run)
+
+    result = {"created": time.strftime("%Y-%m-%d %H:%M:%S"), "runs": runs}
+    args.json.parent.mkdir(parents=True, exist_ok=True)
+    args.json.write_text(json.dumps(result, ensure_ascii=False, indent=1), encoding="utf-8")
+    if args.save_baseline:
+        args.baseline.parent.mkdir(parents=True, exist_ok=True)
+        args.baseline.write_text(json.dumps(result, ensure_ascii=False, indent=1), encoding="utf-8")
+        print(f"базовая линия записана в {args.baseline}")
+        return 0
+    if not args.baseline.exists():
+        print(f"базовой линии нет ({args.baseline}) — запустите с --save-baseline")
+        return 0
+    problems = compare(result, json.loads(args.baseline.read_text(encoding="utf-8")))
+    for p in problems:
+        print("РЕГРЕССИЯ:", p)
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
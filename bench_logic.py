@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+# bench_logic.py — бенчмарк двойного болвана (BridgeLogic) на фиксированном корпусе
+"""
+Запуск:
+    python bench_logic.py                      # 40 сдач, seed 2024, сравнение с базовой линией
+    python bench_logic.py --deals 200 --seed 7
+    python bench_logic.py --save-baseline      # зафиксировать bench/logic_baseline.json
+
+Корпус детерминирован (random.Random(seed)): одни и те же сдачи, контракты и
+точки отката на любой машине. Для каждой операции — два замера:
+    cold — первый вызов на свежей позиции (кэш позиции пуст);
+    warm — тот же вызов повторно на той же позиции (после восстановления
+           состояния для мутирующих операций).
+Кроме времени считаем вызовы DDS на операцию (logic.DDS_SECONDS) — по ним
+видно, сколько решателя экономит кэширование. Время сравнимо только с базовой
+линией, снятой на той же машине; число вызовов DDS — на любой.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import random
+import statistics
+import sys
+import time
+from collections import defaultdict
+from pathlib import Path
+from typing import Callable, Dict, List, Tuple
+
+from logic import BridgeLogic, DDS_SECONDS, RANKS, SUITS
+
+# ──────────── настройки ────────────
+DEALS = 40
+SEED = 2024
+BASELINE = Path("bench/logic_baseline.json")
+LAST_RUN = Path("bench/logic_last.json")
+TIME_TOLERANCE = 0.30        # +30 % к медиане — регрессия (между прогонами на одной машине шум до ~25 %)
+MIN_REGRESSION_MS = 0.05     # изменения меньше этого не считаем вовсе
+DENOMS = ("NT", "S", "H", "D", "C")
+HANDS = "NESW"
+
+
+# ──────────── корпус ────────────
+def make_corpus(n: int, seed: int) -> List[Tuple[str, str, str, int, int]]:
+    """[(pbn, контракт, первый ход, взятка отката, карта отката)]"""
+    rnd = random.Random(seed)
+    deck = [r + s for s in SUITS for r in RANKS]
+    out = []
+    for _ in range(n):
+        rnd.shuffle(deck)
+        hands = [deck[i * 13:(i + 1) * 13] for i in range(4)]
+        pbn = "N:" + " ".join(
+            ".".join("".join(r for r in RANKS if r + s in h) for s in SUITS) for h in hands)
+        out.append((pbn, rnd.choice(DENOMS), rnd.choice(HANDS),
+                    rnd.randint(2, 12), rnd.randint(1, 4)))
+    return out
+
+
+def _dds_calls() -> int:
+    return sum(DDS_SECONDS.count(*lbl) for lbl in DDS_SECONDS.label_sets())
+
+
+class Recorder:
+    def __init__(self):
+        self.times: Dict[str, List[float]] = defaultdict(list)
+        self.calls: Dict[str, List[int]] = defaultdict(list)
+
+    def measure(self, name: str, fn: Callable):
+        c0 = _dds_calls()
+        t0 = time.perf_counter()
+        res = fn()
+        self.times[name].append(time.perf_counter() - t0)
+        self.calls[name].append(_dds_calls() - c0)
+        return res
+
+
+def run_deal(rec: Recorder, pbn: str, denom: str, first: str, trick: int, card: int) -> None:
+    logic = rec.measure("construct", lambda: BridgeLogic(pbn))
+    logic.set_contract(denom, first)
+
+    for op in ("legal_moves", "display", "move_options", "dd_table", "par_table"):
+        fn = getattr(logic, op)
+        rec.measure(op + ".cold", fn)
+        rec.measure(op + ".warm", fn)
+
+    rec.measure("play_optimal_to_end.cold", logic.play_optimal_to_end)
+    logic.goto_card(1, 1)
+    rec.measure("play_optimal_to_end.warm", logic.play_optimal_to_end)
+
+    # откатанные взятки остаются вариантом в дереве, но доигрыш снова идёт через DDS — перед повтором доигрываем заново
+    rec.measure("goto_card.cold", lambda: logic.goto_card(trick, card))
+    logic.play_optimal_to_end()
+    rec.measure("goto_card.warm", lambda: logic.goto_card(trick, card))
+
+    rec.measure("undo_last_card.cold", logic.undo_last_card)
+    logic.play_optimal_to_end()
+    logic.goto_card(trick, card)
+    rec.measure("undo_last_card.warm", logic.undo_last_card)
+
+
+def summarize(rec: Recorder) -> Dict[str, dict]:
+    res = {}
+    for name, ts in rec.times.items():
+        ts_ms = sorted(t * 1000 for t in ts)
+        res[name] = {
+            "n": len(ts_ms),
+            "mean_ms": statistics.mean(ts_ms),
+            "p50_ms": statistics.median(ts_ms),
+            "p90_ms": ts_ms[min(len(ts_ms) - 1, int(0.9 * len(ts_ms)))],
+            "dds_calls": statistics.mean(rec.calls[name]),
+        }
+    return res
+
+
+def compare(current: Dict[str, dict], baseline: Dict[str, dict],
+            tolerance: float = TIME_TOLERANCE) -> List[str]:
+    problems = []
+    print(f"\n{'операция':<28}{'было p50':>10}{'стало':>10}{'Δ':>8}{'DDS было':>10}{'стало':>8}")
+    for name, cur in current.items():
+        old = baseline.get(name)
+        if old is None:
+            continue
+        d = cur["p50_ms"] / old["p50_ms"] - 1 if old["p50_ms"] else 0.0
+        print(f"{name:<28}{old['p50_ms']:>10.2f}{cur['p50_ms']:>10.2f}{d:>+8.0%}"
+              f"{old['dds_calls']:>10.1f}{cur['dds_calls']:>8.1f}")
+        if d > tolerance and cur["p50_ms"] - old["p50_ms"] > MIN_REGRESSION_MS:
+            problems.append(f"{name}: медиана {old['p50_ms']:.2f} → {cur['p50_ms']:.2f} мс")
+        if cur["dds_calls"] > old["dds_calls"] + 1e-9:
+            problems.append(f"{name}: вызовов DDS {old['dds_calls']:.1f} → {cur['dds_calls']:.1f}")
+    return problems
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description="Бенчмарк BridgeLogic на seeded-корпусе сдач")
+    ap.add_argument("--deals", type=int, default=DEALS)
+    ap.add_argument("--seed", type=int, default=SEED)
+    ap.add_argument("--baseline", type=Path, default=BASELINE)
+    ap.add_argument("--save-baseline", action="store_true")
+    ap.add_argument("--json", type=Path, default=LAST_RUN)
+    ap.add_argument("--tolerance", type=float, default=TIME_TOLERANCE,
+                    help="допустимый рост медианы, доля (0.3 = +30 %%)")
+    args = ap.parse_args(argv)
+
+    rec = Recorder()
+    t0 = time.perf_counter()
+    for deal in make_corpus(args.deals, args.seed):
+        run_deal(rec, *deal)
+    ops = summarize(rec)
+
+    print(f"сдач: {args.deals}, seed {args.seed}, всего {time.perf_counter() - t0:.1f} с")
+    print(f"{'операция':<28}{'mean':>9}{'p50':>9}{'p90':>9}{'DDS':>7}")
+    for name, st in ops.items():
+        print(f"{name:<28}{st['mean_ms']:>9.2f}{st['p50_ms']:>9.2f}{st['p90_ms']:>9.2f}{st['dds_calls']:>7.1f}")
+
+    result = {"created": time.strftime("%Y-%m-%d %H:%M:%S"),
+              "deals": args.deals, "seed": args.seed, "ops": ops}
+    args.json.parent.mkdir(parents=True, exist_ok=True)
+    args.json.write_text(json.dumps(result, ensure_ascii=False, indent=1), encoding="utf-8")
+    if args.save_baseline:
+        args.baseline.parent.mkdir(parents=True, exist_ok=True)
+        args.baseline.write_text(json.dumps(result, ensure_ascii=False, indent=1), encoding="utf-8")
+        print(f"базовая линия записана в {args.baseline}")
+        return 0
+    if not args.baseline.exists():
+        print(f"базовой линии нет ({args.baseline}) — запустите с --save-baseline")
+        return 0
+    baseline = json.loads(args.baseline.read_text(encoding="utf-8"))
+    if (baseline.get("deals"), baseline.get("seed")) != (args.deals, args.seed):
+        print("базовая линия снята на другом корпусе — сравнение пропущено")
+        return 0
+    problems = compare(ops, baseline["ops"], args.tolerance)
+    for p in problems:
+        print("РЕГРЕССИЯ:", p)
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
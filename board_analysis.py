@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+# board_analysis.py — сдачи турнира: разбор PBN, DD-таблицы и пар пачкой в пуле процессов
+"""
+Комплект сдач турнира (PBN-файл через import_results.py или документ /boards
+в боте) сохраняется в таблицу boards, после чего DD-таблицы и пар считаются
+в фоне:
+
+    • сдачи режутся на пачки по DD_CHUNK, пачка — один вызов calc_all_tables
+      (CalcAllTables в DDS сам раскидывает сдачи по своим потокам);
+    • пачки идут в ProcessPoolExecutor из DD_WORKERS процессов (spawn: бот
+      многопоточный, fork из него небезопасен), libdds грузится только там;
+    • пар — DDS Par по готовой таблице, без повторного решения.
+
+Результат (BoardAnalysis) хранится рядом со сдачей; просмотр результатов
+доски сравнивает каждый стол с DD и паром без единого вызова решателя.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import multiprocessing
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import Awaitable, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from scoring import STRAINS, board_vulnerability
+
+# ──────────── настройки ────────────
+DD_WORKERS = int(os.getenv("BRIDGEIT_DD_WORKERS", "0")) or max(1, min(4, (os.cpu_count() or 2) - 1))
+DD_CHUNK = 10               # сдач на один вызов calc_all_tables
+HANDS = "NESW"
+RANKS = "AKQJT98765432"
+PBN_TAG = re.compile(r'^\[(\w+)\s+"([^"]*)"\]')
+# [Vulnerable] в PBN → (NS в зоне, EW в зоне)
+PBN_VUL = {"none": (False, False), "love": (False, False), "-": (False, False),
+           "ns": (True, False), "ew": (False, True), "all": (True, True), "both": (True, True)}
+
+BoardRow = Tuple[int, str, Optional[str], Optional[str]]     # (доска, deal, сдающий, зона)
+
+_pool: ProcessPoolExecutor | None = None
+
+
+# ──────────── PBN ────────────
+def parse_pbn(lines: Iterable[str]) -> Iterator[BoardRow]:
+    """Сдачи из PBN: (доска, deal, сдающий, зона); теги читаются построчно."""
+    cur: dict = {}
+
+    def emit():
+        if "Board" in cur or "Deal" in cur:
+            board = cur.get("Board") or "0"
+            yield (int(board) if board.isdigit() else 0,
+                   cur.get("Deal"), cur.get("Dealer"), cur.get("Vulnerable"))
+
+    for line in lines:
+        m = PBN_TAG.match(line.strip())
+        if not m:
+            continue
+        tag, value = m.groups()
+        if tag == "Board" and "Board" in cur:
+            yield from emit()
+            cur = {}
+        cur[tag] = value
+    yield from emit()
+
+
+def check_deal(deal: Optional[str]) -> str:
+    """'N:AKQ.… … … …' — 4 руки по 13 карт, все 52 разные."""
+    if not deal or ":" not in deal:
+        raise ValueError("нет [Deal]")
+    hands = deal.split(":", 1)[1].split()
+    if len(hands) != 4:
+        raise ValueError("в сдаче не 4 руки")
+    cards = set()
+    for h in hands:
+        suits = h.split(".")
+        if len(suits) != 4:
+            raise ValueError(f"рука {h}: нужно 4 масти через точку")
+        hand = {(s, r) for s, ranks in zip("SHDC", suits) for r in ranks.upper()}
+        if len(hand) != 13 or any(r not in RANKS for _, r in hand):
+            raise ValueError(f"рука {h}: не 13 карт")
+        cards |= hand
+    if len(cards) != 52:
+        raise ValueError("карты повторяются")
+    return deal
+
+
+def board_dealer(board: int, dealer: Optional[str]) -> str:
+    """Сдающий из PBN, иначе — по номеру доски (1 — N, 2 — E, …)."""
+    d = (dealer or "").strip().upper()[:1]
+    return d if d and d in HANDS else HANDS[(board - 1) % 4]
+
+
+def board_zone(board: int, vul: Optional[str]) -> Tuple[bool, bool]:
+    """Зона из PBN, иначе — по стандартной схеме 16 сдач."""
+    z = PBN_VUL.get((vul or "").strip().lower())
+    return z if z is not None else board_vulnerability(board)
+
+
+# ──────────── результат анализа ────────────
+@dataclass(frozen=True)
+class BoardAnalysis:
+    board: int
+    dd: Tuple[Tuple[int, ...], ...]     # [масть STRAINS][разыгрывающий NESW] → взятки
+    par_score: int                      # очки NS при паре
+    par_contracts: Tuple[str, ...]      # «4HN+1», «5DXE-2», …; пусто — пас
+
+    def tricks(self, strain: str, declarer: str) -> int:
+        return self.dd[STRAINS.index(strain)][HANDS.index(declarer)]
+
+    def dd_json(self) -> str:
+        return json.dumps(self.dd, separators=(",", ":"))
+
+    @classmethod
+    def from_row(cls, row: dict) -> Optional["BoardAnalysis"]:
+        """Строка boards → анализ (None, если DD ещё не посчитан)."""
+        if not row.get("dd"):
+            return None
+        dd = row["dd"] if isinstance(row["dd"], list) else json.loads(row["dd"])
+        contracts = tuple((row.get("par_contracts") or "").split())
+        return cls(row["board_number"], tuple(tuple(r) for r in dd), row["par_score"], contracts)
+
+    def par_text(self) -> str:
+        return f"{self.par_score:+d} ({', '.join(self.par_contracts) or 'пас'})"
+
+
+# ──────────── расчёт (в процессах пула) ────────────
+def _contract_text(c) -> str:
+    strain = STRAINS[(3, 2, 1, 0, 4)[int(c.denom)]]        # Denom: S H D C NT → STRAINS: C D H S NT
+    dbl = {1: "", 2: "X", 4: "XX"}.get(int(c.penalty), "")
+    over = f"{c.result:+d}" if c.result else ""
+    return f"{c.level}{strain}{dbl}{HANDS[int(c.declarer)]}{over}"
+
+
+def analyse_chunk(boards: Sequence[BoardRow]) -> List[BoardAnalysis]:
+    """Пачка сдач: один calc_all_tables на всю пачку, пар — по готовым таблицам."""
+    from endplay.dds import calc_all_tables, par
+    from endplay.types import Deal, Denom, Player, Vul
+
+    deals = [Deal(pbn) for _, pbn, _, _ in boards]
+    tables = calc_all_tables(deals)
+    vul_of = {(False, False): Vul.none, (True, False): Vul.ns,
+              (False, True): Vul.ew, (True, True): Vul.both}
+    denoms = (Denom.clubs, Denom.diamonds, Denom.hearts, Denom.spades, Denom.nt)
+    players = (Player.north, Player.east, Player.south, Player.west)
+    out = []
+    for (board, _, dealer, vul), table in zip(boards, tables):
+        dd = tuple(tuple(int(table[d, p]) for p in players) for d in denoms)
+        pl = par(table, vul_of[board_zone(board, vul)], players[HANDS.index(board_dealer(board, dealer))])
+        out.append(BoardAnalysis(board, dd, int(pl.score), tuple(_contract_text(c) for c in pl)))
+    return out
+
+
+def executor() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(DD_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return _pool
+
+
+def analyse_boards(boards: Sequence[BoardRow]) -> Iterator[Awaitable[List[BoardAnalysis]]]:
+    """Разослать сдачи по пулу (из работающего loop); → пачки результатов в порядке готовности."""
+    loop = asyncio.get_running_loop()
+    pool = executor()
+    futs = [loop.run_in_executor(pool, analyse_chunk, list(boards[i:i + DD_CHUNK]))
+            for i in range(0, len(boards), DD_CHUNK)]
+    return asyncio.as_completed(futs)
+
+
+def shutdown() -> None:
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+# ──────────── просмотр ────────────
+def versus(analysis: Optional[BoardAnalysis], row: dict) -> Tuple[str, str]:
+    """(взятки относительно DD, очки NS относительно пара) для строки results."""
+    if analysis is None or row["score_ns"] is None:
+        return "", ""
+    delta = row["score_ns"] - analysis.par_score
+    vs_par = f"{delta:+d}" if delta else "="
+    contract, declarer, tricks = row["contract"], row["declarer"], row["result_tricks"]
+    if contract == "PASS" or not declarer or tricks is None:
+        return "", vs_par
+    strain = contract[1:].rstrip("X")
+    diff = tricks - analysis.tricks(strain, declarer)
+    return (f"{diff:+d}" if diff else "="), vs_par
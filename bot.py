@@ -1,3 +1,7 @@
+import time
+_T_START = time.perf_counter()   # для замера старта: импорты + инициализация
+
+import asyncio
 import logging
 import os
 import uuid
@@ -7,20 +11,32 @@ import datetime
 import humanize
 from functools import wraps
 from telegram import (
-    Update, InlineKeyboardButton, InlineKeyboardMarkup,
+    Update, InlineKeyboardButton, InlineKeyboardMarkup, InputMediaPhoto,
 )
 from telegram.ext import (
     Application, CommandHandler, CallbackQueryHandler, MessageHandler,
     ContextTypes, filters,
 )
-from telegram import BotCommand
-from telegram.error import BadRequest
+from telegram import Bot, BotCommand
+from telegram.error import BadRequest, Forbidden
 from telegram.constants import ParseMode
 
 from telegram.request import HTTPXRequest
 
-from logic import BridgeLogic, SUIT_ICONS
-from detection import BridgeCardDetector
+from logic import BridgeLogic, SUIT_ICONS, VARIATIONS_SHOWN
+from detection import BridgeCardDetector, preload_backends
+from outbox import MESSAGE_GONE, TelegramOutbox
+from metrics import Counter, Gauge, Histogram, rss_bytes, start_metrics_server
+from profiling import new_timer
+import tracing
+from results import ResultsService, ResultRejected, parse_result_line, format_results, format_standings
+import board_analysis
+import corpus
+from board_analysis import check_deal, parse_pbn
+import leads
+from leads import format_leads
+import playtrace
+from recognition_queue import RecognitionQueue, QueueFull, PRIORITY_HIGH, PRIORITY_NORMAL
 
 
 
@@ -31,7 +47,25 @@ TOKEN = "7976805123:AAHpYOm43hazvkXUlDY-q4X9US18upq9uak"
 AUTHORIZED_ID = [375025446, 924088517, 993660527, 843051911, 711780135, 670676495]
 UNLIMITED_ID = [375025446, 855302541]
 logging.basicConfig(level=logging.INFO)
-req = HTTPXRequest(connection_pool_size=10, connect_timeout=10.0, read_timeout=60.0, write_timeout=60.0, pool_timeout=10.0)
+
+
+class TracedRequest(HTTPXRequest):
+    """HTTPXRequest, который пишет каждый запрос к Bot API спаном текущей трассы."""
+
+    async def do_request(self, url: str, method: str, request_data=None, *args, **kwargs):
+        with tracing.span("http." + url.rsplit("/", 1)[-1]):
+            return await super().do_request(url, method, request_data, *args, **kwargs)
+
+
+req = TracedRequest(connection_pool_size=10, connect_timeout=10.0, read_timeout=60.0, write_timeout=60.0, pool_timeout=10.0)
+# отдельный пул под загрузку фото, чтобы медиа не занимали соединения мелких правок
+media_req = TracedRequest(connection_pool_size=4, connect_timeout=10.0, read_timeout=60.0, write_timeout=60.0,
+                         media_write_timeout=120.0, pool_timeout=30.0)
+# TELEGRAM_API_URL / TELEGRAM_FILE_URL — другой Bot API (локальный сервер, fake_telegram.py)
+API_URL = os.getenv("TELEGRAM_API_URL", "https://api.telegram.org/bot")
+FILE_URL = os.getenv("TELEGRAM_FILE_URL", "https://api.telegram.org/file/bot")
+media_bot = Bot(TOKEN, request=media_req, base_url=API_URL, base_file_url=FILE_URL)
+outbox = TelegramOutbox()
 
 
 # === ОГРАНИЧЕНИЯ ================================================================
@@ -44,6 +78,42 @@ PBN_LIMIT_INTERVAL_MIN = 10
 CACHED_PHOTO_DATABASE_NAME = "photo_requests.json"
 CACHED_PBN_DATABASE_NAME = "pbn_requests.json"
 
+RECOGNITION_WORKERS = 2        # сколько фото распознаём одновременно
+RECOGNITION_QUEUE_SIZE = 10    # сколько фото может ждать в очереди
+METRICS_PORT = 9108            # локальный эндпоинт /metrics (0 — не поднимать)
+# BRIDGEIT_PHOTO=0 — только PBN: без кнопки фото и очереди распознавания
+PHOTO_ENABLED = os.getenv("BRIDGEIT_PHOTO", "1") == "1"
+# BRIDGEIT_PRELOAD=1 — импортировать torch/ultralytics в фоне сразу после старта,
+# иначе это происходит на первом фото (в потоке очереди)
+PRELOAD_RECOGNITION = os.getenv("BRIDGEIT_PRELOAD", "0") == "1"
+PHOTO_DISABLED_TEXT = "📷 Распознавание по фото на этом сервере отключено — введите расклад в PBN."
+QUEUE_FULL_TEXT = "🚦 Сейчас слишком много фото в очереди на распознавание. Попробуйте через пару минут."
+recognition_queue = RecognitionQueue(RECOGNITION_WORKERS, RECOGNITION_QUEUE_SIZE)
+# BRIDGEIT_DB — база результатов турниров (postgresql://… или sqlite:///results.db)
+results_service = ResultsService()
+RESULTS_UNAVAILABLE_TEXT = "🗄️ Сервис результатов сейчас недоступен."
+RESULT_USAGE_TEXT = (
+    "Формат: /result <турнир>, дальше по строке на результат:\n"
+    "доска стол NS EW контракт разыгрывающий взятки\n"
+    "Например:\n/result 1\n12 3 4 7 4S N =\n13 3 4 7 3NT S -1\n14 3 4 7 PASS"
+)
+BOARDS_USAGE_TEXT = ("Сдачи турнира: пришлите PBN-файл с подписью /boards <турнир> — "
+                     "DD и пар посчитаются в фоне.\n/boards <турнир> — сколько сдач уже посчитано.")
+
+# ─── метрики (/metrics) ───
+HANDLER_SECONDS = Histogram("bot_handler_seconds", "Время обработки апдейта хендлером", ("handler",))
+HANDLER_ERRORS = Counter("bot_handler_errors_total", "Необработанные исключения в хендлерах", ("handler",))
+QUEUE_DEPTH = Gauge("bot_queue_depth", "Длина очередей бота", ("queue",), fn=lambda: {
+    ("recognition_waiting",): recognition_queue.waiting(),
+    ("recognition_running",): recognition_queue.running,
+    ("outbox_pending",): outbox.pending(),
+})
+TELEGRAM_EVENTS = Counter("telegram_outbox_events_total",
+                          "Исходящие вызовы Telegram API: sent, errors, retry_after (429), …", ("event",),
+                          fn=lambda: {(k,): v for k, v in outbox.stats.items()})
+STARTUP_SECONDS = Gauge("bot_startup_seconds", "Время от запуска процесса до готовности бота")
+ACTIVE_SESSIONS = Gauge("bot_active_sessions", "Пользователи с раскладом, активные в пределах CONTEXT_TTL_MIN")
+
 
 # === СОСТОЯНИЯ ================================================================
 STATE_AWAIT_PBN = "await_pbn"
@@ -74,12 +144,38 @@ def _expire_if_needed(context: ContextTypes.DEFAULT_TYPE) -> None:
     last: datetime.datetime | None = context.user_data.get('last_access')
     if last and (datetime.datetime.now() - last
                  > datetime.timedelta(minutes=CONTEXT_TTL_MIN)):
+        tracing.annotate(session="expired")
         for key in ('logic', 'detector', 'state', 'active_msg_id',
                     'show_funcs', 'highlight_moves', 'contract_set',
                     'chosen_denom', 'pending_card', 'pending_hand_src'):
             context.user_data.pop(key, None)
 
 
+def _trace_attrs(update: Update) -> dict:
+    attrs = {"user": update.effective_user.id if update.effective_user else None}
+    if update.callback_query:
+        attrs["data"] = update.callback_query.data
+    elif update.message:
+        attrs["data"] = ("photo" if update.message.photo or update.message.document
+                         else "command" if (update.message.text or "").startswith("/") else "text")
+    return attrs
+
+
+def timed(handler):
+    """Латентность и необработанные ошибки хендлера — в /metrics; корневой спан трассы апдейта."""
+    name = handler.__name__
+
+    @wraps(handler)
+    async def wrapper(update: Update, context: ContextTypes.DEFAULT_TYPE):
+        with HANDLER_SECONDS.time(name), tracing.start_trace(name, **_trace_attrs(update)):
+            try:
+                return await handler(update, context)
+            except Exception:
+                HANDLER_ERRORS.inc(name)
+                raise
+    return wrapper
+
+
 def with_expire(handler):
     @wraps(handler)
     async def wrapper(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -144,7 +240,7 @@ async def _show_active_window(update: Update, context: ContextTypes.DEFAULT_TYPE
             context.user_data.get("show_funcs", False),
             context.user_data.get("highlight_moves", False),
         )
-        sent = await context.bot.send_message(
+        sent = await outbox.send_message(
             chat_id,
             _pre(logic.display()),
             parse_mode=ParseMode.MARKDOWN,
@@ -155,13 +251,13 @@ async def _show_active_window(update: Update, context: ContextTypes.DEFAULT_TYPE
 
     if logic and not contract_set:
         if state == STATE_CONTRACT_CHOOSE_FIRST:
-            sent = await context.bot.send_message(
+            sent = await outbox.send_message(
                 chat_id,
                 "Кто делает первый ход?",
                 reply_markup=contract_first_keyboard(),
             )
         else:
-            sent = await context.bot.send_message(
+            sent = await outbox.send_message(
                 chat_id,
                 "Выберите деноминацию контракта:",
                 reply_markup=contract_denom_keyboard(),
@@ -169,7 +265,7 @@ async def _show_active_window(update: Update, context: ContextTypes.DEFAULT_TYPE
         context.user_data["active_msg_id"] = sent.message_id
         return
 
-    sent = await context.bot.send_message(
+    sent = await outbox.send_message(
         chat_id,
         "Выберите действие:",
         reply_markup=main_menu_markup(),
@@ -177,6 +273,7 @@ async def _show_active_window(update: Update, context: ContextTypes.DEFAULT_TYPE
     context.user_data["active_msg_id"] = sent.message_id
 
 
+@timed
 async def unknown_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.message.reply_text(
         "⚠️ Я понимаю только команды.\n"
@@ -196,8 +293,10 @@ def require_fresh_window(handler):
         last_id = context.user_data.get("active_msg_id")
 
         if last_id is None:
+            tracing.annotate(window="expired")
             try:
-                await query.edit_message_text(
+                await outbox.edit_query(
+                    query,
                     "⚠️ Сессия истекла по тайм-ауту.\n"
                     "Нажмите /start, чтобы начать заново.",
                     reply_markup=None,
@@ -211,8 +310,10 @@ def require_fresh_window(handler):
             return
 
         if query.message.message_id != last_id:
+            tracing.annotate(window="stale")
             try:
-                await query.edit_message_text(
+                await outbox.edit_query(
+                    query,
                     "⚠️ Это неактуальное окно.\n"
                     "Используйте кнопки из самого последнего сообщения.",
                     reply_markup=None,
@@ -238,6 +339,7 @@ def generate_filename() -> str:
     return f"img/{uuid.uuid4().hex}.jpg"
 
 
+@timed
 async def ignore_edit(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # Просто ничего не делать
     return
@@ -258,10 +360,24 @@ async def safe_send(chat_func, text: str, **kwargs):
 
 # === ХЕЛПЕРЫ ДЛЯ КЛАВИАТУР ====================================================
 
+def history_keyboard() -> InlineKeyboardMarkup:
+    return InlineKeyboardMarkup([
+        [InlineKeyboardButton("📉 Разбор розыгрыша", callback_data="act_trace")],
+        [InlineKeyboardButton("⬅️ Назад", callback_data="act_back")],
+    ])
+
+
 async def _show_history_with_back(query, logic):
     txt = _pre(logic.show_history())
-    back_kb = InlineKeyboardMarkup([[InlineKeyboardButton("⬅️ Назад", callback_data="act_back")]])
-    await query.edit_message_text(text=txt, parse_mode=ParseMode.MARKDOWN, reply_markup=back_kb)
+    await outbox.edit_query(query, text=txt, parse_mode=ParseMode.MARKDOWN, reply_markup=history_keyboard())
+
+
+def variations_keyboard(total: int) -> InlineKeyboardMarkup:
+    nums = [str(i) for i in range(1, min(total, VARIATIONS_SHOWN) + 1)]
+    rows = [[InlineKeyboardButton(f"➡️ {n}", callback_data=f"act_line_{n}") for n in part]
+            for part in chunk(nums, 5)]
+    rows.append([InlineKeyboardButton("⬅️ Назад", callback_data="act_back")])
+    return InlineKeyboardMarkup(rows)
 
 
 def goto_trick_keyboard(total: int) -> InlineKeyboardMarkup:
@@ -280,6 +396,16 @@ def goto_card_keyboard(cards: list[str]) -> InlineKeyboardMarkup:
 
 
 def make_board_keyboard(logic: BridgeLogic, show_funcs: bool = False, highlight: bool = False) -> InlineKeyboardMarkup:
+    """
+    Клавиатура доски. Запоминается в logic до следующего изменения позиции:
+    повторные перерисовки («Назад», «Опции», переотправка окна) не трогают
+    ни legal_moves(), ни солвер.
+    """
+    return logic.cached(("keyboard", show_funcs, highlight),
+                        lambda: _build_board_keyboard(logic, show_funcs, highlight))
+
+
+def _build_board_keyboard(logic: BridgeLogic, show_funcs: bool, highlight: bool) -> InlineKeyboardMarkup:
     rows: list[list[InlineKeyboardButton]] = []
     rows.append([
         InlineKeyboardButton("🗑️ Отменить ход", callback_data="act_undo"),
@@ -288,10 +414,15 @@ def make_board_keyboard(logic: BridgeLogic, show_funcs: bool = False, highlight:
     if show_funcs:
         rows.append([
             InlineKeyboardButton("⏭️ Доиграть до конца", callback_data="act_playtoend"),
+            InlineKeyboardButton("🌳 Варианты",          callback_data="act_lines"),
         ])
         rows.append([
             InlineKeyboardButton("📜 История",           callback_data="act_history"),
+            InlineKeyboardButton("🎴 Первый ход",        callback_data="act_leads"),
+        ])
+        rows.append([
             InlineKeyboardButton("📊 DD-таблица",        callback_data="act_ddtable"),
+            InlineKeyboardButton("🎯 Пар",               callback_data="act_par"),
         ])
         rows.append([
             InlineKeyboardButton(
@@ -317,6 +448,21 @@ def make_board_keyboard(logic: BridgeLogic, show_funcs: bool = False, highlight:
     return InlineKeyboardMarkup(rows)
 
 
+PAR_ZONES = ("—", "NS", "EW", "Обе")
+PAR_VUL = ((False, False), (True, False), (False, True), (True, True))
+
+
+def par_keyboard(dealer: str, zone: int) -> InlineKeyboardMarkup:
+    """Сдающий и зона для экрана пара: act_par_<сдающий><зона 0-3>."""
+    def mark(label, on):
+        return f"• {label}" if on else label
+    return InlineKeyboardMarkup([
+        [InlineKeyboardButton(mark(f"Сдаёт {d}", d == dealer), callback_data=f"act_par_{d}{zone}") for d in "NESW"],
+        [InlineKeyboardButton(mark(z, i == zone), callback_data=f"act_par_{dealer}{i}") for i, z in enumerate(PAR_ZONES)],
+        [InlineKeyboardButton("⬅️ Назад", callback_data="act_back")],
+    ])
+
+
 def card_keyboard(cards: list[str]) -> InlineKeyboardMarkup:
     """Строит клавиатуру из списка карт с символами мастей."""
     rows = []
@@ -397,11 +543,12 @@ def contract_first_keyboard() -> InlineKeyboardMarkup:
 
 
 def main_menu_markup() -> InlineKeyboardMarkup:
-    return InlineKeyboardMarkup([
+    rows = [
         [InlineKeyboardButton("📷 Распознать расклад по фото", callback_data="input_photo")],
         [InlineKeyboardButton("📄 Распознать расклад по PBN",  callback_data="input_pbn")],
         [InlineKeyboardButton("📘 Документация",       callback_data="menu_docs")],
-    ])
+    ]
+    return InlineKeyboardMarkup(rows if PHOTO_ENABLED else rows[1:])
 
 
 def analyze_result_markup() -> InlineKeyboardMarkup:
@@ -419,6 +566,13 @@ def analyze_result_markup() -> InlineKeyboardMarkup:
         ],
     ])
 
+
+def analyze_refining_markup() -> InlineKeyboardMarkup:
+    """Кнопки предварительного результата: править пока нечего, ждём уточнения."""
+    return InlineKeyboardMarkup([
+        [InlineKeyboardButton("⏳ Уточняю распознавание…", callback_data="refine_wait")],
+    ])
+
 # === СОЗДАТЬ / ОБНОВИТЬ BridgeLogic ДЛЯ ПОЛЬЗОВАТЕЛЯ ===========================
 
 def set_logic_from_pbn(context: ContextTypes.DEFAULT_TYPE, pbn: str) -> BridgeLogic:
@@ -427,6 +581,7 @@ def set_logic_from_pbn(context: ContextTypes.DEFAULT_TYPE, pbn: str) -> BridgeLo
     гарантированно обнуляет «визуальные» флаги (подсветка, функции и т. д.).
     """
     logic = BridgeLogic(pbn)
+    corpus.record(logic.initial_pbn)        # BRIDGEIT_CORPUS — копить сдачи для поиска
 
     context.user_data["logic"] = logic
 
@@ -450,6 +605,7 @@ def get_help_text() -> str:
     1. 📷 По фото — выберите «Анализ по фото» и отправьте снимок расклада  
     • На фото действует лимит запросов и «кулдаун»  
     • Номиналы и масти карт должны быть хорошо видны 
+    • Размытые, тёмные и слишком мелкие фото отклоняются сразу и не расходуют лимит
     • Если в трёх руках по 13 карт, а в четвёртой меньше, недостающие карты автоматически добавятся именно в эту руку
     2. 📄 По PBN — выберите «Анализ по PBN» и отправьте одну PBN-строку
     • Формат PBN: <сторона света (буква)>: <рука1> <рука2> <рука3> <рука4>  
@@ -485,20 +641,25 @@ def get_help_text() -> str:
         
     2. Клавиатура функций
     2.1 ⏭️ Доиграть до конца — оптимально по DD разыграть все оставшиеся карты и открыть историю
-    2.2 📜 История — показать все взятки; *ваши* ходы помечены **^^^** (если они не оптимальны) или **^•^** (если совпадают с оптимальными по количеству взяток); ходы, сделанные автоматически, не маркируются; формат карт *N♥A* — туз ♥ с руки N
-    2.3 📊 DD-таблица — таблица Double-Dummy для всех деноминаций
-    2.4 🔦 Подсветить ходы / 🚫 Скрыть — показывать число взяток для линии текущего игрока (NS или EW) для каждой доступной карты
-    2.5 ⤴️ К карте — отмотать анализ до выбранной (из истории) карты
+    2.2 📜 История — показать все взятки; *ваши* ходы помечены **^^^** (если они не оптимальны) или **^•^** (если совпадают с оптимальными по количеству взяток); ходы, сделанные автоматически, не маркируются; формат карт *N♥A* — туз ♥ с руки N. Кнопка 📉 Разбор розыгрыша — график взяток разыгрывающего по DD после каждой карты и список карт, отдавших взятки (кто и сколько)
+    2.3 🎴 Первый ход — для всех 20 контрактов (разыгрывающий × масть): сколько взяток берёт защита и какие первые ходы это дают
+    2.4 📊 DD-таблица — таблица Double-Dummy для всех деноминаций
+    2.5 🎯 Пар — пар-контракты и пар-счёт при выбранных сдающем и зоне, старший выполняемый уровень для каждой руки и масти, жертвы против лучшего контракта
+    2.6 🔦 Подсветить ходы / 🚫 Скрыть — показывать число взяток для линии текущего игрока (NS или EW) для каждой доступной карты
+    2.7 ⤴️ К карте — отмотать анализ до выбранной (из истории) карты; отмотанные ходы, как и отменённые, не теряются — остаются вариантом
+    2.8 🌳 Варианты — все опробованные линии розыгрыша: где каждая отходит от текущей, DD обеих карт в развилке и счёт взяток; ➡️ N — перейти в конец варианта
 
 *Подсказка*
     1. Чтобы начать новый расклад или вернуться в главное меню, нажмите /start"""
 
 
+@timed
 async def cmd_help(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.message.reply_text(get_help_text(), parse_mode=ParseMode.MARKDOWN)
     await _show_active_window(update, context)
 
 
+@timed
 @with_expire
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     for key in (
@@ -532,6 +693,7 @@ async def _send_limit(update: Update, text: str, context: ContextTypes.DEFAULT_T
 
 
 # ─── cmd_pbn ────────────────────────────────────────────────────────
+@timed
 @with_expire
 async def cmd_pbn(update: Update, context: ContextTypes.DEFAULT_TYPE):
     chat_id = str(update.effective_chat.id)
@@ -608,8 +770,220 @@ async def russian_precisedelta(delta: datetime.timedelta):
         humanized = humanized[:-1] + "у"
     return humanized
 
+# === РЕЗУЛЬТАТЫ ТУРНИРОВ ======================================================
+
+async def _results_user(update: Update) -> int | None:
+    """id пользователя в таблице users (None — база недоступна, ответ уже отправлен)."""
+    if results_service.backend is None:
+        await update.message.reply_text(RESULTS_UNAVAILABLE_TEXT)
+        return None
+    u = update.effective_user
+    return await results_service.ensure_user(u.id, u.first_name, u.last_name)
+
+
+@timed
+async def cmd_tournament(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    name = " ".join(context.args).strip()
+    if not name:
+        await update.message.reply_text("Формат: /tournament <название турнира>")
+        return
+    uid = await _results_user(update)
+    if uid is None:
+        return
+    t = await results_service.create_tournament(name, uid)
+    await update.message.reply_text(
+        f"🏆 Турнир «{t['name']}» создан, номер {t['id']}. Вы — директор.\n\n{RESULT_USAGE_TEXT}")
+
+
+@timed
+async def cmd_result(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    lines = update.message.text.split("\n")
+    head = lines[0].split()[1:]
+    if not head or not head[0].isdigit():
+        await update.message.reply_text(RESULT_USAGE_TEXT)
+        return
+    tid = int(head[0])
+    rows = ([" ".join(head[1:])] if len(head) > 1 else []) + [ln for ln in lines[1:] if ln.strip()]
+    if not rows:
+        await update.message.reply_text(RESULT_USAGE_TEXT)
+        return
+    uid = await _results_user(update)
+    if uid is None:
+        return
+
+    report, entries = {}, []
+    for i, row in enumerate(rows, 1):
+        try:
+            entries.append((i, parse_result_line(tid, row)))
+        except ValueError as e:
+            report[i] = f"{i}. ❌ {row} — {e}"
+    # каждую строку — в общий ResultBatcher: строки одного сообщения и соседних
+    # пользователей уходят в базу одной транзакцией, ошибки — построчно
+    saved = await asyncio.gather(*(results_service.submit(e, uid) for _, e in entries),
+                                 return_exceptions=True)
+    for (i, e), res in zip(entries, saved):
+        if isinstance(res, ResultRejected):
+            report[i] = f"{i}. ❌ {rows[i - 1]} — {res}"
+        elif isinstance(res, Exception):
+            logging.warning("Результат %s не записан: %s", e, res)
+            report[i] = f"{i}. ❌ {rows[i - 1]} — ошибка записи"
+        else:
+            report[i] = f"{i}. ✅ доска {e.board}, стол {e.table}: {e.contract} {e.declarer or ''}".rstrip()
+    await update.message.reply_text("\n".join(report[i] for i in sorted(report)))
+
+
+@timed
+async def cmd_results(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    args = context.args
+    if not args or not all(a.isdigit() for a in args[:2]):
+        await update.message.reply_text("Формат: /results <турнир> [доска]")
+        return
+    if results_service.backend is None:
+        await update.message.reply_text(RESULTS_UNAVAILABLE_TEXT)
+        return
+    tid = int(args[0])
+    t = await results_service.tournament(tid)
+    if t is None:
+        await update.message.reply_text(f"Турнира {tid} нет.")
+        return
+    board = int(args[1]) if len(args) > 1 else None
+    rows = await results_service.results(tid, board)
+    if not rows:
+        await update.message.reply_text(f"🏆 {t['name']}: результатов пока нет.")
+        return
+    # по одной доске — с процентами, кросс-IMP и сравнением с DD/паром (посчитаны при загрузке сдач)
+    scores = analysis = None
+    if board is not None:
+        scores = await results_service.scores(tid)
+        analysis = await results_service.board_analysis(tid, board)
+    head = f"🏆 {t['name']}" + (f"\nДоска {board}, пар {analysis.par_text()}" if analysis else "")
+    await update.message.reply_text(f"{head}\n{_pre(format_results(rows, scores, analysis))}",
+                                    parse_mode=ParseMode.MARKDOWN)
+
+
+@timed
+async def cmd_boards(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/boards <турнир> — статус анализа; PBN-документ с такой подписью — загрузка сдач (директор)."""
+    msg = update.message
+    args = (msg.caption or "").split()[1:] if msg.document else context.args
+    if not args or not args[0].isdigit():
+        await msg.reply_text(BOARDS_USAGE_TEXT)
+        return
+    uid = await _results_user(update)
+    if uid is None:
+        return
+    tid = int(args[0])
+    t = await results_service.tournament(tid)
+    if t is None:
+        await msg.reply_text(f"Турнира {tid} нет.")
+        return
+    if not msg.document:
+        total, analysed = await results_service.boards_status(tid)
+        await msg.reply_text(f"🃏 {t['name']}: сдач {total}, DD и пар посчитаны для {analysed}."
+                             if total else BOARDS_USAGE_TEXT)
+        return
+    if not results_service.is_director(t, uid):
+        await msg.reply_text("Сдачи турнира загружает директор.")
+        return
+    data = await (await msg.document.get_file()).download_as_bytearray()
+    good, errors = [], []
+    for board, deal, dealer, vul in parse_pbn(bytes(data).decode("utf-8-sig", "replace").splitlines()):
+        try:
+            if board <= 0:
+                raise ValueError("нет номера [Board]")
+            good.append((board, check_deal(deal), dealer, vul))
+        except ValueError as e:
+            errors.append(f"доска {board or '?'}: {e}")
+    if not good:
+        await msg.reply_text("В файле нет годных сдач.\n" + "\n".join(errors[:10]))
+        return
+    task = await results_service.save_boards(tid, good)
+    text = f"🃏 Принято сдач: {len(good)}. DD и пар считаются в фоне."
+    if errors:
+        text += f"\nС ошибками ({len(errors)}):\n" + "\n".join(errors[:10])
+    await msg.reply_text(text)
+    context.application.create_task(_report_analysis(msg.chat_id, tid, task), update=update)
+
+
+async def _report_analysis(chat_id: int, tid: int, task: asyncio.Task) -> None:
+    try:
+        done = await task
+    except asyncio.CancelledError:
+        return
+    except Exception:
+        logging.exception("DD сдач турнира %s не посчитан", tid)
+        await outbox.send_message(chat_id, "⚠️ Не удалось посчитать DD для сдач.")
+        return
+    await outbox.send_message(chat_id, f"✅ DD и пар посчитаны ({done} сдач). "
+                                       f"/results {tid} <доска> — результаты против DD и пара.")
+
+def _standings_text(t: dict, rows) -> str:
+    return f"🏆 {t['name']} — таблица\n{_pre(format_standings(rows))}"
+
+
+@timed
+async def cmd_standings(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/standings <турнир> [sub|stop] — таблица из кэша; sub — обновлять её в этом чате."""
+    args = context.args
+    if not args or not args[0].isdigit():
+        await update.message.reply_text("Формат: /standings <турнир> [sub|stop]")
+        return
+    if results_service.backend is None:
+        await update.message.reply_text(RESULTS_UNAVAILABLE_TEXT)
+        return
+    tid, mode = int(args[0]), (args[1].lower() if len(args) > 1 else "")
+    t = await results_service.tournament(tid)
+    if t is None:
+        await update.message.reply_text(f"Турнира {tid} нет.")
+        return
+    chat_id = update.effective_chat.id
+    if mode == "stop":
+        gone = await results_service.unsubscribe(tid, chat_id)
+        await update.message.reply_text("🔕 Обновления таблицы отключены." if gone else "Подписки не было.")
+        return
+    rows = await results_service.standings(tid)
+    if not rows:
+        text = f"🏆 {t['name']}: результатов пока нет."
+    else:
+        text = _standings_text(t, rows)
+    sent = await outbox.send_message(chat_id, text, parse_mode=ParseMode.MARKDOWN)
+    if mode == "sub":
+        # это сообщение и будем править при каждом изменении результатов
+        await results_service.subscribe(tid, chat_id, sent.message_id)
+        await update.message.reply_text("🔔 Таблица выше будет обновляться сама. Отключить: "
+                                        f"/standings {tid} stop")
+
+
+async def _push_standings(tid: int, pairs) -> None:
+    """Событие сервиса результатов: правим закреплённые таблицы подписчиков (правки склеивает outbox)."""
+    subs = await results_service.subscribers(tid)
+    if not subs:
+        return
+    t = await results_service.tournament(tid)
+    text = _standings_text(t, await results_service.standings(tid))
+    # чаты независимы: заблокировавший бота или долгий 429 в одном не задерживает остальные
+    await asyncio.gather(*(_push_standings_chat(tid, chat_id, message_id, text)
+                           for chat_id, message_id in list(subs.items())))
+
+
+async def _push_standings_chat(tid: int, chat_id: int, message_id: int | None, text: str) -> None:
+    try:
+        if message_id is not None:
+            res = await outbox.edit_text(chat_id, message_id, text, parse_mode=ParseMode.MARKDOWN, wait=True)
+            if res is not MESSAGE_GONE:
+                return
+            # таблицу удалили — присылаем новую и дальше правим её
+        sent = await outbox.send_message(chat_id, text, parse_mode=ParseMode.MARKDOWN)
+        await results_service.subscribe(tid, chat_id, sent.message_id)
+    except Forbidden:
+        logging.info("Чат %s недоступен — подписка на турнир %s снята", chat_id, tid)
+        await results_service.unsubscribe(tid, chat_id)
+    except Exception:
+        logging.exception("Таблица турнира %s не обновлена в чате %s", tid, chat_id)
+
 # === CALLBACK‑КНОПКИ ===========================================================
 
+@timed
 @with_expire
 @require_fresh_window
 @ignore_telegram_edit_errors
@@ -628,7 +1002,8 @@ async def goto_flow_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
             return
         context.user_data.update(state="goto_trick_select", unknown_shift=unknown)
         txt = _pre("\n".join(logic.history_plain_lines()) + "\n\nВыберите номер взятки:")
-        await query.edit_message_text(
+        await outbox.edit_query(
+            query,
             txt,
             parse_mode=ParseMode.MARKDOWN,
             reply_markup=goto_trick_keyboard(len(tricks)),
@@ -644,7 +1019,8 @@ async def goto_flow_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
         context.user_data.update(state="goto_card_select", pending_trick_no=tno)
         single_line = logic.history_plain_lines()[tno - 1]
         txt = _pre(f"{single_line}\n\nВзятка {tno}. Выберите карту:")
-        await query.edit_message_text(
+        await outbox.edit_query(
+            query,
             txt,
             parse_mode=ParseMode.MARKDOWN,
             reply_markup=goto_card_keyboard(cards),
@@ -667,7 +1043,8 @@ async def goto_flow_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
             False,
             context.user_data.get("highlight_moves", False),
         )
-        await query.edit_message_text(
+        await outbox.edit_query(
+            query,
             _pre(logic.display()),
             parse_mode=ParseMode.MARKDOWN,
             reply_markup=kb,
@@ -682,7 +1059,8 @@ async def goto_flow_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
             context.user_data.pop("pending_trick_no", None)
             tricks, _ = logic.history_matrix()
             txt = _pre("\n".join(logic.history_plain_lines()) + "\n\nВыберите номер взятки:")
-            await query.edit_message_text(
+            await outbox.edit_query(
+                query,
                 txt,
                 parse_mode=ParseMode.MARKDOWN,
                 reply_markup=goto_trick_keyboard(len(tricks)),
@@ -696,7 +1074,8 @@ async def goto_flow_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
             context.user_data.get("show_funcs", False),
             context.user_data.get("highlight_moves", False),
         )
-        await query.edit_message_text(
+        await outbox.edit_query(
+            query,
             _pre(logic.display()),
             parse_mode=ParseMode.MARKDOWN,
             reply_markup=kb,
@@ -704,6 +1083,7 @@ async def goto_flow_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await query.answer("Отменено")
 
 
+@timed
 @with_expire
 @require_fresh_window
 @ignore_telegram_edit_errors
@@ -714,21 +1094,12 @@ async def menu_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     chat_id = str(update.effective_chat.id)
 
     if data == "input_photo":
+        if not PHOTO_ENABLED:
+            await query.answer(PHOTO_DISABLED_TEXT, show_alert=True)
+            return
         if uid not in UNLIMITED_ID:
-            if os.path.exists(CACHED_PHOTO_DATABASE_NAME):
-                with open(CACHED_PHOTO_DATABASE_NAME, "r") as jf:
-                    database = json.load(jf)
-            else:
-                database = {}
-            interval = datetime.timedelta(minutes=PHOTO_LIMIT_INTERVAL_MIN)
-            now      = datetime.datetime.now()
-            recent   = [
-                datetime.datetime.fromisoformat(t)
-                for t in database.get(chat_id, [])
-                if now - datetime.datetime.fromisoformat(t) < interval
-            ]
-            if len(recent) >= PHOTO_LIMIT_COUNT:
-                wait = interval - (now - min(recent))
+            wait = _photo_limit_wait(chat_id)
+            if wait is not None:
                 await _send_limit_and_menu(
                     query.message,
                     f"🚫 Превышен лимит. Следующее распознавание через {await russian_precisedelta(wait)}.",
@@ -737,14 +1108,16 @@ async def menu_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 await query.answer()
                 return
         context.user_data["state"] = STATE_AWAIT_PHOTO
-        await query.edit_message_text(
+        await outbox.edit_query(
+            query,
             "📷 Пришлите фото расклада для распознавания:",
             reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("⬅️ Назад", callback_data="back_main")]]),
         )
         return
 
     if data == "menu_docs":
-        await query.edit_message_text(
+        await outbox.edit_query(
+            query,
             get_help_text(),
             parse_mode=ParseMode.MARKDOWN,
             reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("⬅️ Назад", callback_data="back_main")]]),
@@ -753,7 +1126,8 @@ async def menu_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     if data == "input_pbn":
         context.user_data["state"] = STATE_AWAIT_PBN
-        await query.edit_message_text(
+        await outbox.edit_query(
+            query,
             "📄 Пришлите PBN-строку расклада:",
             reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("⬅️ Назад", callback_data="back_main")]]),
         )
@@ -761,12 +1135,14 @@ async def menu_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     if data == "back_main":
         context.user_data.pop("state", None)
-        await query.edit_message_text(
+        await outbox.edit_query(
+            query,
             "Выберите действие:",
             reply_markup=main_menu_markup(),
         )
 
 
+@timed
 @with_expire
 @require_fresh_window
 @ignore_telegram_edit_errors
@@ -787,7 +1163,8 @@ async def analyze_result_handler(update: Update, context: ContextTypes.DEFAULT_T
     if data == "rotate_ccw":
         detector.uclockwise()
         result = detector.preview()
-        await query.edit_message_text(
+        await outbox.edit_query(
+            query,
             _pre(result),
             reply_markup=analyze_result_markup(),
             parse_mode=ParseMode.MARKDOWN
@@ -796,7 +1173,8 @@ async def analyze_result_handler(update: Update, context: ContextTypes.DEFAULT_T
     elif data == "rotate_cw":
         detector.clockwise()
         result = detector.preview()
-        await query.edit_message_text(
+        await outbox.edit_query(
+            query,
             _pre(result),
             reply_markup=analyze_result_markup(),
             parse_mode=ParseMode.MARKDOWN
@@ -829,7 +1207,8 @@ async def analyze_result_handler(update: Update, context: ContextTypes.DEFAULT_T
             context.user_data["state"] = STATE_CONTRACT_CHOOSE_DENOM
             context.user_data["chosen_denom"] = None
 
-            await query.edit_message_text(
+            await outbox.edit_query(
+                query,
                 "Выберите деноминацию контракта:",
                 reply_markup=contract_denom_keyboard(),
                 parse_mode=ParseMode.MARKDOWN  # если нужно
@@ -841,6 +1220,17 @@ async def analyze_result_handler(update: Update, context: ContextTypes.DEFAULT_T
             await query.message.reply_text(f"Ошибка: {e}")
 
 
+@timed
+@with_expire
+@require_fresh_window
+async def refine_wait_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await update.callback_query.answer(
+        "Это предварительный результат.\nКнопки появятся, когда распознавание уточнится.",
+        show_alert=True,
+    )
+
+
+@timed
 @with_expire
 @require_fresh_window
 @ignore_telegram_edit_errors
@@ -858,7 +1248,8 @@ async def add_move_flow_handler(update: Update, context: ContextTypes.DEFAULT_TY
         for k in ("state", "pending_card", "pending_hand_src"):
             context.user_data.pop(k, None)
 
-        await query.edit_message_text(
+        await outbox.edit_query(
+            query,
             _pre(detector.preview()),
             parse_mode=ParseMode.MARKDOWN,
             reply_markup=analyze_result_markup(),
@@ -873,7 +1264,8 @@ async def add_move_flow_handler(update: Update, context: ContextTypes.DEFAULT_TY
             await query.answer("Нет потерянных карт")
             return
         context.user_data["state"] = STATE_ADD_CARD_SELECT_CARD
-        await query.edit_message_text(
+        await outbox.edit_query(
+            query,
             "Выберите карту, которую нужно добавить:",
             reply_markup=card_keyboard(lost),
         )
@@ -882,7 +1274,8 @@ async def add_move_flow_handler(update: Update, context: ContextTypes.DEFAULT_TY
     # ---------- старт: «переместить карту» ----------
     if data == "move_card_start":
         context.user_data["state"] = STATE_MOVE_CARD_SELECT_HAND
-        await query.edit_message_text(
+        await outbox.edit_query(
+            query,
             "Из какой руки переместить карту?",
             reply_markup=hand_keyboard(detector),
         )
@@ -896,7 +1289,8 @@ async def add_move_flow_handler(update: Update, context: ContextTypes.DEFAULT_TY
         card = data.replace("sel_card_", "")
         context.user_data["pending_card"] = card
         context.user_data["state"] = STATE_ADD_CARD_SELECT_HAND
-        await query.edit_message_text(
+        await outbox.edit_query(
+            query,
             f"Куда положить {_pretty(card)}?",
             reply_markup=hand_keyboard(detector),
         )
@@ -909,7 +1303,8 @@ async def add_move_flow_handler(update: Update, context: ContextTypes.DEFAULT_TY
         context.user_data.pop("state", None)
         try:
             detector.add(f"{card} {hand}")
-            await query.edit_message_text(
+            await outbox.edit_query(
+                query,
                 _pre(detector.preview()),
                 parse_mode=ParseMode.MARKDOWN,
                 reply_markup=analyze_result_markup(),
@@ -927,7 +1322,8 @@ async def add_move_flow_handler(update: Update, context: ContextTypes.DEFAULT_TY
             return
         context.user_data["pending_hand_src"] = hand_src
         context.user_data["state"] = STATE_MOVE_CARD_SELECT_CARD
-        await query.edit_message_text(
+        await outbox.edit_query(
+            query,
             f"Выберите карту из руки {hand_src}:",
             reply_markup=card_keyboard(cards_in_hand),
         )
@@ -940,7 +1336,8 @@ async def add_move_flow_handler(update: Update, context: ContextTypes.DEFAULT_TY
         context.user_data["pending_card"] = card
         context.user_data["state"] = STATE_MOVE_CARD_SELECT_DEST
 
-        await query.edit_message_text(
+        await outbox.edit_query(
+            query,
             f"В какую руку переместить {_pretty(card)}?",
             reply_markup=hand_keyboard(
                 detector,
@@ -958,7 +1355,8 @@ async def add_move_flow_handler(update: Update, context: ContextTypes.DEFAULT_TY
         context.user_data.pop("state", None)
         try:
             detector.move(f"{card} {hand_dst}")
-            await query.edit_message_text(
+            await outbox.edit_query(
+                query,
                 _pre(detector.preview()),
                 parse_mode=ParseMode.MARKDOWN,
                 reply_markup=analyze_result_markup(),
@@ -968,6 +1366,7 @@ async def add_move_flow_handler(update: Update, context: ContextTypes.DEFAULT_TY
         return
 
 
+@timed
 @with_expire
 @require_fresh_window
 @ignore_telegram_edit_errors
@@ -991,9 +1390,10 @@ async def play_card_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     context.user_data["show_funcs"] = False
     board_view = _pre(logic.display())
     kb = make_board_keyboard(logic, False, context.user_data.get("highlight_moves", False))
-    await query.edit_message_text(board_view, parse_mode=ParseMode.MARKDOWN, reply_markup=kb)
+    await outbox.edit_query(query, board_view, parse_mode=ParseMode.MARKDOWN, reply_markup=kb)
 
 
+@timed
 @with_expire
 @require_fresh_window
 @ignore_telegram_edit_errors
@@ -1010,7 +1410,7 @@ async def analysis_action_handler(update: Update, context: ContextTypes.DEFAULT_
         context.user_data["show_funcs"] = False
         kb = make_board_keyboard(logic, False, not flag)
         board_view = _pre(logic.display())
-        await query.edit_message_text(board_view, parse_mode=ParseMode.MARKDOWN, reply_markup=kb)
+        await outbox.edit_query(query, board_view, parse_mode=ParseMode.MARKDOWN, reply_markup=kb)
         await query.answer("Подсветка ходов включена" if not flag else "Подсветка выключена")
         return
     need_redraw = True
@@ -1031,32 +1431,92 @@ async def analysis_action_handler(update: Update, context: ContextTypes.DEFAULT_
     elif data == "act_toggle":
         context.user_data["show_funcs"] = not context.user_data.get("show_funcs", False)
         kb = make_board_keyboard(logic, context.user_data["show_funcs"], context.user_data.get("highlight_moves", False))
-        await query.edit_message_reply_markup(reply_markup=kb)
+        await outbox.edit_query_markup(query, reply_markup=kb)
         return
     elif data == "act_history":
-        txt = _pre(logic.show_history())
-        back_kb = InlineKeyboardMarkup([[InlineKeyboardButton("⬅️ Назад", callback_data="act_back")]])
-        await query.edit_message_text(text=txt, parse_mode=ParseMode.MARKDOWN, reply_markup=back_kb)
+        await _show_history_with_back(query, logic)
+        return
+    elif data == "act_trace":
+        # DD после каждой сыгранной карты одной пачкой в пуле процессов; отрезки линии кэшируются
+        try:
+            strain, unknown, cards = logic.play_line()
+        except ValueError as e:
+            await query.answer(str(e), show_alert=True)
+            return
+        if not cards:
+            await query.answer("Ещё не сыграно ни одной карты.", show_alert=True)
+            return
+        await query.answer("Разбираю розыгрыш…")
+        try:
+            trace = await playtrace.trace_line(logic.initial_pbn, strain, unknown, cards)
+            chart = await asyncio.to_thread(playtrace.render_chart, trace)
+        except Exception:
+            logging.exception("Не удалось разобрать розыгрыш")
+            await outbox.send_message(query.message.chat_id, "⚠️ Не удалось разобрать розыгрыш.")
+            return
+        await outbox.send_photo(query.message.chat_id, chart)
+        await outbox.send_message(query.message.chat_id, _pre(playtrace.format_trace(trace)),
+                                  parse_mode=ParseMode.MARKDOWN)
         return
     elif data == "act_back":
         board_view = _pre(logic.display())
         kb = make_board_keyboard(logic, context.user_data.get("show_funcs", False), context.user_data.get("highlight_moves", False))
-        await query.edit_message_text(text=board_view, parse_mode=ParseMode.MARKDOWN, reply_markup=kb)
+        await outbox.edit_query(query, text=board_view, parse_mode=ParseMode.MARKDOWN, reply_markup=kb)
+        return
+    elif data == "act_lines":
+        txt = _pre(logic.show_variations())
+        await outbox.edit_query(query, text=txt, parse_mode=ParseMode.MARKDOWN,
+                                reply_markup=variations_keyboard(len(logic.variations())))
+        return
+    elif data.startswith("act_line_"):
+        # переход в конец варианта: ходы снимаются/делаются по дереву, DD — из кэша узлов
+        try:
+            txt = logic.switch_variation(int(data.rsplit("_", 1)[1]))
+        except ValueError as e:
+            await query.answer(str(e), show_alert=True)
+            return
+        await query.answer(txt)
+        board_view = _pre(logic.display())
+        kb = make_board_keyboard(logic, context.user_data.get("show_funcs", False), context.user_data.get("highlight_moves", False))
+        await outbox.edit_query(query, text=board_view, parse_mode=ParseMode.MARKDOWN, reply_markup=kb)
         return
     elif data == "act_ddtable":
         txt = _pre(logic.dd_table())
         back_kb = InlineKeyboardMarkup([[InlineKeyboardButton("⬅️ Назад", callback_data="act_back")]])
-        await query.edit_message_text(text=txt, parse_mode=ParseMode.MARKDOWN, reply_markup=back_kb)
+        await outbox.edit_query(query, text=txt, parse_mode=ParseMode.MARKDOWN, reply_markup=back_kb)
+        return
+    elif data == "act_leads":
+        # 20 контрактов пачкой в пуле процессов; та же сдача второй раз — из кэша
+        await query.answer("Считаю первый ход для всех контрактов…")
+        try:
+            report = await leads.opening_leads(logic.initial_pbn)
+        except Exception:
+            logging.exception("Не удалось посчитать первый ход")
+            await outbox.send_message(query.message.chat_id, "⚠️ Не удалось посчитать первый ход.")
+            return
+        back_kb = InlineKeyboardMarkup([[InlineKeyboardButton("⬅️ Назад", callback_data="act_back")]])
+        await outbox.edit_query(query, text=_pre(format_leads(report)), parse_mode=ParseMode.MARKDOWN,
+                                reply_markup=back_kb)
+        return
+    elif data.startswith("act_par"):
+        # act_par — последние выбранные сдающий/зона; act_par_S2 — сдаёт S, зона EW
+        if data != "act_par":
+            context.user_data["par_view"] = (data[8], int(data[9]))
+        dealer, zone = context.user_data.get("par_view", ("N", 0))
+        txt = _pre(logic.par_table(dealer, PAR_VUL[zone]))
+        await outbox.edit_query(query, text=txt, parse_mode=ParseMode.MARKDOWN,
+                                reply_markup=par_keyboard(dealer, zone))
         return
     if need_redraw:
         main_msg_id = context.user_data.get("active_msg_id")
         if main_msg_id:
             board_view = _pre(logic.display())
             kb = make_board_keyboard(logic, context.user_data.get("show_funcs", False), context.user_data.get("highlight_moves", False))
-            await context.bot.edit_message_text(chat_id=query.message.chat_id, message_id=main_msg_id, text=board_view, parse_mode=ParseMode.MARKDOWN, reply_markup=kb)
+            await outbox.edit_text(query.message.chat_id, main_msg_id, board_view, parse_mode=ParseMode.MARKDOWN, reply_markup=kb)
 
 # === Flow выбора контракта ================================================
 
+@timed
 @with_expire
 @require_fresh_window
 @ignore_telegram_edit_errors
@@ -1071,7 +1531,7 @@ async def contract_flow_handler(update: Update, context: ContextTypes.DEFAULT_TY
         token = data.split("_", 1)[1]
         context.user_data["chosen_denom"] = token
         context.user_data["state"] = STATE_CONTRACT_CHOOSE_FIRST
-        await query.edit_message_text("Выберите кто делает *первый ход*:", parse_mode=ParseMode.MARKDOWN, reply_markup=contract_first_keyboard())
+        await outbox.edit_query(query, "Выберите кто делает *первый ход*:", parse_mode=ParseMode.MARKDOWN, reply_markup=contract_first_keyboard())
         return
     if data.startswith("first_"):
         first = data.split("_", 1)[1]
@@ -1082,9 +1542,9 @@ async def contract_flow_handler(update: Update, context: ContextTypes.DEFAULT_TY
             logic.set_contract(contract_str, first)
             context.user_data["contract_set"] = True
         except Exception as e:
-            await query.edit_message_text(f"Ошибка: {e}")
+            await outbox.edit_query(query, f"Ошибка: {e}")
             return
-        await query.edit_message_text("⏳ Приступаю к анализу...")
+        await outbox.edit_query(query, "⏳ Приступаю к анализу...")
         context.user_data["show_funcs"] = False
         board_view = _pre(logic.display())
         kb = make_board_keyboard(
@@ -1098,6 +1558,7 @@ async def contract_flow_handler(update: Update, context: ContextTypes.DEFAULT_TY
 
 # === ТЕКСТОВЫЙ ВВОД ============================================================
 
+@timed
 async def handle_pbn_input(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if context.user_data.get("state") != STATE_AWAIT_PBN:
         await unknown_message(update, context)
@@ -1122,7 +1583,144 @@ async def handle_pbn_input(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 # === ОБРАБОТКА ФОТО ============================================================
 
+def _photo_limit_wait(chat_id: str) -> datetime.timedelta | None:
+    """Сколько ждать до следующего распознавания (None — лимит не исчерпан)."""
+    if os.path.exists(CACHED_PHOTO_DATABASE_NAME):
+        with open(CACHED_PHOTO_DATABASE_NAME, "r") as jf:
+            database = json.load(jf)
+    else:
+        database = {}
+    interval = datetime.timedelta(minutes=PHOTO_LIMIT_INTERVAL_MIN)
+    now = datetime.datetime.now()
+    recent = [datetime.datetime.fromisoformat(t) for t in database.get(chat_id, []) if now - datetime.datetime.fromisoformat(t) < interval]
+    if len(recent) >= PHOTO_LIMIT_COUNT:
+        return interval - (now - min(recent))
+    return None
+
+
+def _photo_limit_record(chat_id: str) -> None:
+    """Засчитываем распознавание в лимит чата."""
+    if os.path.exists(CACHED_PHOTO_DATABASE_NAME):
+        with open(CACHED_PHOTO_DATABASE_NAME, "r") as jf:
+            database = json.load(jf)
+    else:
+        database = {}
+    interval = datetime.timedelta(minutes=PHOTO_LIMIT_INTERVAL_MIN)
+    now = datetime.datetime.now()
+    recent = [t for t in database.get(chat_id, []) if now - datetime.datetime.fromisoformat(t) < interval]
+    recent.append(now.isoformat())
+    database[chat_id] = recent
+    with open(CACHED_PHOTO_DATABASE_NAME, "w") as jf:
+        json.dump(database, jf)
+
+
+def _remove_files(files: set[str]) -> None:
+    for fn in files:
+        try:
+            os.remove(fn)
+        except FileNotFoundError:
+            pass
+
+
+def _recognize(path: str, out_preview: str, out: str, on_preview) -> BridgeCardDetector:
+    """
+    Тяжёлая часть — выполняется в потоке очереди распознавания.
+    Сначала быстрый проход: его текст и сам детектор сразу уходят в on_preview
+    (разметка — в out_preview), затем уточнение тем же детектором.
+    """
+    detector = BridgeCardDetector(path, staged=True, timer=new_timer())
+    detector.visualize(out_preview)
+    on_preview((detector.preview(), detector))
+    detector.refine()
+    detector.visualize(out)
+    return detector
+
+
+def _queue_progress(status):
+    """Колбэк очереди: правит сообщение «⏳ Фото принято» позицией и ETA."""
+    async def update(position: int, eta: float):
+        if position == 0:
+            text = "⏳ Фото принято. Распознаю карты..."
+        else:
+            wait = await russian_precisedelta(datetime.timedelta(seconds=max(1, round(eta))))
+            text = f"⏳ Фото принято. Место в очереди: {position}, ожидание ≈ {wait}."
+        await outbox.edit_text(status.chat_id, status.message_id, text)
+    return update
+
+
+async def _finish_recognition(msg, context: ContextTypes.DEFAULT_TYPE, fut, preview_fut,
+                              out_preview: str, out: str, files: set[str]):
+    """
+    Доставка результата в два этапа: предпросмотр (фото + расклад с кнопкой
+    ожидания), затем правка тех же сообщений итоговой разметкой и раскладом.
+    Если после предпросмотра что-то упало, окно не остаётся с кнопкой
+    ожидания: в нём предварительный расклад с обычными кнопками правки.
+    """
+    chat_id = msg.chat_id
+    sent = None
+    try:
+        await asyncio.wait({fut, preview_fut}, return_when=asyncio.FIRST_COMPLETED)
+        if not preview_fut.done():
+            # быстрый проход упал — ошибку отдаст основной future
+            await fut
+        preview_text, preview_detector = preview_fut.result()
+        with open(out_preview, "rb") as img:
+            photo_msg = await outbox.send_photo(chat_id, img)
+        sent = await outbox.send_message(chat_id, _pre(preview_text),
+                                         parse_mode=ParseMode.MARKDOWN,
+                                         reply_markup=analyze_refining_markup())
+        context.user_data["active_msg_id"] = sent.message_id
+
+        detector: BridgeCardDetector = await fut
+        with detector.timer.stage("upload"), open(out, "rb") as img:
+            await outbox.edit_media(chat_id, photo_msg.message_id, InputMediaPhoto(img))
+        detector.timer.finish()
+        if context.user_data.get("active_msg_id") != sent.message_id:
+            return  # пользователь уже ушёл в другое окно
+        context.user_data["detector"] = detector
+        await outbox.edit_text(chat_id, sent.message_id, _pre(detector.preview()),
+                               parse_mode=ParseMode.MARKDOWN,
+                               reply_markup=analyze_result_markup())
+    except Exception as e:
+        if sent is None:
+            await msg.reply_text(f"Ошибка распознавания: {e}")
+        else:
+            await _fallback_to_preview(msg, context, sent, fut, preview_detector, e)
+    finally:
+        _remove_files(files)
+
+
+async def _fallback_to_preview(msg, context: ContextTypes.DEFAULT_TYPE, sent, fut,
+                               preview_detector: BridgeCardDetector, error: Exception):
+    """
+    Уточнение или доставка итога упали после предпросмотра: окно переводим
+    на лучший готовый результат (итоговый, если refine успел, иначе
+    предварительный) с кнопками правки, чтобы сессия не застряла.
+    """
+    await msg.reply_text(f"Ошибка уточнения распознавания: {error}\n"
+                         "Оставлен предварительный результат — его можно поправить вручную.")
+    if context.user_data.get("active_msg_id") != sent.message_id:
+        return  # пользователь уже ушёл в другое окно
+    ok = fut.done() and not fut.cancelled() and fut.exception() is None
+    detector = fut.result() if ok else preview_detector
+    context.user_data["detector"] = detector
+    try:
+        await outbox.edit_text(sent.chat_id, sent.message_id, _pre(detector.preview()),
+                               parse_mode=ParseMode.MARKDOWN,
+                               reply_markup=analyze_result_markup())
+    except Exception:
+        logging.exception("fallback to preview failed")
+        context.user_data.pop("active_msg_id", None)
+        menu = await msg.reply_text("Выберите действие:", reply_markup=main_menu_markup())
+        context.user_data["active_msg_id"] = menu.message_id
+
+
+@timed
 async def handle_photo_input(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if not PHOTO_ENABLED:
+        await update.message.reply_text(PHOTO_DISABLED_TEXT)
+        await _show_active_window(update, context)
+        return
     if context.user_data.get("state") != STATE_AWAIT_PHOTO:
         await update.message.reply_text("⚠️ Для отправки фотографий выберите соответствующую функцию в меню.")
         await _show_active_window(update, context)
@@ -1137,63 +1735,115 @@ async def handle_photo_input(update: Update, context: ContextTypes.DEFAULT_TYPE)
         return
     chat_id = str(msg.chat_id)
     uid = update.effective_user.id
+    priority = PRIORITY_HIGH if uid in UNLIMITED_ID else PRIORITY_NORMAL
     if uid not in UNLIMITED_ID:
-        if os.path.exists(CACHED_PHOTO_DATABASE_NAME):
-            with open(CACHED_PHOTO_DATABASE_NAME, "r") as jf:
-                database = json.load(jf)
-        else:
-            database = {}
-        interval = datetime.timedelta(minutes=PHOTO_LIMIT_INTERVAL_MIN)
-        now = datetime.datetime.now()
-        recent = [datetime.datetime.fromisoformat(t) for t in database.get(chat_id, []) if now - datetime.datetime.fromisoformat(t) < interval]
-        if len(recent) >= PHOTO_LIMIT_COUNT:
-            wait = interval - (now - min(recent))
+        wait = _photo_limit_wait(chat_id)
+        if wait is not None:
             await _send_limit_and_menu(
                 msg,
                 f"🚫 Превышен лимит. Следующее распознавание через {await russian_precisedelta(wait)}.",
                 context,
             )
             return
-        recent.append(now)
-        database[chat_id] = [t.isoformat() for t in recent]
-        with open(CACHED_PHOTO_DATABASE_NAME, "w") as jf:
-            json.dump(database, jf)
+    if recognition_queue.is_full(priority):
+        await _send_limit_and_menu(msg, QUEUE_FULL_TEXT, context)
+        return
     inp = generate_filename()
+    out_preview = generate_filename()
     out = generate_filename()
     path = await file.download_to_drive(inp)
-    await msg.reply_text("⏳ Фото принято. Распознаю карты...")
+    files = {inp, out_preview, out, str(path)}
+
+    # дешёвая проверка качества — до очереди и без списания лимита;
+    # quality тянет cv2 — импорт только здесь, при BRIDGEIT_PHOTO=0 не грузится
+    from quality import check_photo_file
     try:
-        detector = BridgeCardDetector(path)
-        detector.visualize(out)
-        preview = detector.preview()
-        with open(out, "rb") as img:
-            await msg.reply_photo(photo=img)
-        sent = await msg.reply_text(_pre(preview), parse_mode=ParseMode.MARKDOWN, reply_markup=analyze_result_markup())
-        context.user_data["active_msg_id"] = sent.message_id
-        context.user_data["detector"] = detector
-    except Exception as e:
-        await msg.reply_text(f"Ошибка распознавания: {e}")
-    finally:
-        for fn in {inp, out, path}:
-            try:
-                os.remove(fn)
-            except FileNotFoundError:
-                pass
-        context.user_data.pop("state", None)
+        report = await asyncio.to_thread(check_photo_file, str(path))
+    except FileNotFoundError:
+        report = None
+    if report is None or not report.ok:
+        _remove_files(files)
+        reasons = report.message() if report else "• не удалось открыть изображение"
+        await msg.reply_text(
+            f"📷 Фото не подходит для распознавания:\n{reasons}\n\n"
+            "Лимит не израсходован — пришлите другое фото."
+        )
+        return
+
+    status = await msg.reply_text("⏳ Фото принято. Распознаю карты...")
+
+    loop = asyncio.get_running_loop()
+    preview_fut = loop.create_future()
+
+    def on_preview(preview):
+        loop.call_soon_threadsafe(lambda: preview_fut.done() or preview_fut.set_result(preview))
+
+    try:
+        fut = await recognition_queue.submit(_recognize, str(path), out_preview, out, on_preview,
+                                             priority=priority,
+                                             on_update=_queue_progress(status))
+    except QueueFull:
+        _remove_files(files)
+        await outbox.edit_text(status.chat_id, status.message_id, QUEUE_FULL_TEXT)
+        menu = await msg.reply_text("Выберите действие:", reply_markup=main_menu_markup())
+        context.user_data["active_msg_id"] = menu.message_id
+        return
+    # лимит засчитываем только за принятую в очередь задачу
+    if uid not in UNLIMITED_ID:
+        _photo_limit_record(chat_id)
+    context.user_data.pop("state", None)
+    context.application.create_task(_finish_recognition(msg, context, fut, preview_fut, out_preview, out, files), update=update)
 
 # === ГЛАВНАЯ ФУНКЦИЯ ===========================================================
 
-def post_init(application: Application):
-    return application.bot.set_my_commands([
+def _active_sessions(application: Application) -> int:
+    border = datetime.datetime.now() - datetime.timedelta(minutes=CONTEXT_TTL_MIN)
+    return sum(1 for ud in list(application.user_data.values())
+               if ("logic" in ud or "detector" in ud)
+               and ud.get("last_access", datetime.datetime.min) > border)
+
+
+async def post_init(application: Application):
+    ACTIVE_SESSIONS.set_function(lambda: _active_sessions(application))
+    await media_bot.initialize()
+    outbox.bind(application.bot, media_bot)
+    if PHOTO_ENABLED:
+        await recognition_queue.start()
+        if PRELOAD_RECOGNITION:
+            application.create_task(asyncio.to_thread(preload_backends))
+    try:
+        await results_service.start()
+        results_service.events.subscribe(_push_standings)
+    except Exception as e:     # без базы бот работает, команды результатов отвечают «недоступно»
+        logging.warning("База результатов недоступна (%s): %s", results_service.url, e)
+        results_service.backend = None
+    await application.bot.set_my_commands([
         BotCommand("start", "Запустить бота"),
         BotCommand("pbn", "PBN-строка текущего расклада"),
         BotCommand("help", "Показать документацию"),
         # BotCommand("id", "Узнать свой Telegram-ID"),
     ])
-
-
-def main():
-    app = Application.builder().token(TOKEN).request(req).post_init(post_init).build()
+    startup = time.perf_counter() - _T_START
+    STARTUP_SECONDS.set(startup)
+    logging.info("Готов за %.2f с, RSS %.0f МБ, режим: %s", startup, rss_bytes() / 2 ** 20,
+                 "фото + PBN" if PHOTO_ENABLED else "только PBN")
+
+
+async def post_shutdown(application: Application):
+    await recognition_queue.stop()
+    if results_service.backend is not None:
+        await results_service.close()
+    board_analysis.shutdown()           # пул DDS-процессов (сдачи турниров, первый ход)
+    await media_bot.shutdown()
+
+
+def build_application() -> Application:
+    """Application со всеми хендлерами (без запуска — см. main() и loadtest.py)."""
+    app = (
+        Application.builder().token(TOKEN).request(req)
+        .base_url(API_URL).base_file_url(FILE_URL)
+        .post_init(post_init).post_shutdown(post_shutdown).build()
+    )
 
     app.add_handler(MessageHandler(filters.UpdateType.EDITED_MESSAGE, ignore_edit))
 
@@ -1201,6 +1851,13 @@ def main():
     app.add_handler(CommandHandler("start", start))
     app.add_handler(CommandHandler("pbn", cmd_pbn))
     app.add_handler(CommandHandler("help", cmd_help))
+    app.add_handler(CommandHandler("tournament", cmd_tournament))
+    app.add_handler(CommandHandler("result", cmd_result))
+    app.add_handler(CommandHandler("results", cmd_results))
+    app.add_handler(CommandHandler("standings", cmd_standings))
+    app.add_handler(CommandHandler("boards", cmd_boards))
+    app.add_handler(MessageHandler(filters.Document.FileExtension("pbn") & filters.CaptionRegex(r"^/boards\b"),
+                                   cmd_boards))
     # app.add_handler(CommandHandler("id", show_id))
 
     # Кнопки меню и навигации
@@ -1209,6 +1866,7 @@ def main():
 
     # Кнопки анализа расклада (после распознавания)
     app.add_handler(CallbackQueryHandler(analyze_result_handler, pattern="^(rotate_cw|rotate_ccw|accept_result)$"))
+    app.add_handler(CallbackQueryHandler(refine_wait_handler, pattern="^refine_wait$"))
 
     app.add_handler(CallbackQueryHandler(contract_flow_handler, pattern="^(denom_[CDHS]|denom_NT|first_[NESW])$"))
 
@@ -1224,7 +1882,7 @@ def main():
     app.add_handler(CallbackQueryHandler(play_card_handler, pattern="^play_"))
     app.add_handler(CallbackQueryHandler(
         analysis_action_handler,
-        pattern="^act_(optimal|undo|toggle|history|ddtable|playtoend|back|highlight)$"
+        pattern=r"^act_(optimal|undo|toggle|history|leads|trace|lines|line_\d+|ddtable|par|par_[NESW][0-3]|playtoend|back|highlight)$"
     ))
     app.add_handler(CallbackQueryHandler(
         goto_flow_handler,
@@ -1232,9 +1890,21 @@ def main():
 
     # === Последний — ловит вообще всё ===
     app.add_handler(MessageHandler(filters.ALL, unknown_message))
+    return app
+
+
+def main():
+    app = build_application()
+
+    if METRICS_PORT:
+        start_metrics_server(METRICS_PORT)
+    tracing.setup()
 
     logging.info("Бот запущен")
-    app.run_polling()
+    try:
+        app.run_polling()
+    finally:
+        tracing.shutdown()
 
 
 if __name__ == "__main__":
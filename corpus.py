@@ -0,0 +1,456 @@
+#!/usr/bin/env python3
+# corpus.py — корпус сдач: маски рук, HCP, расклады и DD в колонках на диске (memmap)
+"""
+Разобранные сдачи копятся в каталоге корпуса (бот — при BRIDGEIT_CORPUS, каждая
+полная сдача из set_logic_from_pbn; import — из PBN-файлов). Хранение
+колоночное, только дозапись:
+
+    hands.bin   uint64 [рука NESW]               52-битная маска: масть S H D C по 13 бит, младший — двойка
+    hcp.bin     uint8  [рука]
+    shape.bin   uint8  [рука][масть SHDC]
+    dd.bin      int8   [масть STRAINS][рука]     взятки по DD; -1 — ещё не посчитано
+
+Файлы открываются через np.memmap — загрузка мгновенная, страницы читает ОС.
+Запросы — векторные фильтры NumPy по колонкам, миллионы сдач за миллисекунды:
+
+    python corpus.py query data/corpus "N:hcp=10-12 N:S=5+ N:H=5+ makes=4S:N"
+    python corpus.py add data/corpus boards.pbn --dd
+    python corpus.py dd data/corpus                      # досчитать DD в пуле процессов
+
+Язык условий — слова через пробел, все должны выполняться:
+    N:hcp=10-12   N:S=5+   N:H=0-1   N:shape=5-5-x-x   N:shape=4432   N:has=SA   makes=4S:N   makes=3NT:EW
+(диапазон: 5 — ровно, 5+ — не меньше, 5- — не больше, 10-12; shape с дефисами —
+по мастям ♠♥♦♣, x — любая длина; без дефисов — расклад в любом порядке мастей).
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import atexit
+import fcntl
+import itertools
+import json
+import logging
+import os
+import queue
+import re
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Iterable, Mapping, Optional, Sequence, Tuple
+
+import numpy as np
+
+from board_analysis import check_deal, parse_pbn
+from scoring import STRAINS
+
+# ──────────── настройки ────────────
+CORPUS_DIR = os.getenv("BRIDGEIT_CORPUS", "")       # бот: пусто — сдачи не копятся
+FORMAT_VERSION = 1
+HANDS = "NESW"
+SUITS = "SHDC"
+RANKS = "AKQJT98765432"
+SHOW_DEALS = 10
+
+# колонка → (тип, форма строки)
+COLUMNS: Dict[str, Tuple[np.dtype, Tuple[int, ...]]] = {
+    "hands": (np.dtype("<u8"), (4,)),
+    "hcp": (np.dtype("u1"), (4,)),
+    "shape": (np.dtype("u1"), (4, 4)),
+    "dd": (np.dtype("i1"), (len(STRAINS), 4)),
+}
+
+SUIT_BITS = np.uint64(0x1FFF)
+# маска всех тузов, королей, … по четырём мастям → вес в HCP
+HONOURS = tuple((w, np.uint64(sum(1 << (s * 13 + 12 - r) for s in range(4))))
+                for r, w in enumerate((4, 3, 2, 1)))
+
+# нечётные множители ключа сдачи (совпадение ключей у разных сдач — порядка n²/2⁶⁴)
+KEY_MUL = (np.uint64(0x9E3779B97F4A7C15), np.uint64(0xC2B2AE3D27D4EB4F), np.uint64(0x165667B19E3779F9))
+
+Columns = Mapping[str, np.ndarray]
+
+log = logging.getLogger(__name__)
+
+
+# ──────────── маски ────────────
+def card_bit(suit: str, rank: str) -> int:
+    return SUITS.index(suit) * 13 + 12 - RANKS.index(rank)
+
+
+def deal_masks(pbn: str) -> Tuple[int, int, int, int]:
+    """'N:AKQ.… … … …' → маски рук N E S W."""
+    first, hands = pbn.split(":", 1)
+    start = HANDS.index(first.strip().upper())
+    out = [0, 0, 0, 0]
+    for i, hand in enumerate(hands.split()):
+        m = 0
+        for suit, ranks in zip(SUITS, hand.split(".")):
+            for r in ranks.upper():
+                m |= 1 << card_bit(suit, r)
+        out[(start + i) % 4] = m
+    return out[0], out[1], out[2], out[3]
+
+
+def masks_pbn(masks: Sequence[int]) -> str:
+    """Маски рук N E S W → 'N:AKQ.… … … …'."""
+    hands = []
+    for m in masks:
+        m = int(m)
+        hands.append(".".join("".join(r for r in RANKS if m >> card_bit(s, r) & 1) for s in SUITS))
+    return "N:" + " ".join(hands)
+
+
+def deal_keys(masks: np.ndarray) -> np.ndarray:
+    """Маски (k, 4) → 64-битный ключ сдачи (W однозначно задан тремя другими руками)."""
+    m = np.asarray(masks, np.uint64)
+    return m[:, 0] * KEY_MUL[0] ^ m[:, 1] * KEY_MUL[1] ^ m[:, 2] * KEY_MUL[2]
+
+
+def lengths(masks: np.ndarray) -> np.ndarray:
+    """Маски (…) → длины мастей (…, 4) в порядке S H D C."""
+    return np.stack([np.bitwise_count((masks >> np.uint64(13 * s)) & SUIT_BITS) for s in range(4)],
+                    axis=-1).astype(np.uint8)
+
+
+def hcp(masks: np.ndarray) -> np.ndarray:
+    """Маски (…) → HCP (…)."""
+    out = np.zeros(masks.shape, np.uint8)
+    for w, bits in HONOURS:
+        out += np.uint8(w) * np.bitwise_count(masks & bits).astype(np.uint8)
+    return out
+
+
+def features(masks: np.ndarray, dd: Optional[np.ndarray] = None) -> Dict[str, np.ndarray]:
+    """Маски (k, 4) → все колонки корпуса для k сдач (dd по умолчанию «не посчитано»)."""
+    masks = np.ascontiguousarray(masks, dtype=np.uint64)
+    if dd is None:
+        dd = np.full((len(masks),) + COLUMNS["dd"][1], -1, np.int8)
+    return {"hands": masks, "hcp": hcp(masks), "shape": lengths(masks), "dd": np.asarray(dd, np.int8)}
+
+
+# ──────────── условия ────────────
+def _range(text: str, top: int) -> Tuple[int, int]:
+    m = re.fullmatch(r"(\d+)(\+|-|-(\d+))?", text)
+    if not m:
+        raise ValueError(f"диапазон {text!r}: нужно 5, 5+, 5- или 10-12")
+    lo = int(m.group(1))
+    if m.group(3):
+        return lo, int(m.group(3))
+    return {None: (lo, lo), "+": (lo, top), "-": (0, lo)}[m.group(2)]
+
+
+def where_mask(cols: Columns, where: str) -> np.ndarray:
+    """Строка условий (см. заголовок модуля) → булев массив по сдачам колонок."""
+    n = len(cols["hands"])
+    mask = np.ones(n, bool)
+    for word in where.split():
+        key, _, value = word.partition("=")
+        if not value:
+            raise ValueError(f"{word!r}: нужно имя=значение")
+        key = key.upper()
+        if key == "MAKES":
+            mask &= _makes(cols, value.upper())
+            continue
+        hand, _, what = key.partition(":")
+        if len(hand) != 1 or hand not in HANDS or not what:
+            raise ValueError(f"{word!r}: нужно N:hcp=…, N:S=…, N:shape=…, N:has=… или makes=…")
+        h = HANDS.index(hand)
+        if what == "HCP":
+            lo, hi = _range(value, 37)
+            col = cols["hcp"][:, h]
+            mask &= (col >= lo) & (col <= hi)
+        elif what in SUITS:
+            lo, hi = _range(value, 13)
+            col = cols["shape"][:, h, SUITS.index(what)]
+            mask &= (col >= lo) & (col <= hi)
+        elif what == "SHAPE":
+            mask &= _shape(cols["shape"][:, h], value.upper())
+        elif what == "HAS":
+            card = value.upper().replace("10", "T")
+            if len(card) != 2 or card[0] not in SUITS or card[1] not in RANKS:
+                raise ValueError(f"{word!r}: карта вида SA, HT, C2")
+            bit = np.uint64(1 << card_bit(card[0], card[1]))
+            mask &= (cols["hands"][:, h] & bit) != 0
+        else:
+            raise ValueError(f"{word!r}: неизвестное условие {what}")
+    return mask
+
+
+def _shape(shape: np.ndarray, pattern: str) -> np.ndarray:
+    """
+    Расклад руки (n, 4) против шаблона: подходящие длины ♠♥♦ собираются в
+    таблицу на 14³ кодов (560 раскладов), сдачи проверяются одним взятием по коду.
+    """
+    if "-" in pattern:
+        parts = pattern.split("-")
+        if len(parts) != 4 or any(p != "X" and not p.isdigit() for p in parts):
+            raise ValueError(f"shape={pattern}: четыре длины ♠-♥-♦-♣, x — любая")
+        fits = lambda ls: all(p == "X" or int(p) == n for p, n in zip(parts, ls))
+    else:
+        if len(pattern) != 4 or not pattern.isdigit() or sum(map(int, pattern)) != 13:
+            raise ValueError(f"shape={pattern}: расклад из четырёх цифр с суммой 13, например 4432")
+        want = sorted(map(int, pattern))
+        fits = lambda ls: sorted(ls) == want
+    table = np.zeros(14 ** 3, bool)
+    for ls in itertools.product(range(14), repeat=3):
+        if sum(ls) <= 13 and fits(ls + (13 - sum(ls),)):
+            table[ls[0] + 14 * ls[1] + 196 * ls[2]] = True
+    s = shape[:, :3].astype(np.uint16)
+    return table[s[:, 0] + np.uint16(14) * s[:, 1] + np.uint16(196) * s[:, 2]]
+
+
+def _makes(cols: Columns, value: str) -> np.ndarray:
+    contract, _, by = value.partition(":")
+    m = re.fullmatch(r"([1-7])(NT|[SHDC])", contract)
+    if not m or not by or any(c not in HANDS for c in by):
+        raise ValueError(f"makes={value}: контракт и разыгрывающие, например 4S:N или 3NT:EW")
+    need = int(m.group(1)) + 6
+    col = cols["dd"][:, STRAINS.index(m.group(2))]
+    return np.logical_or.reduce([col[:, HANDS.index(c)] >= need for c in by])
+
+
+# ──────────── корпус ────────────
+class Corpus:
+    """Каталог с колонками; строки только дописываются (dd можно досчитать на месте)."""
+
+    def __init__(self, path: os.PathLike | str):
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        meta = self.path / "corpus.json"
+        if not meta.exists():
+            meta.write_text(json.dumps({"version": FORMAT_VERSION, "columns": {
+                name: [dt.str, list(shape)] for name, (dt, shape) in COLUMNS.items()}}))
+        elif json.loads(meta.read_text()).get("version") != FORMAT_VERSION:
+            raise ValueError(f"{meta}: другая версия формата корпуса")
+        self._keys: Optional[np.ndarray] = None        # отсортированные deal_keys — для unique
+        self.cols: Dict[str, np.ndarray] = {}
+        self.refresh()
+
+    def _file(self, name: str) -> Path:
+        return self.path / f"{name}.bin"
+
+    @staticmethod
+    def _row_bytes(name: str) -> int:
+        dt, shape = COLUMNS[name]
+        return dt.itemsize * int(np.prod(shape))
+
+    def _rows_on_disk(self) -> int:
+        """Полных строк во всех колонках (оборванная дозапись не считается)."""
+        sizes = [self._file(n).stat().st_size // self._row_bytes(n) if self._file(n).exists() else 0
+                 for n in COLUMNS]
+        return min(sizes)
+
+    def refresh(self) -> None:
+        """Заново отобразить файлы — увидеть строки, дописанные после открытия."""
+        n = self._rows_on_disk()
+        for name, (dt, shape) in COLUMNS.items():
+            if n:
+                self.cols[name] = np.memmap(self._file(name), dt, mode="r", shape=(n,) + shape)
+            else:
+                self.cols[name] = np.zeros((0,) + shape, dt)
+
+    def __len__(self) -> int:
+        return len(self.cols["hands"])
+
+    def append(self, masks: np.ndarray, dd: Optional[np.ndarray] = None, *, unique: bool = True) -> int:
+        """
+        Дописывает сдачи (маски (k, 4), dd (k, 5, 4) или None); → сколько
+        записано. unique — пропускать сдачи, уже лежащие в корпусе.
+        """
+        new = features(masks, dd)
+        if unique:
+            _, first = np.unique(deal_keys(new["hands"]), return_index=True)
+            first.sort()
+            new = {k: v[first] for k, v in new.items()}
+        if not len(new["hands"]):
+            return 0
+        with open(self.path / "corpus.json", "rb") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)                 # пишет один процесс за раз
+            if unique:
+                # сверяем под блокировкой: строки других процессов — тоже
+                self.refresh()
+                seen = self._sorted_keys()
+                if len(seen) < len(self):
+                    k = deal_keys(self.cols["hands"][len(seen):])
+                    seen = self._keys = np.sort(np.concatenate([seen, k]))
+                keys = deal_keys(new["hands"])
+                if len(seen):
+                    pos = np.minimum(np.searchsorted(seen, keys), len(seen) - 1)
+                    new = {k: v[seen[pos] != keys] for k, v in new.items()}
+                if not len(new["hands"]):
+                    return 0
+            n = self._rows_on_disk()
+            for name in COLUMNS:
+                with open(self._file(name), "ab") as f:
+                    f.truncate(n * self._row_bytes(name))    # хвост оборванной дозаписи
+                    f.write(np.ascontiguousarray(new[name], COLUMNS[name][0]).tobytes())
+            if self._keys is not None:
+                if len(self._keys) < n:                      # unique=False: чужие строки не сверялись
+                    self._keys = None
+                else:
+                    k = deal_keys(new["hands"])
+                    self._keys = (np.insert(self._keys, np.searchsorted(self._keys, k), k)
+                                  if len(self._keys) else np.sort(k))
+        self.refresh()
+        return len(new["hands"])
+
+    def add_pbns(self, pbns: Iterable[str], dd: Optional[Iterable] = None) -> int:
+        masks = np.array([deal_masks(p) for p in pbns], np.uint64).reshape(-1, 4)
+        return self.append(masks, None if dd is None else np.array(list(dd), np.int8))
+
+    def _sorted_keys(self) -> np.ndarray:
+        if self._keys is None:
+            self._keys = np.sort(deal_keys(self.cols["hands"]))
+        return self._keys
+
+    def pbn(self, i: int) -> str:
+        return masks_pbn(self.cols["hands"][i])
+
+    def query(self, where: str) -> np.ndarray:
+        """Индексы сдач, подходящих под условия."""
+        return np.flatnonzero(where_mask(self.cols, where))
+
+    def missing_dd(self) -> np.ndarray:
+        return np.flatnonzero(self.cols["dd"][:, 0, 0] < 0)
+
+    async def fill_dd(self, limit: Optional[int] = None) -> int:
+        """DD для строк без него — пачками в пуле board_analysis; пишется на место."""
+        import board_analysis
+
+        todo = self.missing_dd()[:limit]
+        if not len(todo):
+            return 0
+        dd = np.memmap(self._file("dd"), COLUMNS["dd"][0], mode="r+", shape=(len(self),) + COLUMNS["dd"][1])
+        boards = [(int(i), self.pbn(i), None, None) for i in todo]
+        for chunk in board_analysis.analyse_boards(boards):
+            for a in await chunk:
+                dd[a.board] = a.dd
+            dd.flush()
+        del dd
+        self.refresh()
+        return len(todo)
+
+
+# ──────────── запись из бота ────────────
+# Запись (flock, сортировка ключей, np.insert) — в отдельном потоке: record()
+# только ставит сдачу в очередь и не держит event loop бота, даже пока
+# `corpus.py add` держит блокировку. Всё накопившееся пишется одним add_pbns.
+_default: Optional[Corpus] = None
+_queue: "queue.SimpleQueue[Optional[str]]" = queue.SimpleQueue()
+_writer: Optional[threading.Thread] = None
+_writer_lock = threading.Lock()
+
+
+def record(pbn: str) -> None:
+    """Полная сдача из бота → корпус BRIDGEIT_CORPUS (без него — ничего)."""
+    global _writer
+    if not CORPUS_DIR:
+        return
+    try:
+        check_deal(pbn)
+    except ValueError:
+        return                  # неполная сдача (разбор с середины) — не для корпуса
+    with _writer_lock:
+        if _writer is None:
+            _writer = threading.Thread(target=_write_loop, name="corpus", daemon=True)
+            _writer.start()
+            atexit.register(_stop_writer)
+    _queue.put(pbn)
+
+
+def _write_loop() -> None:
+    global _default
+    while True:
+        batch = [_queue.get()]
+        while True:
+            try:
+                batch.append(_queue.get_nowait())
+            except queue.Empty:
+                break
+        pbns = [p for p in batch if p is not None]
+        if pbns:
+            try:
+                if _default is None:
+                    _default = Corpus(CORPUS_DIR)
+                _default.add_pbns(pbns)
+            except Exception:
+                log.exception("Не удалось записать %d сдач в корпус", len(pbns))
+        if None in batch:
+            return
+
+
+def _stop_writer(timeout: float = 5.0) -> None:
+    """При выходе — дописать очередь (недописанный хвост всё равно чинит append)."""
+    _queue.put(None)
+    if _writer is not None:
+        _writer.join(timeout)
+
+
+# ──────────── CLI ────────────
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description="Корпус сдач: запись, DD и векторный поиск")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    p = sub.add_parser("add", help="сдачи из PBN-файлов")
+    p.add_argument("corpus", type=Path)
+    p.add_argument("files", nargs="+", type=Path)
+    p.add_argument("--dd", action="store_true", help="сразу посчитать DD")
+    p = sub.add_parser("dd", help="досчитать DD")
+    p.add_argument("corpus", type=Path)
+    p.add_argument("--limit", type=int)
+    p = sub.add_parser("query", help="поиск по условиям")
+    p.add_argument("corpus", type=Path)
+    p.add_argument("where", help='например "N:hcp=10-12 N:S=5+ N:H=5+ makes=4S:N"')
+    p.add_argument("--show", type=int, default=SHOW_DEALS, help="сколько сдач вывести")
+    p = sub.add_parser("stats", help="размер корпуса")
+    p.add_argument("corpus", type=Path)
+    args = ap.parse_args(argv)
+
+    try:
+        return _run(args)
+    except ValueError as e:
+        print(f"Ошибка: {e}", file=sys.stderr)
+        return 2
+
+
+def _run(args) -> int:
+    corpus = Corpus(args.corpus)
+    if args.cmd == "add":
+        added = 0
+        for path in args.files:
+            with open(path, encoding="utf-8", errors="replace") as f:
+                deals = [deal for _, deal, _, _ in parse_pbn(f) if deal]
+            good = []
+            for deal in deals:
+                try:
+                    good.append(check_deal(deal))
+                except ValueError as e:
+                    print(f"{path}: пропущена сдача ({e})", file=sys.stderr)
+            added += corpus.add_pbns(good)
+        print(f"Добавлено сдач: {added}, всего {len(corpus)}")
+        if args.dd:
+            args.cmd, args.limit = "dd", None
+    if args.cmd == "dd":
+        t0 = time.perf_counter()
+        n = asyncio.run(corpus.fill_dd(args.limit))
+        dt = time.perf_counter() - t0
+        print(f"DD посчитан для {n} сдач за {dt:.1f} с" + (f" ({n / dt:.1f} сдач/с)" if n else ""))
+    elif args.cmd == "query":
+        t0 = time.perf_counter()
+        idx = corpus.query(args.where)
+        dt = time.perf_counter() - t0
+        print(f"Найдено {len(idx)} из {len(corpus)} за {dt * 1000:.1f} мс")
+        if "makes=" in args.where.lower() and len(corpus.missing_dd()):
+            print(f"(без DD: {len(corpus.missing_dd())} сдач — для makes они не подходят; python corpus.py dd …)")
+        for i in idx[:args.show]:
+            print(f"{i:>9}  {corpus.pbn(i)}")
+    elif args.cmd == "stats":
+        size = sum(corpus._file(n).stat().st_size for n in COLUMNS if corpus._file(n).exists())
+        print(f"Сдач: {len(corpus)}, без DD: {len(corpus.missing_dd())}, на диске {size / 2**20:.1f} МБ")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
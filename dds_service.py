@@ -0,0 +1,360 @@
+#!/usr/bin/env python3
+# dds_service.py — DDS отдельным процессом: Unix-сокет, двоичный протокол, общий кэш
+"""
+Решатель вне процесса бота: бот (и несколько его копий) отдают позиции
+локальному сервису и не делят процессор с event loop и распознаванием.
+
+    python dds_service.py --socket /run/bridgeit/dds.sock [--metrics-port 9101]
+    BRIDGEIT_DDS_SOCKET=/run/bridgeit/dds.sock python bot.py
+
+    • решают процессы пула board_analysis (spawn, BRIDGEIT_DD_WORKERS);
+    • ответы — в общем LRU по байтам запроса (позиция кодируется однозначно),
+      одинаковые запросы в полёте склеиваются: решает первый, остальные ждут
+      его результат (single-flight);
+    • соединение конвейерное: запросы с номерами, ответы — по готовности.
+
+Протокол — кадры FRAME (длина тела, номер запроса, операция/статус) + тело:
+    OP_SOLVE  позиция → n, затем n пар (карта, взятки)        — solve_board
+    OP_TABLE  позиция → 20 байт [масть C D H S NT][рука NESW]  — calc_dd_table
+    OP_STATS  —       → JSON со счётчиками сервиса
+Позиция — POSITION (маски оставшихся карт N E S W, козырь, первый ход,
+число карт текущей взятки) и сами эти карты; карта — байт масть*16 + ранг.
+
+DdsClient — синхронный клиент (сокет на поток); remote_solve / remote_table —
+то, чем пользуется BridgeLogic: None, если сервис не задан или недоступен
+(тогда DDS считается в процессе, как раньше).
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import os
+import signal
+import socket
+import struct
+import sys
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from endplay.types import Card, Deal, Denom, Player, Rank
+
+from metrics import Counter, Gauge, Histogram
+
+# ──────────── настройки ────────────
+SOCKET = os.getenv("BRIDGEIT_DDS_SOCKET", "")
+DEFAULT_SOCKET = "/tmp/bridgeit-dds.sock"
+CACHE_SIZE = 200_000            # ответов в LRU сервиса (~60 байт каждый)
+MAX_BODY = 1024                 # тело запроса больше — клиент сломан
+CLIENT_TIMEOUT = 30.0           # сек на ответ
+RETRY_SECONDS = 5.0             # после отказа сервиса столько секунд решаем у себя
+
+OP_SOLVE, OP_TABLE, OP_STATS = 1, 2, 3
+ST_OK, ST_ERROR = 0, 1
+OP_NAMES = {OP_SOLVE: "solve_board", OP_TABLE: "calc_dd_table", OP_STATS: "stats"}
+
+FRAME = struct.Struct("<IIB")           # длина тела, номер запроса, операция / статус
+POSITION = struct.Struct("<4QBBB")      # маски N E S W, козырь, первый ход, карт во взятке
+PLAYERS = (Player.north, Player.east, Player.south, Player.west)
+DD_DENOMS = (Denom.clubs, Denom.diamonds, Denom.hearts, Denom.spades, Denom.nt)   # порядок STRAINS
+
+DdTable = Tuple[Tuple[int, ...], ...]   # [масть C D H S NT][рука N E S W]
+
+log = logging.getLogger(__name__)
+
+REQUESTS = Counter("dds_service_requests_total", "Запросы к DDS-сервису",
+                   ("op", "result"))      # hit — из кэша, joined — к решаемому, solved — решён
+SOLVE_SECONDS = Histogram("dds_service_solve_seconds", "Решение в пуле DDS-сервиса", ("op",),
+                          (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0))
+INFLIGHT = Gauge("dds_service_inflight", "Позиций в решении")
+
+
+# ──────────── кодирование позиции ────────────
+def card_code(card: Card) -> int:
+    return int(card.suit) << 4 | int(card.rank).bit_length() - 1
+
+
+def code_card(code: int) -> Card:
+    return Card(suit=Denom(code >> 4), rank=Rank(1 << (code & 15)))
+
+
+def encode_position(deal: Deal) -> bytes:
+    """Оставшиеся руки, козырь, первый ход и карты текущей взятки."""
+    masks = [sum(1 << card_code(c) for c in deal[p]) for p in PLAYERS]
+    trick = bytes(card_code(c) for c in deal.curtrick)
+    return POSITION.pack(*masks, int(deal.trump), int(deal.first), len(trick)) + trick
+
+
+def decode_position(blob: bytes) -> Deal:
+    *masks, trump, first, n = POSITION.unpack_from(blob)
+    trick = blob[POSITION.size:POSITION.size + n]
+    if len(trick) != n or n > 3:
+        raise ValueError("неверная позиция")
+    deal = Deal()
+    for p, mask in zip(PLAYERS, masks):
+        deal[p].extend(code_card(b) for b in range(64) if mask >> b & 1)
+    # карты взятки возвращаются в руки и разыгрываются заново — так endplay
+    # восстанавливает и curtrick, и того, кто ходит
+    for i, code in enumerate(trick):
+        deal[PLAYERS[(first + i) % 4]].add(code_card(code))
+    deal.trump = Denom(trump)
+    deal.first = Player(first)
+    for code in trick:
+        deal.play(code_card(code))
+    return deal
+
+
+# ──────────── решение (в процессах пула) ────────────
+def solve_blob(op: int, blob: bytes) -> bytes:
+    deal = decode_position(blob)
+    if op == OP_SOLVE:
+        from endplay.dds.solve import solve_board
+        res = [(card_code(c), t) for c, t in solve_board(deal)]
+        return bytes([len(res)]) + bytes(b for pair in res for b in pair)
+    if op == OP_TABLE:
+        from endplay.dds.ddtable import calc_dd_table
+        dd = calc_dd_table(deal)
+        return bytes(int(dd[d, p]) for d in DD_DENOMS for p in PLAYERS)
+    raise ValueError(f"неизвестная операция {op}")
+
+
+# ──────────── сервис ────────────
+class Service:
+    def __init__(self, cache_size: int = CACHE_SIZE):
+        import board_analysis
+
+        self.pool = board_analysis.executor()
+        self.workers = board_analysis.DD_WORKERS
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[bytes, bytes]" = OrderedDict()
+        self._inflight: Dict[bytes, asyncio.Task] = {}
+        self.counts = {"hit": 0, "joined": 0, "solved": 0, "errors": 0}
+        self.started = time.time()
+
+    async def request(self, op: int, blob: bytes) -> bytes:
+        if op == OP_STATS:
+            return json.dumps(self.stats()).encode()
+        if op not in (OP_SOLVE, OP_TABLE):
+            raise ValueError(f"неизвестная операция {op}")
+        key = bytes([op]) + blob
+        name = OP_NAMES[op]
+        hit = self._cache.get(key)
+        if hit is not None:
+            self._cache.move_to_end(key)
+            self._count(name, "hit")
+            return hit
+        task = self._inflight.get(key)
+        if task is not None:
+            self._count(name, "joined")
+        else:
+            # решение — своя задача, а не задача соединения: отключившийся
+            # клиент не отменяет его для тех, кто присоединился
+            task = self._inflight[key] = asyncio.create_task(self._solve(key, op, blob))
+            INFLIGHT.set(len(self._inflight))
+        return await asyncio.shield(task)
+
+    async def _solve(self, key: bytes, op: int, blob: bytes) -> bytes:
+        name = OP_NAMES[op]
+        try:
+            with SOLVE_SECONDS.time(name):
+                res = await asyncio.get_running_loop().run_in_executor(self.pool, solve_blob, op, blob)
+        except Exception:
+            self._count(name, "error")
+            raise
+        finally:
+            del self._inflight[key]
+            INFLIGHT.set(len(self._inflight))
+        self._count(name, "solved")
+        self._cache[key] = res
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return res
+
+    def _count(self, name: str, result: str) -> None:
+        REQUESTS.inc(name, result)
+        self.counts["errors" if result == "error" else result] += 1
+
+    def stats(self) -> dict:
+        return {**self.counts, "cached": len(self._cache), "inflight": len(self._inflight),
+                "workers": self.workers, "uptime": round(time.time() - self.started, 1)}
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """Одно соединение: читаем кадры подряд, отвечаем по готовности."""
+        tasks = set()
+        try:
+            while True:
+                size, rid, op = FRAME.unpack(await reader.readexactly(FRAME.size))
+                if size > MAX_BODY:
+                    log.warning("DDS-сервис: тело %d байт — закрываю соединение", size)
+                    break
+                blob = await reader.readexactly(size)
+                t = asyncio.create_task(self._answer(writer, rid, op, blob))
+                tasks.add(t)
+                t.add_done_callback(tasks.discard)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        except asyncio.CancelledError:
+            pass                        # остановка сервиса: asyncio.run отменяет открытые соединения
+        finally:
+            for t in tasks:
+                t.cancel()
+            writer.close()
+
+    async def _answer(self, writer: asyncio.StreamWriter, rid: int, op: int, blob: bytes) -> None:
+        try:
+            body, status = await self.request(op, blob), ST_OK
+        except Exception as e:
+            body, status = f"{type(e).__name__}: {e}".encode(), ST_ERROR
+        if not writer.is_closing():
+            writer.write(FRAME.pack(len(body), rid, status) + body)     # кадр целиком — не перемешиваются
+
+
+async def serve(path: str, cache_size: int = CACHE_SIZE) -> None:
+    import board_analysis
+
+    if os.path.exists(path):
+        try:
+            with socket.socket(socket.AF_UNIX) as s:
+                s.connect(path)
+            raise SystemExit(f"DDS-сервис уже работает на {path}")
+        except ConnectionRefusedError:
+            os.unlink(path)             # сокет от упавшего процесса
+    service = Service(cache_size)
+    server = await asyncio.start_unix_server(service.handle, path=path)
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    log.info("DDS-сервис на %s: процессов %d, кэш %d", path, service.workers, cache_size)
+    try:
+        async with server:
+            await stop.wait()
+    finally:
+        if os.path.exists(path):
+            os.unlink(path)
+        board_analysis.shutdown()
+        log.info("DDS-сервис остановлен: %s", service.stats())
+
+
+# ──────────── клиент ────────────
+class DdsServiceError(RuntimeError):
+    """Сервис ответил ошибкой (позиция не решается)."""
+
+
+def _recv(sock: socket.socket, n: int) -> bytes:
+    buf = bytearray()
+    while len(buf) < n:
+        chunk = sock.recv(n - len(buf))
+        if not chunk:
+            raise ConnectionError("DDS-сервис закрыл соединение")
+        buf += chunk
+    return bytes(buf)
+
+
+class DdsClient:
+    """Синхронный клиент: у каждого потока своё соединение, запрос — ответ."""
+
+    def __init__(self, path: str, timeout: float = CLIENT_TIMEOUT):
+        self.path = path
+        self.timeout = timeout
+        self._local = threading.local()
+        self._ids = itertools.count(1)
+
+    def _sock(self) -> socket.socket:
+        sock = getattr(self._local, "sock", None)
+        if sock is None:
+            sock = socket.socket(socket.AF_UNIX)
+            sock.settimeout(self.timeout)
+            try:
+                sock.connect(self.path)
+            except OSError:
+                sock.close()
+                raise
+            self._local.sock = sock
+        return sock
+
+    def close(self) -> None:
+        sock = getattr(self._local, "sock", None)
+        if sock is not None:
+            self._local.sock = None
+            sock.close()
+
+    def call(self, op: int, blob: bytes = b"") -> bytes:
+        rid = next(self._ids) & 0xFFFFFFFF
+        sock = self._sock()
+        try:
+            sock.sendall(FRAME.pack(len(blob), rid, op) + blob)
+            size, got, status = FRAME.unpack(_recv(sock, FRAME.size))
+            body = _recv(sock, size)
+        except OSError:
+            self.close()                # после таймаута в сокете может остаться чужой ответ
+            raise
+        if got != rid:
+            self.close()
+            raise ConnectionError(f"DDS-сервис: ответ {got} на запрос {rid}")
+        if status != ST_OK:
+            raise DdsServiceError(body.decode(errors="replace"))
+        return body
+
+    def solve_board(self, deal: Deal) -> List[Tuple[Card, int]]:
+        body = self.call(OP_SOLVE, encode_position(deal))
+        return [(code_card(body[i]), body[i + 1]) for i in range(1, 1 + 2 * body[0], 2)]
+
+    def calc_dd_table(self, deal: Deal) -> DdTable:
+        body = self.call(OP_TABLE, encode_position(deal))
+        return tuple(tuple(body[i:i + 4]) for i in range(0, 20, 4))
+
+    def stats(self) -> dict:
+        return json.loads(self.call(OP_STATS))
+
+
+_client: Optional[DdsClient] = DdsClient(SOCKET) if SOCKET else None
+_down_until = 0.0
+
+
+def _remote(method: str, deal: Deal):
+    """Вызов сервиса; None — сервиса нет или он недоступен (решаем у себя)."""
+    global _down_until
+    if _client is None or time.monotonic() < _down_until:
+        return None
+    try:
+        return getattr(_client, method)(deal)
+    except DdsServiceError as e:
+        log.warning("DDS-сервис: %s — решаем в процессе", e)
+        return None
+    except OSError as e:
+        _down_until = time.monotonic() + RETRY_SECONDS
+        log.warning("DDS-сервис %s: %s — %d с считаем в процессе", _client.path, e, RETRY_SECONDS)
+        return None
+
+
+def remote_solve(deal: Deal) -> Optional[List[Tuple[Card, int]]]:
+    return _remote("solve_board", deal)
+
+
+def remote_table(deal: Deal) -> Optional[DdTable]:
+    return _remote("calc_dd_table", deal)
+
+
+def main(argv=None) -> int:
+    from metrics import start_metrics_server
+
+    ap = argparse.ArgumentParser(description="DDS-сервис на Unix-сокете")
+    ap.add_argument("--socket", default=SOCKET or DEFAULT_SOCKET)
+    ap.add_argument("--cache", type=int, default=CACHE_SIZE, help="ответов в LRU")
+    ap.add_argument("--metrics-port", type=int, help="/metrics в формате Prometheus")
+    args = ap.parse_args(argv)
+    logging.basicConfig(format="%(asctime)s %(levelname)s %(message)s", level=logging.INFO)
+    if args.metrics_port:
+        start_metrics_server(args.metrics_port)
+    asyncio.run(serve(args.socket, args.cache))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
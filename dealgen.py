@@ -0,0 +1,275 @@
+#!/usr/bin/env python3
+# dealgen.py — случайные сдачи с условиями (как программа dealer) и DD пачками
+"""
+Сдачи генерируются пачками целиком в NumPy: случайные ключи карт сортируются
+по строкам, места 0–12 — N, 13–25 — E, …; рука — 52-битная маска в формате
+corpus.py. Условия — тот же язык, что у поиска по корпусу:
+
+    python dealgen.py "N:hcp=15-17 N:shape=4333 S:H=5+" -n 16 --out set.pbn
+    python dealgen.py "N:S=6+ N:hcp=11-15 makes=4S:N" -n 10 --predeal N:SA,SK --dd
+
+    • слова без makes= фильтруют пачку векторно (миллионы сдач в секунду);
+    • --predeal раздаёт карты заранее — перемешиваются только остальные;
+    • --dd / makes= — подошедшие сдачи идут пачками calc_all_tables в пул
+      процессов board_analysis, makes= проверяется по готовой DD-таблице,
+      пар — par.py по номеру доски (сдающий, зона);
+    • скорость обоих этапов (сдач/с) — в stderr.
+
+Каждая сдача — строка «N:…», её напрямую принимает BridgeLogic(pbn);
+--corpus дописывает результат (с DD) в корпус corpus.py.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import contextlib
+import sys
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import AsyncIterator, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+import board_analysis
+import corpus
+from corpus import HANDS, RANKS, SUITS, card_bit, features, masks_pbn, where_mask
+from par import analyse as analyse_par, format_report
+from scoring import board_vulnerability
+
+# ──────────── настройки ────────────
+BATCH = 100_000                 # сдач в одной пачке генератора
+MAX_TRIES = 100_000_000         # сколько сдач перебрать, прежде чем сдаться
+DD_INFLIGHT = 2                 # пачек DD на процесс пула одновременно
+
+PBN_ZONE = {(False, False): "None", (True, False): "NS", (False, True): "EW", (True, True): "All"}
+
+
+# ──────────── статистика ────────────
+@dataclass
+class Stage:
+    name: str
+    done: int = 0               # обработано сдач
+    passed: int = 0             # подошло
+    seconds: float = 0.0
+
+    def rate(self) -> float:
+        return self.done / self.seconds if self.seconds else 0.0
+
+    def line(self) -> str:
+        rate = f"{self.rate():,.0f}".replace(",", " ")
+        return f"{self.name}: {self.done} сдач за {self.seconds:.2f} с ({rate} сдач/с), подошло {self.passed}"
+
+
+@dataclass
+class Stats:
+    generate: Stage = field(default_factory=lambda: Stage("генерация"))
+    dd: Stage = field(default_factory=lambda: Stage("DD"))
+
+
+# ──────────── условия ────────────
+def split_where(where: str) -> Tuple[str, str]:
+    """(условия на руки — до DD, makes= — после DD)."""
+    words = where.split()
+    post = [w for w in words if w.lower().startswith("makes=")]
+    return " ".join(w for w in words if w not in post), " ".join(post)
+
+
+def parse_predeal(text: str) -> np.ndarray:
+    """'N:SA,SK S:HQ' → владелец каждой из 52 карт (-1 — свободна)."""
+    owner = np.full(52, -1, np.int8)
+    for part in text.split():
+        hand, _, cards = part.upper().partition(":")
+        if hand not in HANDS or not cards:
+            raise ValueError(f"predeal {part!r}: нужно N:SA,SK")
+        for card in cards.replace("10", "T").split(","):
+            if len(card) != 2 or card[0] not in SUITS or card[1] not in RANKS:
+                raise ValueError(f"predeal {part!r}: карта вида SA, HT, C2")
+            bit = card_bit(card[0], card[1])
+            if owner[bit] >= 0:
+                raise ValueError(f"predeal: {card} сдана дважды")
+            owner[bit] = HANDS.index(hand)
+    if any((owner == h).sum() > 13 for h in range(4)):
+        raise ValueError("predeal: в руке больше 13 карт")
+    return owner
+
+
+# ──────────── генерация ────────────
+def deal_batch(rng: np.random.Generator, n: int, predeal: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    n случайных сдач → маски (n, 4). Свободные карты перемешиваются сортировкой
+    случайных ключей (старшие биты — случайность, младшие 6 — номер карты).
+    """
+    owner = predeal if predeal is not None else np.full(52, -1, np.int8)
+    free = np.flatnonzero(owner < 0).astype(np.uint32)
+    keys = rng.integers(0, 1 << 26, (n, len(free)), dtype=np.uint32) << np.uint32(6)
+    keys |= np.arange(len(free), dtype=np.uint32)
+    keys.sort(axis=1)
+    cards = free[keys & np.uint32(63)].astype(np.uint64)          # свободные карты в случайном порядке
+    bits = np.left_shift(np.uint64(1), cards)
+    masks = np.empty((n, 4), np.uint64)
+    start = 0
+    for h in range(4):
+        fixed = np.flatnonzero(owner == h)
+        take = 13 - len(fixed)
+        masks[:, h] = bits[:, start:start + take].sum(axis=1, dtype=np.uint64)
+        masks[:, h] += np.uint64(sum(1 << int(b) for b in fixed))
+        start += take
+    return masks
+
+
+def generate_masks(where: str = "", *, predeal: Optional[np.ndarray] = None, seed: Optional[int] = None,
+                   batch: int = BATCH, max_tries: int = MAX_TRIES,
+                   stats: Optional[Stats] = None) -> Iterator[np.ndarray]:
+    """Пачки масок (k, 4) сдач, подходящих под условия на руки; бесконечно до max_tries."""
+    rng = np.random.default_rng(seed)
+    st = (stats or Stats()).generate
+    if "makes=" in where.lower():
+        raise ValueError("makes= проверяется только после DD — см. split_where")
+    while st.done < max_tries:
+        t0 = time.perf_counter()
+        n = min(batch, max_tries - st.done)
+        masks = deal_batch(rng, n, predeal)
+        if where:
+            masks = masks[where_mask(features(masks), where)]
+        st.done += n
+        st.passed += len(masks)
+        st.seconds += time.perf_counter() - t0
+        if len(masks):
+            yield masks
+
+
+def generate(where: str = "", count: Optional[int] = None, **kw) -> Iterator[str]:
+    """Подходящие сдачи строками «N:…» (для BridgeLogic(pbn)); count — сколько, None — без конца."""
+    left = count
+    for masks in generate_masks(where, **kw):
+        for row in masks[:left]:
+            yield masks_pbn(row)
+        if left is not None:
+            left -= min(left, len(masks))
+            if not left:
+                return
+
+
+# ──────────── DD пачками в пуле ────────────
+@dataclass(frozen=True)
+class Analysed:
+    pbn: str
+    dd: Tuple[Tuple[int, ...], ...]         # [масть STRAINS][рука NESW]
+
+
+async def generate_analysed(where: str, count: int, *, stats: Optional[Stats] = None,
+                            **kw) -> AsyncIterator[Analysed]:
+    """
+    Сдачи с DD-таблицей: кандидаты по условиям на руки уходят пачками
+    по DD_CHUNK в пул процессов (DD_INFLIGHT пачек на процесс), makes= —
+    по готовым таблицам; выдача — по мере готовности, ровно count штук.
+    """
+    stats = stats or Stats()
+    pre, post = split_where(where)
+    loop = asyncio.get_running_loop()
+    pool = board_analysis.executor()
+    candidates = (row for masks in generate_masks(pre, stats=stats, **kw) for row in masks)
+    inflight: Dict[asyncio.Future, List[str]] = {}
+    left = count
+    exhausted = False
+    t0 = time.perf_counter()
+    try:
+        while left > 0:
+            while not exhausted and len(inflight) < DD_INFLIGHT * board_analysis.DD_WORKERS:
+                chunk = [masks_pbn(row) for _, row in zip(range(board_analysis.DD_CHUNK), candidates)]
+                if not chunk:
+                    exhausted = True
+                    break
+                rows = [(i, pbn, None, None) for i, pbn in enumerate(chunk)]
+                inflight[loop.run_in_executor(pool, board_analysis.analyse_chunk, rows)] = chunk
+            if not inflight:
+                break
+            done, _ = await asyncio.wait(inflight, return_when=asyncio.FIRST_COMPLETED)
+            for fut in done:
+                pbns = inflight.pop(fut)
+                dd = [a.dd for a in fut.result()]
+                stats.dd.done += len(dd)
+                if post:
+                    masks = np.array([corpus.deal_masks(p) for p in pbns], np.uint64)
+                    ok = where_mask(features(masks, np.array(dd, np.int8)), post)
+                else:
+                    ok = [True] * len(dd)
+                for pbn, table, good in zip(pbns, dd, ok):
+                    if good and left > 0:
+                        left -= 1
+                        stats.dd.passed += 1
+                        yield Analysed(pbn, table)
+            stats.dd.seconds = time.perf_counter() - t0
+    finally:
+        for fut in inflight:
+            fut.cancel()
+
+
+# ──────────── вывод ────────────
+def pbn_board(board: int, deal: str, analysed: Optional[Analysed] = None) -> str:
+    """Доска PBN: сдающий и зона — по номеру; с DD — пар комментарием."""
+    dealer = board_analysis.board_dealer(board, None)
+    vul = board_vulnerability(board)
+    lines = [f'[Board "{board}"]', f'[Dealer "{dealer}"]', f'[Vulnerable "{PBN_ZONE[vul]}"]', f'[Deal "{deal}"]']
+    if analysed is not None:
+        lines += ["{", format_report(analyse_par(analysed.dd, dealer, vul)), "}"]
+    return "\n".join(lines) + "\n"
+
+
+async def _run(args, predeal: Optional[np.ndarray], out) -> Stats:
+    stats = Stats()
+    kw = dict(predeal=predeal, seed=args.seed, batch=args.batch, max_tries=args.max_tries, stats=stats)
+    store = corpus.Corpus(args.corpus) if args.corpus else None
+    found: List[Analysed] = []
+    if args.dd or split_where(args.where)[1]:
+        async for a in generate_analysed(args.where, args.count, **kw):
+            found.append(a)
+            out.write(pbn_board(args.first + len(found) - 1, a.pbn, a) + "\n")
+        if store is not None and found:
+            store.add_pbns((a.pbn for a in found), dd=(a.dd for a in found))
+    else:
+        deals = list(generate(args.where, args.count, **kw))
+        for i, deal in enumerate(deals):
+            out.write(pbn_board(args.first + i, deal) + "\n")
+        if store is not None and deals:
+            store.add_pbns(deals)
+    return stats
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description="Случайные сдачи с условиями (+ DD пачками в пуле процессов)")
+    ap.add_argument("where", nargs="?", default="", help='условия, например "N:hcp=15-17 N:shape=4333 makes=3NT:N"')
+    ap.add_argument("-n", "--count", type=int, default=16, help="сколько сдач нужно")
+    ap.add_argument("--predeal", default="", help="карты заранее: N:SA,SK S:HQ")
+    ap.add_argument("--dd", action="store_true", help="посчитать DD и пар")
+    ap.add_argument("--seed", type=int)
+    ap.add_argument("--batch", type=int, default=BATCH, help="сдач в пачке генератора")
+    ap.add_argument("--max-tries", type=int, default=MAX_TRIES)
+    ap.add_argument("--first", type=int, default=1, help="номер первой доски")
+    ap.add_argument("--out", type=Path, help="PBN-файл (по умолчанию stdout)")
+    ap.add_argument("--corpus", type=Path, help="дописать сдачи в корпус corpus.py")
+    args = ap.parse_args(argv)
+
+    try:
+        predeal = parse_predeal(args.predeal) if args.predeal else None
+        with open(args.out, "w", encoding="utf-8") if args.out else contextlib.nullcontext(sys.stdout) as out:
+            stats = asyncio.run(_run(args, predeal, out))
+    except ValueError as e:
+        print(f"Ошибка: {e}", file=sys.stderr)
+        return 2
+    finally:
+        board_analysis.shutdown()
+    print(stats.generate.line(), file=sys.stderr)
+    if stats.dd.done:
+        print(stats.dd.line(), file=sys.stderr)
+    got = stats.dd.passed if stats.dd.done else min(stats.generate.passed, args.count)
+    if got < args.count:
+        print(f"Найдено только {got} из {args.count} за {stats.generate.done} попыток.", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
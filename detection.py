@@ -3,17 +3,26 @@
 
 from __future__ import annotations
 
+import threading
 from pathlib import Path
 from collections import defaultdict
-from typing import Dict, List, Set, Tuple
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Dict, List, Set, Tuple
 
 import numpy as np
-import cv2
-from ultralytics import YOLO, __version__ as ULTRA_VER
-from sklearn.mixture import GaussianMixture
+
+# torch/ultralytics (~2–3 с и ~0.5 ГБ), sklearn (~1.5 с) и cv2 грузятся при первом
+# распознавании — в потоке очереди, — а не при импорте модуля: боту,
+# который разбирает только PBN (from_pbn), они не нужны (см. preload_backends()).
+if TYPE_CHECKING:
+    from ultralytics import YOLO
+
+from profiling import new_timer, NULL_TIMER
 
 # ──────────── константы ────────────
 MODEL = "yolov8s_playing_cards.pt"
+IMGSZ = 1600            # основной проход: полное разрешение + TTA
+PREVIEW_IMGSZ = 960     # быстрый предварительный проход без TTA
 MAX_HAND_LEN = 13
 RANKS = "AKQJT98765432"
 SUITS = "SHDC"
@@ -24,6 +33,54 @@ PREVIEW_ORDER = ["S", "E", "N", "W"]
 SUIT_SYM = {"S": "♠", "H": "♥", "D": "♦", "C": "♣"}
 
 
+@dataclass(frozen=True)
+class DetectorConfig:
+    """
+    Параметры инференса основного прохода (для подбора см. bench_detection.py).
+    Бэкенд определяется файлом модели: .pt — PyTorch, .onnx — ONNX Runtime,
+    *_openvino_model/ — OpenVINO, .engine — TensorRT (экспорт через yolo export).
+    """
+    model: str = MODEL
+    imgsz: int = IMGSZ
+    augment: bool = True            # TTA
+    second_pass: bool = True        # добор неуверенных карт (conf ≥ 0.20)
+    preview_imgsz: int = PREVIEW_IMGSZ
+
+    def label(self) -> str:
+        return (f"model={Path(self.model).name},imgsz={self.imgsz},"
+                f"tta={int(self.augment)},second_pass={int(self.second_pass)}")
+
+
+DEFAULT_CONFIG = DetectorConfig()
+
+
+_models = threading.local()
+
+
+def _get_model(model_path: str) -> YOLO:
+    """
+    Модель грузится один раз на поток и переиспользуется.
+    YOLO.predict не потокобезопасен, поэтому у каждого потока очереди
+    распознавания — свой экземпляр.
+    """
+    cache = getattr(_models, "cache", None)
+    if cache is None:
+        cache = _models.cache = {}
+    if model_path not in cache:
+        from ultralytics import YOLO, __version__ as ULTRA_VER
+        if tuple(map(int, ULTRA_VER.split(".")[:3])) < (8, 2, 0):
+            raise RuntimeError("Требуется Ultralytics ≥ 8.2.0")
+        cache[model_path] = YOLO(model_path)
+    return cache[model_path]
+
+
+def preload_backends() -> None:
+    """Заранее импортирует тяжёлые библиотеки распознавания (без загрузки весов)."""
+    import cv2  # noqa: F401
+    import ultralytics  # noqa: F401
+    import sklearn.mixture  # noqa: F401
+
+
 def _card_unicode(card: str) -> str:
     """'AS' → 'A♠', 'TS' → 'T♠' (десятка теперь T, а не 10)."""
     r, s = card[0], card[1]
@@ -45,22 +102,57 @@ def _hand_pretty(hand: Set[str]) -> str:
 
 # ──────────── основной класс ────────────
 class BridgeCardDetector:
-    def __init__(self, img_path: str, model_path: str = MODEL):
-        if tuple(map(int, ULTRA_VER.split(".")[:3])) < (8, 2, 0):
-            raise RuntimeError("Требуется Ultralytics ≥ 8.2.0")
+    def __init__(self, img_path: str, model_path: str | None = None, *, staged: bool = False,
+                 timer=None, config: DetectorConfig = DEFAULT_CONFIG):
+        """
+        staged=False — сразу полный проход (TTA в полном разрешении + добор).
+        staged=True  — только быстрый предварительный проход (stage == "preview");
+                       полный результат затем даёт refine().
+        timer        — profiling.StageTimer для поэтапных замеров
+                       (по умолчанию — profiling.new_timer()).
+        config       — параметры инференса; model_path, если задан, важнее config.model.
+        """
+        self.timer = timer if timer is not None else new_timer()
 
+        self.config = config
         self.img_path = Path(img_path)
-        self.model = YOLO(model_path)
+        self.model = _get_model(model_path or config.model)
         self._dealer: str = "N"
 
         self.hands: Dict[str, Set[str]] = {p: set() for p in ORDER}
         self._dealer: str | None = None
         # (x1, y1, x2, y2, raw_label, player)
         self._dets: List[Tuple[int, int, int, int, str, str]] = []
+        self._img: np.ndarray | None = None
 
-        self._process()
+        if staged:
+            self._process(fast=True)
+            self.stage = "preview"
+        else:
+            self._process()
+            self.stage = "final"
         self._auto_fill_trivial()
 
+    def refine(self) -> None:
+        """
+        Уточнение после быстрого прохода: полный проход с TTA и добором
+        неуверенных карт. Результат предпросмотра заменяется целиком;
+        если уточнение упало — детектор остаётся с результатом предпросмотра.
+        """
+        if self.stage == "final":
+            return
+        hands, dets = self.hands, self._dets
+        self.hands = {p: set() for p in ORDER}
+        self._dets = []
+        try:
+            self._process()
+            self._auto_fill_trivial()
+        except Exception:
+            self.hands, self._dets = hands, dets
+            raise
+        self._img = None
+        self.stage = "final"
+
     # ---------- сервис для UI кнопок ----------
     def lost_cards(self) -> list[str]:
         """
@@ -161,6 +253,12 @@ class BridgeCardDetector:
         if not save:
             raise ValueError("Путь для сохранения изображения должен быть задан.")
 
+        with self.timer.stage("preview_visualize" if self.stage == "preview" else "visualize"):
+            self._visualize(save, debug)
+
+    def _visualize(self, save: str, debug: bool):
+        import cv2
+
         img = cv2.imread(str(self.img_path))
         if img is None:
             raise FileNotFoundError(f"Не удалось открыть изображение: {self.img_path}")
@@ -344,94 +442,113 @@ class BridgeCardDetector:
         return f"{' '.join(parts)}"
 
     # ──────────── внутренние детали ────────────
-    def _process(self):
-        img = cv2.imread(str(self.img_path))
-        if img is None:
-            raise FileNotFoundError(self.img_path)
-
-        pred = self.model.predict(img, imgsz=1600, augment=True,
-                                  conf=0.55, verbose=False)[0]
+    def _process(self, fast: bool = False):
+        pfx = "preview_" if fast else ""
+        with self.timer.stage(pfx + "decode"):
+            import cv2
+
+            img = self._img
+            if img is None:
+                img = cv2.imread(str(self.img_path))
+                if img is None:
+                    raise FileNotFoundError(self.img_path)
+            if fast:
+                # картинка понадобится ещё раз в refine() — не декодируем повторно
+                self._img = img
+
+        with self.timer.stage(pfx + "predict"):
+            cfg = self.config
+            imgsz, augment = (cfg.preview_imgsz, False) if fast else (cfg.imgsz, cfg.augment)
+            pred = self.model.predict(img, imgsz=imgsz, augment=augment,
+                                      conf=0.55, verbose=False)[0]
         if len(pred.boxes) < 4:
             return
 
-        id2label = self.model.names
-        centers, info = [], []
-        for b in pred.boxes:
-            x1, y1, x2, y2 = map(float, b.xyxy[0])
-            cx, cy = (x1 + x2) / 2, (y1 + y2) / 2
-            centers.append([cx, cy])
-            info.append((int(x1), int(y1), int(x2), int(y2),
-                         id2label[int(b.cls)], float(b.conf.cpu().item())))
-        centers = np.array(centers)
-
-        gmm = GaussianMixture(n_components=4, covariance_type="full",
-                              random_state=0)
-        labels = gmm.fit_predict(centers)
-        centroids = gmm.means_
-
-        # --- определяем, какой кластер чьей руке соответствует ---
-        cl2pts = defaultdict(list)
-        for (cx, cy), cl in zip(centers, labels):
-            cl2pts[cl].append((cx, cy))
-        orient = {}
-        for cl, pts in cl2pts.items():
-            xs, ys = zip(*pts)
-            orient[cl] = "H" if max(xs) - min(xs) >= max(ys) - min(ys) else "V"
-
-        horiz = [cl for cl, o in orient.items() if o == "H"]
-        vert = [cl for cl, o in orient.items() if o == "V"]
-        if len(horiz) == 2 and len(vert) == 2:
-            north = min(horiz, key=lambda i: np.median([p[1] for p in cl2pts[i]]))
-            south = max(horiz, key=lambda i: np.median([p[1] for p in cl2pts[i]]))
-            west = min(vert,  key=lambda i: np.median([p[0] for p in cl2pts[i]]))
-            east = max(vert,  key=lambda i: np.median([p[0] for p in cl2pts[i]]))
-        else:
-            north = int(np.argmin([c[1] for c in centroids]))
-            south = int(np.argmax([c[1] for c in centroids]))
-            rest = [i for i in range(4) if i not in (north, south)]
-            west, east = sorted(rest, key=lambda i: centroids[i][0])
-
-        cluster2p = {north: "N", south: "S", west: "W", east: "E"}
-        self._cluster2p = cluster2p
-        self._cluster_centroids = centroids
-        pl2cluster = {v: k for k, v in cluster2p.items()}
-
-        # --- первая запись карт ---
-        best: Dict[str, Tuple[float, str]] = {}
-        for (x1, y1, x2, y2, raw, conf), cl in zip(info, labels):
-            player = cluster2p[cl]
-            label = self._norm_card(raw)
-            if label in best and conf <= best[label][0]:
-                continue
-            if label in best:
-                prev = best[label][1]
-                self.hands[prev].discard(label)
-            self.hands[player].add(label)
-            best[label] = (conf, player)
-            self._dets.append((x1, y1, x2, y2, raw, player, conf))
+        with self.timer.stage(pfx + "gmm"):
+            id2label = self.model.names
+            centers, info = [], []
+            for b in pred.boxes:
+                x1, y1, x2, y2 = map(float, b.xyxy[0])
+                cx, cy = (x1 + x2) / 2, (y1 + y2) / 2
+                centers.append([cx, cy])
+                info.append((int(x1), int(y1), int(x2), int(y2),
+                             id2label[int(b.cls)], float(b.conf.cpu().item())))
+            centers = np.array(centers)
+
+            from sklearn.mixture import GaussianMixture
+            gmm = GaussianMixture(n_components=4, covariance_type="full",
+                                  random_state=0)
+            labels = gmm.fit_predict(centers)
+            centroids = gmm.means_
+
+        with self.timer.stage(pfx + "assign"):
+            # --- определяем, какой кластер чьей руке соответствует ---
+            cl2pts = defaultdict(list)
+            for (cx, cy), cl in zip(centers, labels):
+                cl2pts[cl].append((cx, cy))
+            orient = {}
+            for cl, pts in cl2pts.items():
+                xs, ys = zip(*pts)
+                orient[cl] = "H" if max(xs) - min(xs) >= max(ys) - min(ys) else "V"
+
+            horiz = [cl for cl, o in orient.items() if o == "H"]
+            vert = [cl for cl, o in orient.items() if o == "V"]
+            if len(horiz) == 2 and len(vert) == 2:
+                north = min(horiz, key=lambda i: np.median([p[1] for p in cl2pts[i]]))
+                south = max(horiz, key=lambda i: np.median([p[1] for p in cl2pts[i]]))
+                west = min(vert,  key=lambda i: np.median([p[0] for p in cl2pts[i]]))
+                east = max(vert,  key=lambda i: np.median([p[0] for p in cl2pts[i]]))
+            else:
+                north = int(np.argmin([c[1] for c in centroids]))
+                south = int(np.argmax([c[1] for c in centroids]))
+                rest = [i for i in range(4) if i not in (north, south)]
+                west, east = sorted(rest, key=lambda i: centroids[i][0])
+
+            cluster2p = {north: "N", south: "S", west: "W", east: "E"}
+            self._cluster2p = cluster2p
+            self._cluster_centroids = centroids
+            pl2cluster = {v: k for k, v in cluster2p.items()}
+
+            # --- первая запись карт ---
+            best: Dict[str, Tuple[float, str]] = {}
+            for (x1, y1, x2, y2, raw, conf), cl in zip(info, labels):
+                player = cluster2p[cl]
+                label = self._norm_card(raw)
+                if label in best and conf <= best[label][0]:
+                    continue
+                if label in best:
+                    prev = best[label][1]
+                    self.hands[prev].discard(label)
+                self.hands[player].add(label)
+                best[label] = (conf, player)
+                self._dets.append((x1, y1, x2, y2, raw, player, conf))
 
         # =========================================================
         #        П О В Т О Р Н А Я   П Р О В Е Р К А
         # =========================================================
-        DIST_THRESH = 90.0
-        for idx, det in enumerate(self._dets):
-            x1, y1, x2, y2, raw, pl, *_ = det
-            cx, cy = (x1 + x2) / 2, (y1 + y2) / 2
-            dists  = np.linalg.norm(centroids - np.array([cx, cy]), axis=1)
-            nearest = int(np.argmin(dists))
-            if nearest != pl2cluster[pl] and dists[pl2cluster[pl]] - dists[nearest] > DIST_THRESH:
-                # перенос карты к правильной руке
-                self.hands[pl].discard(self._norm_card(raw))
-                new_pl = cluster2p[nearest]
-                self.hands[new_pl].add(self._norm_card(raw))
-                self._dets[idx] = (x1, y1, x2, y2, raw, new_pl, det[6])
+        with self.timer.stage(pfx + "reassign"):
+            DIST_THRESH = 90.0
+            for idx, det in enumerate(self._dets):
+                x1, y1, x2, y2, raw, pl, *_ = det
+                cx, cy = (x1 + x2) / 2, (y1 + y2) / 2
+                dists  = np.linalg.norm(centroids - np.array([cx, cy]), axis=1)
+                nearest = int(np.argmin(dists))
+                if nearest != pl2cluster[pl] and dists[pl2cluster[pl]] - dists[nearest] > DIST_THRESH:
+                    # перенос карты к правильной руке
+                    self.hands[pl].discard(self._norm_card(raw))
+                    new_pl = cluster2p[nearest]
+                    self.hands[new_pl].add(self._norm_card(raw))
+                    self._dets[idx] = (x1, y1, x2, y2, raw, new_pl, det[6])
 
         # ---------- пост-обработка ----------
-        self._filter_by_geometry(img)   # убираем боксы «не по форме»
-        self._second_pass_low_conf(img) # докидываем недостающие карты
+        with self.timer.stage(pfx + "geometry"):
+            self._filter_by_geometry(img)   # убираем боксы «не по форме»
+        if not fast and self.config.second_pass:
+            with self.timer.stage("second_pass"):
+                self._second_pass_low_conf(img) # докидываем недостающие карты
 
     def _second_pass_low_conf(self, img: np.ndarray):
-        pred2 = self.model.predict(img, imgsz=1600, augment=True,
+        pred2 = self.model.predict(img, imgsz=self.config.imgsz, augment=self.config.augment,
                                    conf=0.20, verbose=False)[0]
         id2label = self.model.names
 
@@ -554,6 +671,10 @@ class BridgeCardDetector:
         obj._dealer = dealer
         obj.hands = {p: set() for p in ORDER}
         obj._dets = []
+        obj._img = None
+        obj.stage = "final"
+        obj.timer = NULL_TIMER
+        obj.config = DEFAULT_CONFIG
         # Разложим карты по рукам
         for p, hand_str in zip(order, hands_str):
             suits = hand_str.split(".")
@@ -0,0 +1,281 @@
+#!/usr/bin/env python3
+# fake_telegram.py — локальный «Telegram Bot API» для нагрузочных тестов
+"""
+Реализует подмножество Bot API, которым пользуется bot.py:
+getMe, getUpdates (long polling), sendMessage, editMessageText,
+editMessageReplyMarkup, sendPhoto, editMessageMedia, answerCallbackQuery,
+getFile (+ скачивание файла); остальные методы отвечают `true`.
+
+Апдейты от «пользователей» кладутся через push_* (см. loadtest.py),
+ответы бота приходят подписчику chat_id через listen().
+Бот подключается так:
+    TELEGRAM_API_URL=http://127.0.0.1:<port>/bot
+    TELEGRAM_FILE_URL=http://127.0.0.1:<port>/file/bot
+"""
+
+from __future__ import annotations
+
+import email.parser
+import email.policy
+import itertools
+import json
+import logging
+import threading
+import time
+import uuid
+from collections import Counter, defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Tuple
+from urllib.parse import parse_qs
+
+# ──────────── константы ────────────
+BOT_USER = {"id": 1, "is_bot": True, "first_name": "BridgeIt", "username": "bridgeit_fake_bot",
+            "can_join_groups": False, "can_read_all_group_messages": False,
+            "supports_inline_queries": False}
+MAX_POLL_SECONDS = 30.0
+
+log = logging.getLogger(__name__)
+
+# listener(event): event = {"method", "chat_id", "message_id", "text", "reply_markup", "t"}
+Listener = Callable[[dict], None]
+
+
+def _user(uid: int) -> dict:
+    return {"id": uid, "is_bot": False, "first_name": f"user{uid}"}
+
+
+def _chat(chat_id: int) -> dict:
+    return {"id": chat_id, "type": "private", "first_name": f"user{chat_id}"}
+
+
+def _parse_params(ctype: str, body: bytes) -> Dict[str, object]:
+    """JSON, urlencoded или multipart — как их шлёт python-telegram-bot."""
+    if not body:
+        return {}
+    if ctype.startswith("application/json"):
+        return json.loads(body)
+    if ctype.startswith("multipart/form-data"):
+        msg = email.parser.BytesParser(policy=email.policy.HTTP).parsebytes(
+            b"Content-Type: " + ctype.encode() + b"\r\n\r\n" + body)
+        params: Dict[str, object] = {}
+        for part in msg.iter_parts():
+            name = part.get_param("name", header="content-disposition")
+            if part.get_filename():
+                params[name] = part.get_payload(decode=True)
+            else:
+                params[name] = _decode_value(part.get_payload(decode=True).decode())
+        return params
+    return {k: _decode_value(v[0]) for k, v in parse_qs(body.decode(), keep_blank_values=True).items()}
+
+
+def _decode_value(v: str):
+    if v[:1] in "{[":
+        try:
+            return json.loads(v)
+        except ValueError:
+            return v
+    return v
+
+
+# ──────────── сервер ────────────
+class FakeBotApi:
+    """Состояние фейкового Bot API; HTTP-сервер крутится в фоновом потоке."""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency: float = 0.0):
+        self.latency = latency              # искусственная задержка ответа, с
+        self._lock = threading.Condition()
+        self._updates: List[dict] = []
+        self._update_ids = itertools.count(1)
+        self._msg_ids: Dict[int, itertools.count] = defaultdict(lambda: itertools.count(1))
+        self._messages: Dict[Tuple[int, int], dict] = {}
+        self._files: Dict[str, bytes] = {}
+        self._listeners: Dict[int, Listener] = {}
+        self.calls: Counter = Counter()
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread: threading.Thread | None = None
+
+    # ---------- жизненный цикл ----------
+    @property
+    def port(self) -> int:
+        return self._server.server_address[1]
+
+    @property
+    def api_url(self) -> str:
+        return f"http://127.0.0.1:{self.port}/bot"
+
+    @property
+    def file_url(self) -> str:
+        return f"http://127.0.0.1:{self.port}/file/bot"
+
+    def start(self) -> "FakeBotApi":
+        self._thread = threading.Thread(target=self._server.serve_forever,
+                                        name="fake-telegram", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    # ---------- сторона «пользователя» ----------
+    def listen(self, chat_id: int, listener: Listener) -> None:
+        self._listeners[chat_id] = listener
+
+    def push_text(self, uid: int, text: str) -> None:
+        msg = self._new_message(uid, _user(uid), text=text)
+        if text.startswith("/"):
+            msg["entities"] = [{"type": "bot_command", "offset": 0,
+                                "length": len(text.split()[0])}]
+        self._push({"message": msg})
+
+    def push_photo(self, uid: int, data: bytes) -> None:
+        file_id = uuid.uuid4().hex
+        self._files[file_id] = data
+        msg = self._new_message(uid, _user(uid))
+        msg["photo"] = [{"file_id": file_id, "file_unique_id": file_id[:16],
+                         "width": 1280, "height": 960, "file_size": len(data)}]
+        self._push({"message": msg})
+
+    def push_document(self, uid: int, data: bytes, file_name: str, caption: str | None = None) -> None:
+        file_id = uuid.uuid4().hex
+        self._files[file_id] = data
+        msg = self._new_message(uid, _user(uid))
+        msg["document"] = {"file_id": file_id, "file_unique_id": file_id[:16],
+                           "file_name": file_name, "file_size": len(data)}
+        if caption:
+            msg["caption"] = caption
+        self._push({"message": msg})
+
+    def push_callback(self, uid: int, message_id: int, data: str) -> None:
+        with self._lock:
+            msg = dict(self._messages.get((uid, message_id)) or
+                       {"message_id": message_id, "date": int(time.time()),
+                        "chat": _chat(uid), "from": BOT_USER, "text": "?"})
+        self._push({"callback_query": {"id": uuid.uuid4().hex, "from": _user(uid),
+                                       "chat_instance": str(uid), "data": data,
+                                       "message": msg}})
+
+    def _push(self, payload: dict) -> None:
+        with self._lock:
+            payload["update_id"] = next(self._update_ids)
+            self._updates.append(payload)
+            self._lock.notify_all()
+
+    def _new_message(self, chat_id: int, sender: dict, **fields) -> dict:
+        with self._lock:
+            mid = next(self._msg_ids[chat_id])
+        return {"message_id": mid, "date": int(time.time()), "chat": _chat(chat_id),
+                "from": sender, **fields}
+
+    # ---------- методы Bot API ----------
+    def call(self, method: str, p: Dict[str, object]):
+        self.calls[method] += 1
+        if self.latency:
+            time.sleep(self.latency)
+        if method == "getUpdates":
+            return self._get_updates(p)
+        if method == "getMe":
+            return BOT_USER
+        if method in ("sendMessage", "sendPhoto"):
+            chat_id = int(p["chat_id"])
+            fields = {"text": p.get("text", "")} if method == "sendMessage" else {
+                "photo": [{"file_id": uuid.uuid4().hex, "file_unique_id": "p",
+                           "width": 1280, "height": 960}]}
+            msg = self._new_message(chat_id, BOT_USER, **fields)
+            if p.get("reply_markup"):
+                msg["reply_markup"] = p["reply_markup"]
+            return self._store(method, chat_id, msg)
+        if method in ("editMessageText", "editMessageReplyMarkup", "editMessageMedia"):
+            chat_id, mid = int(p["chat_id"]), int(p["message_id"])
+            with self._lock:
+                msg = dict(self._messages.get((chat_id, mid)) or self._new_message(chat_id, BOT_USER))
+            msg["edit_date"] = int(time.time())
+            if "text" in p:
+                msg["text"] = p["text"]
+            if p.get("reply_markup"):
+                msg["reply_markup"] = p["reply_markup"]
+            else:
+                msg.pop("reply_markup", None)
+            return self._store(method, chat_id, msg)
+        if method == "getFile":
+            fid = p["file_id"]
+            return {"file_id": fid, "file_unique_id": fid[:16],
+                    "file_size": len(self._files.get(fid, b"")), "file_path": f"photos/{fid}.jpg"}
+        if method == "answerCallbackQuery":
+            return True
+        return True
+
+    def _store(self, method: str, chat_id: int, msg: dict) -> dict:
+        with self._lock:
+            self._messages[(chat_id, msg["message_id"])] = msg
+        listener = self._listeners.get(chat_id)
+        if listener is not None:
+            listener({"method": method, "chat_id": chat_id, "message_id": msg["message_id"],
+                      "text": msg.get("text"), "reply_markup": msg.get("reply_markup"),
+                      "t": time.perf_counter()})
+        return msg
+
+    def _get_updates(self, p: Dict[str, object]) -> List[dict]:
+        offset = int(p.get("offset") or 0)
+        limit = int(p.get("limit") or 100)
+        deadline = time.monotonic() + min(float(p.get("timeout") or 0), MAX_POLL_SECONDS)
+        with self._lock:
+            self._updates = [u for u in self._updates if u["update_id"] >= offset]
+            while not self._updates and time.monotonic() < deadline:
+                self._lock.wait(deadline - time.monotonic())
+            return self._updates[:limit]
+
+    def file_bytes(self, file_path: str) -> bytes | None:
+        fid = file_path.rsplit("/", 1)[-1].split(".", 1)[0]
+        return self._files.get(fid)
+
+    # ---------- HTTP ----------
+    def _handler_class(self):
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                parts = self.path.split("/")        # /bot<token>/<method>
+                body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+                if len(parts) < 3 or not parts[1].startswith("bot"):
+                    return self._reply(404, {"ok": False, "error_code": 404, "description": "Not Found"})
+                try:
+                    params = _parse_params(self.headers.get("Content-Type", ""), body)
+                    result = api.call(parts[2], params)
+                except Exception as e:
+                    log.exception("fake API: %s", parts[2])
+                    return self._reply(400, {"ok": False, "error_code": 400,
+                                             "description": f"Bad Request: {e}"})
+                self._reply(200, {"ok": True, "result": result})
+
+            def do_GET(self):
+                # /file/bot<token>/<file_path>
+                parts = self.path.split("/", 3)
+                data = api.file_bytes(parts[3]) if len(parts) == 4 and parts[1] == "file" else None
+                if data is None:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", "image/jpeg")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _reply(self, code: int, payload: dict):
+                data = json.dumps(payload).encode()
+                self.send_response(code)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                try:
+                    self.wfile.write(data)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass    # клиент закрыл long polling при остановке
+
+            def log_message(self, fmt, *args):
+                return
+
+        return Handler
@@ -0,0 +1,289 @@
+#!/usr/bin/env python3
+# import_results.py — потоковый импорт результатов турнира (CSV / USEBIO) и сдач (PBN)
+"""
+Запуск:
+    python import_results.py --new "Кубок осени" session1.csv --boards session1.pbn
+    python import_results.py --tournament 5 session2.xml            # USEBIO-подобный XML
+    python import_results.py --tournament 5 big.csv --dry-run --errors bad.csv
+
+Файл читается потоком (csv.DictReader / iterparse), каждая строка проходит ту же
+проверку, что и ввод через бота (results.parse_result_line). Годные строки
+копятся пачками по --chunk и пишутся одной транзакцией на пачку
+(Postgres: COPY во временную таблицу + одна вставка с аудитом; SQLite — цикл
+внутри одной транзакции). Упавшая пачка переписывается по строке, чтобы
+назвать виноватые строки. --dry-run — только проверка, база не меняется.
+Для сдач из --boards после записи считаются DD-таблицы и пар (board_analysis.py,
+пул процессов) — импорт ждёт их окончания.
+База — как у бота: BRIDGEIT_DB или --db.
+
+Колонки CSV (заголовок обязателен, разделитель , ; или таб, регистр не важен):
+    board, table, ns, ew, contract, declarer, tricks [, round] [, score]
+(и синонимы: board_number, доска, стол, pair_ns, by, played_by, result, …)
+tricks — число взяток или =, +1, -2; score (очки NS), если есть, сверяется с контрактом.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import csv
+import sys
+import time
+import xml.etree.ElementTree as ET
+from dataclasses import replace
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from board_analysis import BoardRow, board_zone, check_deal, parse_pbn
+from results import DB_URL, ResultEntry, ResultsService, parse_result_line
+from scoring import score_ns
+
+# ──────────── настройки ────────────
+CHUNK = 1000
+SHOW_ERRORS = 20
+IMPORT_TG_USER = 0          # технический пользователь импорта (users.tg_user_id)
+
+COLUMN_ALIASES = {
+    "board": ("board", "board_number", "board_no", "доска"),
+    "table": ("table", "table_number", "table_no", "стол"),
+    "ns": ("ns", "ns_pair", "pair_ns", "pair_ns_number", "ns_pair_number"),
+    "ew": ("ew", "ew_pair", "pair_ew", "pair_ew_number", "ew_pair_number"),
+    "contract": ("contract", "контракт"),
+    "declarer": ("declarer", "by", "played_by", "разыгрывающий"),
+    "tricks": ("tricks", "result_tricks", "result", "взятки"),
+    "round": ("round", "round_number", "раунд"),
+    "score": ("score", "score_ns", "ns_score", "очки"),
+}
+
+Record = Dict[str, str]
+
+
+# ──────────── чтение ────────────
+def read_csv(path: Path) -> Iterator[Tuple[int, Record]]:
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        sample = f.read(4096)
+        f.seek(0)
+        try:
+            dialect = csv.Sniffer().sniff(sample, delimiters=",;\t")
+        except csv.Error:
+            dialect = csv.excel
+        reader = csv.DictReader(f, dialect=dialect)
+        mapping = _map_columns(reader.fieldnames or [])
+        for rec in reader:
+            yield reader.line_num, {k: (rec.get(col) or "").strip() for k, col in mapping.items()}
+
+
+def _map_columns(fields: List[str]) -> Dict[str, str]:
+    norm = {f.strip().lower(): f for f in fields if f}
+    mapping = {}
+    for key, aliases in COLUMN_ALIASES.items():
+        col = next((norm[a] for a in aliases if a in norm), None)
+        if col is not None:
+            mapping[key] = col
+    missing = [k for k in ("board", "table", "ns", "ew", "contract") if k not in mapping]
+    if missing:
+        raise SystemExit(f"в заголовке CSV нет колонок: {', '.join(missing)}")
+    return mapping
+
+
+USEBIO_FIELDS = {"NS_PAIR_NUMBER": "ns", "EW_PAIR_NUMBER": "ew", "CONTRACT": "contract",
+                 "PLAYED_BY": "declarer", "TRICKS": "tricks", "SCORE": "score",
+                 "ROUND": "round", "ROUND_NUMBER": "round", "TABLE": "table", "TABLE_NUMBER": "table"}
+
+
+def read_usebio(path: Path) -> Iterator[Tuple[int, Record]]:
+    """<BOARD><BOARD_NUMBER>…<TRAVELLER_LINE>…</TRAVELLER_LINE></BOARD>; без TABLE стол = номер строки доски."""
+    board, line_no, n = "", 0, 0
+    for event, el in ET.iterparse(path, events=("start", "end")):
+        tag = el.tag.upper()
+        if event == "start":
+            if tag == "BOARD":
+                board, line_no = "", 0
+            continue
+        if tag == "BOARD_NUMBER":
+            board = (el.text or "").strip()
+        elif tag == "TRAVELLER_LINE":
+            n += 1
+            line_no += 1
+            rec = {"board": board, "table": str(line_no)}
+            for child in el:
+                key = USEBIO_FIELDS.get(child.tag.upper())
+                if key:
+                    rec[key] = (child.text or "").strip()
+            rec["score"] = rec.get("score", "").replace("+", "")
+            el.clear()
+            yield n, rec
+        elif tag == "BOARD":
+            el.clear()
+
+
+def read_pbn(path: Path) -> Iterator[BoardRow]:
+    """Сдачи из PBN-файла: (доска, deal, сдающий, зона)."""
+    with open(path, encoding="utf-8-sig", errors="replace") as f:
+        yield from parse_pbn(f)
+
+
+# ──────────── проверка строки ────────────
+def to_entry(tid: int, rec: Record, zones: Optional[Dict[int, Tuple[bool, bool]]] = None) -> ResultEntry:
+    """Строка CSV/USEBIO → запись; zones — зоны сдач турнира (нет доски — по номеру)."""
+    contract = rec.get("contract", "").replace("*", "X").replace(" ", "") or "PASS"
+    parts = [rec.get("board", ""), rec.get("table", ""), rec.get("ns", ""), rec.get("ew", ""), contract]
+    if contract.upper() not in ("PASS", "P", "-", "ПАС"):
+        parts += [rec.get("declarer", ""), rec.get("tricks", "")]
+    parts.append(rec.get("round", ""))
+    e = parse_result_line(tid, " ".join(parts))
+    e = replace(e, score_ns=score_ns(e.contract, e.declarer, e.tricks, e.board, (zones or {}).get(e.board)))
+    given = rec.get("score", "")
+    if given and given.lstrip("-").isdigit() and int(given) != e.score_ns:
+        raise ValueError(f"очки {given} не сходятся с контрактом ({e.score_ns:+d})")
+    return e
+
+
+# ──────────── импорт ────────────
+class Importer:
+    def __init__(self, service: ResultsService | None, tid: int, user_id: int, chunk: int,
+                 zones: Optional[Dict[int, Tuple[bool, bool]]] = None):
+        self.service = service          # None — dry-run
+        self.tid = tid
+        self.zones = zones or {}
+        self.user_id = user_id
+        self.chunk = chunk
+        self.ok = 0
+        self.duplicates = 0
+        self.errors: List[Tuple[int, str]] = []
+        self._pending: Dict[Tuple[int, int], Tuple[int, ResultEntry]] = {}
+        self.t0 = time.perf_counter()
+
+    async def feed(self, rows: Iterator[Tuple[int, Record]]) -> None:
+        for line, rec in rows:
+            try:
+                e = to_entry(self.tid, rec, self.zones)
+            except ValueError as err:
+                self.errors.append((line, str(err)))
+                continue
+            key = (e.board, e.table)
+            if key in self._pending:        # в одной пачке ключ должен встречаться один раз
+                self.duplicates += 1
+            self._pending[key] = (line, e)
+            if len(self._pending) >= self.chunk:
+                await self.flush()
+        await self.flush()
+
+    async def flush(self) -> None:
+        batch, self._pending = list(self._pending.values()), {}
+        if not batch:
+            return
+        if self.service is not None:
+            try:
+                await self.service.import_results([e for _, e in batch], self.user_id)
+            except Exception:
+                for line, e in batch:       # ищем виноватые строки
+                    try:
+                        await self.service.import_results([e], self.user_id)
+                    except Exception as err:
+                        self.errors.append((line, f"база: {err}"))
+                    else:
+                        self.ok += 1
+                self._progress()
+                return
+        self.ok += len(batch)
+        self._progress()
+
+    def rate(self) -> float:
+        return self.ok / max(time.perf_counter() - self.t0, 1e-9)
+
+    def _progress(self) -> None:
+        print(f"  {self.ok} строк, {self.rate():.0f} строк/с", file=sys.stderr)
+
+
+async def run(args) -> int:
+    service = None if args.dry_run and not args.tournament else ResultsService(args.db)
+    if service is not None:
+        await service.start()
+    try:
+        tid = args.tournament or 0
+        user_id = 0
+        if service is not None:
+            # в dry-run база только читается: пользователя не заводим
+            user_id = await service.find_user(args.user, "import", create=not args.dry_run) or 0
+            if args.new and not args.dry_run:
+                tid = (await service.create_tournament(args.new, user_id))["id"]
+                print(f"создан турнир {tid}: {args.new}")
+            elif await service.tournament(tid) is None:
+                print(f"турнира {tid} нет")
+                return 2
+
+        writer = None if args.dry_run else service
+        status = 0
+        if args.boards:
+            status |= await import_boards(writer, tid, args.boards)
+        if args.results:
+            fmt = args.format or ("usebio" if args.results.suffix.lower() == ".xml" else "csv")
+            rows = read_usebio(args.results) if fmt == "usebio" else read_csv(args.results)
+            # зоны — из загруженных сдач турнира и из --boards (в dry-run он в базу не попал)
+            zones = await service.board_zones(tid) if service is not None and tid else {}
+            if args.boards:
+                zones.update((b, board_zone(b, vul)) for b, _, _, vul in read_pbn(args.boards) if b > 0)
+            imp = Importer(writer, tid, user_id, args.chunk, zones)
+            await imp.feed(rows)
+            elapsed = time.perf_counter() - imp.t0
+            print(f"{'проверено' if args.dry_run else 'записано'} {imp.ok} строк за {elapsed:.2f} с "
+                  f"({imp.rate():.0f} строк/с), ошибок {len(imp.errors)}, повторов в пачке {imp.duplicates}")
+            for line, msg in imp.errors[:SHOW_ERRORS]:
+                print(f"  строка {line}: {msg}")
+            if len(imp.errors) > SHOW_ERRORS:
+                print(f"  … ещё {len(imp.errors) - SHOW_ERRORS}")
+            if args.errors and imp.errors:
+                with open(args.errors, "w", newline="", encoding="utf-8") as f:
+                    csv.writer(f).writerows([("line", "error"), *imp.errors])
+            if writer is not None and imp.ok:
+                t0 = time.perf_counter()
+                await service.rebuild_standings(tid)
+                print(f"таблица пересчитана за {time.perf_counter() - t0:.2f} с")
+            status |= 1 if imp.errors else 0
+        return status
+    finally:
+        if service is not None:
+            await service.close()
+
+
+async def import_boards(service: ResultsService | None, tid: int, path: Path) -> int:
+    good, bad = [], 0
+    for board, deal, dealer, vul in read_pbn(path):
+        try:
+            if board <= 0:
+                raise ValueError("нет номера [Board]")
+            good.append((board, check_deal(deal), dealer, vul))
+        except ValueError as e:
+            bad += 1
+            print(f"  доска {board or '?'}: {e}")
+    print(f"сдач: {len(good)}{' (dry-run)' if service is None else ''}, с ошибками: {bad}")
+    if service is not None and good:
+        t0 = time.perf_counter()
+        analysis = await service.save_boards(tid, good)        # DD считается в пуле процессов
+        analysed = await analysis
+        print(f"DD и пар: {analysed} сдач за {time.perf_counter() - t0:.2f} с")
+    return 1 if bad else 0
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description="Импорт результатов (CSV/USEBIO) и сдач (PBN)")
+    ap.add_argument("results", nargs="?", type=Path, help="CSV или USEBIO XML")
+    who = ap.add_mutually_exclusive_group(required=True)
+    who.add_argument("--tournament", type=int, help="номер существующего турнира")
+    who.add_argument("--new", help="создать турнир с таким названием")
+    ap.add_argument("--boards", type=Path, help="PBN-файл со сдачами")
+    ap.add_argument("--format", choices=("csv", "usebio"))
+    ap.add_argument("--chunk", type=int, default=CHUNK, help="строк в одной транзакции")
+    ap.add_argument("--dry-run", action="store_true", help="только проверка, без записи")
+    ap.add_argument("--errors", type=Path, help="записать ошибочные строки в CSV")
+    ap.add_argument("--user", type=int, default=IMPORT_TG_USER, help="Telegram id автора импорта")
+    ap.add_argument("--db", default=DB_URL)
+    args = ap.parse_args(argv)
+    if not args.results and not args.boards:
+        ap.error("нужен файл результатов и/или --boards")
+    return asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
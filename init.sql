@@ -82,4 +82,59 @@ CREATE TABLE IF NOT EXISTS result_audit (
 CREATE INDEX IF NOT EXISTS idx_result_audit_by_tournament
   ON result_audit (tournament_id, edited_at DESC);
 
+-- Boards (сдачи турнира в PBN)
+CREATE TABLE IF NOT EXISTS boards (
+  tournament_id BIGINT NOT NULL REFERENCES tournaments(id) ON DELETE CASCADE,
+  board_number  INT NOT NULL,
+  pbn           TEXT NOT NULL,
+  dealer        TEXT,
+  vulnerable    TEXT,
+  dd            JSONB,           -- DD-таблица [масть C D H S NT][N E S W] → взятки (board_analysis.py)
+  par_score     INT,             -- пар, очки NS
+  par_contracts TEXT,            -- контракты пара через пробел: 4HN+1 4HS+1
+  analysed_at   TIMESTAMPTZ,
+  PRIMARY KEY (tournament_id, board_number)
+);
+-- базы, созданные до появления DD/пара
+ALTER TABLE boards ADD COLUMN IF NOT EXISTS dd JSONB;
+ALTER TABLE boards ADD COLUMN IF NOT EXISTS par_score INT;
+ALTER TABLE boards ADD COLUMN IF NOT EXISTS par_contracts TEXT;
+ALTER TABLE boards ADD COLUMN IF NOT EXISTS analysed_at TIMESTAMPTZ;
+
+-- Standings (итоги пар; пишет results.py по мере ввода, без агрегации при чтении)
+CREATE TABLE IF NOT EXISTS standings (
+  tournament_id BIGINT NOT NULL REFERENCES tournaments(id) ON DELETE CASCADE,
+  pair_number   INT NOT NULL,
+  boards        INT NOT NULL DEFAULT 0,
+  pct           DOUBLE PRECISION NOT NULL DEFAULT 0,
+  ximp          DOUBLE PRECISION NOT NULL DEFAULT 0,
+  butler        DOUBLE PRECISION NOT NULL DEFAULT 0,
+  updated_at    TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+  PRIMARY KEY (tournament_id, pair_number)
+);
+
+-- Чаты, которым бот присылает обновлённую таблицу
+CREATE TABLE IF NOT EXISTS standings_subscriptions (
+  tournament_id BIGINT NOT NULL REFERENCES tournaments(id) ON DELETE CASCADE,
+  chat_id       BIGINT NOT NULL,
+  message_id    BIGINT,
+  PRIMARY KEY (tournament_id, chat_id)
+);
+
+-- NOTIFY о каждой правке results: процессы бота досчитывают доску и обновляют standings
+CREATE OR REPLACE FUNCTION notify_result_change() RETURNS trigger AS $$
+BEGIN
+  PERFORM pg_notify('bridge_results', json_build_object(
+    'tournament_id', NEW.tournament_id,
+    'board_number',  NEW.board_number,
+    'table_number',  NEW.table_number)::text);
+  RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS results_notify ON results;
+CREATE TRIGGER results_notify
+  AFTER INSERT OR UPDATE ON results
+  FOR EACH ROW EXECUTE FUNCTION notify_result_change();
+
 COMMIT;
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+# leads.py — первый ход на вистах: все ходы для всех 20 контрактов (разыгрывающий × масть)
+"""
+Для каждой пары (масть, разыгрывающий) ход делает левый от разыгрывающего;
+DDS оценивает каждую карту первого хода — сколько взяток берёт защита.
+
+    • 20 позиций решаются пачками solve_all_boards (SolveAllBoards: DDS сам
+      раскидывает пачку по своим потокам); пачки — по мастям — уходят в пул
+      процессов board_analysis, event loop бота не ждёт и libdds в его
+      процессе не трогается;
+    • отчёт кэшируется по сдаче (LRU на LEADS_CACHE_SIZE сдач), одновременные
+      запросы одной сдачи ждут один расчёт.
+"""
+
+from __future__ import annotations
+
+import asyncio
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, List, Sequence, Tuple
+
+import board_analysis
+from logic import DDS_SECONDS
+from scoring import STRAINS
+import tracing
+
+# ──────────── настройки ────────────
+LEADS_CACHE_SIZE = 256
+HANDS = "NESW"
+RANKS = "AKQJT98765432"
+SUIT_ORDER = "SHDC"
+SUIT_ICONS = {"S": "♠", "H": "♥", "D": "♦", "C": "♣", "NT": "NT"}
+
+_cache: "OrderedDict[str, LeadReport]" = OrderedDict()
+_inflight: Dict[str, asyncio.Future] = {}
+
+
+# ──────────── результат ────────────
+@dataclass(frozen=True)
+class LeadLine:
+    strain: str                         # C D H S NT
+    declarer: str                       # N E S W
+    leader: str
+    tricks: Dict[str, int]              # карта «KH» → взятки защиты после этого хода
+
+    @property
+    def best(self) -> int:
+        return max(self.tricks.values())
+
+    def best_leads(self) -> List[str]:
+        top = self.best
+        return [c for c, t in self.tricks.items() if t == top]
+
+
+@dataclass(frozen=True)
+class LeadReport:
+    lines: Tuple[LeadLine, ...]         # в порядке разыгрывающий N E S W × масть STRAINS
+
+    def line(self, strain: str, declarer: str) -> LeadLine:
+        return next(ln for ln in self.lines if ln.strain == strain and ln.declarer == declarer)
+
+
+# ──────────── расчёт (в процессах пула) ────────────
+def solve_leads(pbn: str, strains: Sequence[str]) -> List[LeadLine]:
+    """Все ходы для масти × 4 разыгрывающих — один solve_all_boards на пачку."""
+    from endplay.dds import solve_all_boards
+    from endplay.types import Deal, Denom, Player
+
+    denoms = dict(zip(STRAINS, (Denom.clubs, Denom.diamonds, Denom.hearts, Denom.spades, Denom.nt)))
+    players = (Player.north, Player.east, Player.south, Player.west)
+    configs, deals = [], []
+    for strain in strains:
+        for decl in HANDS:
+            deal = Deal(pbn)
+            deal.trump = denoms[strain]
+            deal.first = players[HANDS.index(decl)].lho
+            configs.append((strain, decl))
+            deals.append(deal)
+    out = []
+    for (strain, decl), solved in zip(configs, solve_all_boards(deals)):
+        tricks = {card.rank.abbr + SUIT_ORDER[int(card.suit)]: int(t) for card, t in solved}
+        out.append(LeadLine(strain, decl, HANDS[(HANDS.index(decl) + 1) % 4], tricks))
+    return out
+
+
+async def opening_leads(pbn: str) -> LeadReport:
+    """Отчёт по сдаче: из кэша или одним параллельным расчётом (повторные запросы ждут его)."""
+    rep = _cache.get(pbn)
+    if rep is not None:
+        _cache.move_to_end(pbn)
+        return rep
+    fut = _inflight.get(pbn)
+    if fut is not None:
+        return await asyncio.shield(fut)
+    fut = _inflight[pbn] = asyncio.get_running_loop().create_future()
+    try:
+        with DDS_SECONDS.time("opening_leads"), tracing.span("dds.opening_leads"):
+            rep = await _solve(pbn)
+    except Exception as e:
+        fut.set_exception(e)
+        fut.exception()             # ожидающих может не быть — не ругаться «never retrieved»
+        raise
+    except BaseException:
+        fut.cancel()
+        raise
+    finally:
+        del _inflight[pbn]
+    fut.set_result(rep)
+    _cache[pbn] = rep
+    if len(_cache) > LEADS_CACHE_SIZE:
+        _cache.popitem(last=False)
+    return rep
+
+
+async def _solve(pbn: str) -> LeadReport:
+    loop = asyncio.get_running_loop()
+    pool = board_analysis.executor()
+    groups = min(board_analysis.DD_WORKERS, len(STRAINS))
+    parts = [STRAINS[i::groups] for i in range(groups)]
+    done = await asyncio.gather(*(loop.run_in_executor(pool, solve_leads, pbn, p) for p in parts))
+    by_key = {(ln.strain, ln.declarer): ln for part in done for ln in part}
+    return LeadReport(tuple(by_key[(s, d)] for d in HANDS for s in STRAINS))
+
+
+# ──────────── показ ────────────
+def _group(cards: Sequence[str]) -> str:
+    """['KH', 'QH', 'AC'] → '♥KQ ♣A'."""
+    by_suit: Dict[str, List[str]] = {}
+    for c in cards:
+        by_suit.setdefault(c[1], []).append(c[0])
+    return " ".join(SUIT_ICONS[s] + "".join(sorted(by_suit[s], key=RANKS.index))
+                    for s in SUIT_ORDER if s in by_suit)
+
+
+def format_leads(rep: LeadReport) -> str:
+    """Таблица: по разыгрывающему — для каждой масти взятки защиты и все лучшие (равные) ходы."""
+    lines = ["Первый ход — взятки защиты и все лучшие (равные) ходы"]
+    for decl in HANDS:
+        lead = rep.line(STRAINS[0], decl).leader
+        lines += ["", f"Разыгрывает {decl}, ходит {lead}:"]
+        for strain in STRAINS:
+            ln = rep.line(strain, decl)
+            best = ln.best_leads()
+            text = "любой" if len(best) == len(ln.tricks) else _group(best)
+            lines.append(f"{SUIT_ICONS[strain]:>2} {ln.best:>2}  {text}")
+    return "\n".join(lines)
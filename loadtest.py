@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+# loadtest.py — нагрузочный прогон настоящего bot.py против fake_telegram.py
+"""
+Запуск:
+    python loadtest.py --users 200                     # 200 пользователей одновременно
+    python loadtest.py --users 500 --ramp 10 --think 0.2 --api-latency 0.03
+    python loadtest.py --users 50 --photo-share 0.2    # часть пользователей шлёт фото (нужны веса модели)
+
+Каждый виртуальный пользователь проходит сценарий:
+/start → «PBN» → ввод PBN → принять → контракт → первый ход → несколько карт →
+функции → подсветка → карта с подсветкой → функции → доиграть до конца (либо вместо PBN — фото из img/test).
+Шаг считается выполненным, когда бот ответил (send/edit) и на актуальном окне
+появилась кнопка для следующего шага. Бот работает в этом же процессе:
+Application из bot.build_application(), getUpdates — long polling к фейковому API.
+Состояние бота (лимиты, img/) пишется во временный каталог, репозиторий не трогается.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from fake_telegram import FakeBotApi
+
+# ──────────── настройки ────────────
+STEP_TIMEOUT = 60.0          # шаг без ответа дольше — считаем ошибкой и бросаем сценарий
+PHOTO_STEP_TIMEOUT = 300.0
+CARDS_TO_PLAY = 4
+USER_ID_BASE = 10_000_000
+REPO = Path(__file__).resolve().parent
+
+
+def _pct(data: List[float], q: float) -> float:
+    data = sorted(data)
+    return data[min(len(data) - 1, int(q * (len(data) - 1) + 0.5))] if data else 0.0
+
+
+# ──────────── виртуальный пользователь ────────────
+class VirtualUser:
+    def __init__(self, api: FakeBotApi, uid: int, loop: asyncio.AbstractEventLoop):
+        self.api = api
+        self.uid = uid
+        self.loop = loop
+        self.markups: Dict[int, dict] = {}      # message_id → inline-клавиатура
+        self.active: Optional[int] = None       # последнее сообщение с клавиатурой
+        self.responses = 0
+        self._changed = asyncio.Event()
+        api.listen(uid, lambda ev: loop.call_soon_threadsafe(self._on_event, ev))
+
+    def _on_event(self, ev: dict) -> None:
+        self.responses += 1
+        mid, markup = ev["message_id"], ev["reply_markup"]
+        if markup:
+            self.markups[mid] = markup
+            if ev["method"] in ("sendMessage", "sendPhoto") or mid == self.active or self.active is None:
+                self.active = mid
+        else:
+            self.markups.pop(mid, None)
+        self._changed.set()
+
+    def buttons(self) -> List[str]:
+        kb = self.markups.get(self.active) or {}
+        return [b.get("callback_data", "") for row in kb.get("inline_keyboard", []) for b in row]
+
+    def find(self, prefix: str) -> Optional[str]:
+        opts = [d for d in self.buttons() if d.startswith(prefix)]
+        return random.choice(opts) if opts else None
+
+    async def wait_for(self, seen: int, expect: Optional[str], timeout: float) -> bool:
+        """Ждём хотя бы один ответ после seen и (если задано) кнопку expect на активном окне."""
+        deadline = time.perf_counter() + timeout
+        while True:
+            if self.responses > seen and (expect is None or self.find(expect)):
+                return True
+            left = deadline - time.perf_counter()
+            if left <= 0:
+                return False
+            self._changed.clear()
+            try:
+                await asyncio.wait_for(self._changed.wait(), left)
+            except asyncio.TimeoutError:
+                return False
+
+
+def scenario(pbn: str, photo: Optional[bytes]) -> List[Tuple[str, str, object]]:
+    """
+    [(имя шага, действие, аргумент)]; действие: text / photo / press (префикс callback_data)
+    или expect — последний шаг ждёт появления кнопки, но не нажимает её.
+    """
+    steps: List[Tuple[str, str, object]] = [("start", "text", "/start")]
+    if photo is not None:
+        # распознанный расклад бывает неполным — дальше «принять» не ведёт к контракту,
+        # поэтому фото-сценарий заканчивается готовым результатом (кнопка «принять»)
+        return steps + [("menu_photo", "press", "input_photo"), ("photo_input", "photo", photo),
+                        ("result", "expect", "accept_result")]
+    steps += [("menu_pbn", "press", "input_pbn"), ("pbn_input", "text", pbn)]
+    steps += [("accept", "press", "accept_result"),
+              ("denom", "press", "denom_"),
+              ("first", "press", "first_")]
+    steps += [("play_card", "press", "play_")] * CARDS_TO_PLAY
+    # подсветка возвращает клавиатуру карт — ходим с подсветкой и снова в функции
+    steps += [("toggle", "press", "act_toggle"),
+              ("highlight", "press", "act_highlight"),
+              ("play_card_hl", "press", "play_"),
+              ("toggle", "press", "act_toggle"),
+              ("play_to_end", "press", "act_playtoend")]
+    return steps
+
+
+async def run_user(user: VirtualUser, steps, think: float, lat: Dict[str, List[float]],
+                   errors: Dict[str, int]) -> bool:
+    for i, (name, action, arg) in enumerate(steps):
+        if action == "expect":      # маркер: только ожидание кнопки, учтено предыдущим шагом
+            continue
+        nxt = steps[i + 1] if i + 1 < len(steps) else None
+        expect = nxt[2] if nxt and nxt[1] in ("press", "expect") else None
+        seen = user.responses
+        t0 = time.perf_counter()
+        if action == "text":
+            user.api.push_text(user.uid, arg)
+        elif action == "photo":
+            user.api.push_photo(user.uid, arg)
+        else:
+            data = user.find(arg)
+            if data is None or user.active is None:
+                errors[name] += 1
+                return False
+            user.api.push_callback(user.uid, user.active, data)
+        timeout = PHOTO_STEP_TIMEOUT if action == "photo" else STEP_TIMEOUT
+        if not await user.wait_for(seen, expect, timeout):
+            errors[name] += 1
+            return False
+        lat[name].append(time.perf_counter() - t0)
+        if think:
+            await asyncio.sleep(random.uniform(0, 2 * think))
+    return True
+
+
+# ──────────── прогон ────────────
+async def run(args) -> dict:
+    api = FakeBotApi(latency=args.api_latency).start()
+    os.environ["TELEGRAM_API_URL"] = api.api_url
+    os.environ["TELEGRAM_FILE_URL"] = api.file_url
+    if args.photo_share <= 0:
+        os.environ.setdefault("BRIDGEIT_PHOTO", "0")
+
+    import bot                  # после настройки окружения: URL читаются при импорте
+    import tracing
+    from bench_logic import make_corpus
+    from metrics import REGISTRY
+
+    if args.trace:
+        tracing.setup(str(args.trace))
+
+    app = bot.build_application()
+    await app.initialize()
+    await app.post_init(app)
+    await app.updater.start_polling(poll_interval=0.0, timeout=10)
+    await app.start()
+
+    rnd = random.Random(args.seed)
+    photos = [p.read_bytes() for p in sorted((REPO / "img/test").glob("*.jp*g"))
+              if "_annotated" not in p.stem]
+    corpus = make_corpus(args.users, args.seed)
+    loop = asyncio.get_running_loop()
+    lat: Dict[str, List[float]] = defaultdict(list)
+    errors: Dict[str, int] = defaultdict(int)
+
+    async def one(i: int) -> bool:
+        if args.ramp:
+            await asyncio.sleep(args.ramp * i / args.users)
+        user = VirtualUser(api, USER_ID_BASE + i, loop)
+        photo = rnd.choice(photos) if photos and rnd.random() < args.photo_share else None
+        return await run_user(user, scenario(corpus[i][0], photo), args.think, lat, errors)
+
+    t0 = time.perf_counter()
+    done = await asyncio.gather(*(one(i) for i in range(args.users)))
+    wall = time.perf_counter() - t0
+
+    await bot.outbox.flush()        # даём outbox дослать хвост правок
+    await app.updater.stop()
+    await app.stop()
+    await app.post_shutdown(app)
+    await app.shutdown()
+    api.stop()
+    tracing.shutdown()
+
+    steps_total = sum(len(v) for v in lat.values())
+    handler_hist = REGISTRY.get("bot_handler_seconds")
+    return {
+        "users": args.users, "completed": sum(done), "seconds": wall,
+        "steps": steps_total, "steps_per_sec": steps_total / wall if wall else 0.0,
+        "errors": dict(errors),
+        "steps_latency": {
+            name: {"n": len(v), "p50": _pct(v, .5), "p95": _pct(v, .95),
+                   "p99": _pct(v, .99), "max": max(v)}
+            for name, v in lat.items()},
+        "handlers": {
+            lbl[0]: {"n": handler_hist.count(*lbl),
+                     "mean": handler_hist.total(*lbl) / max(1, handler_hist.count(*lbl)),
+                     "p50": handler_hist.percentile(.5, *lbl), "p95": handler_hist.percentile(.95, *lbl),
+                     "p99": handler_hist.percentile(.99, *lbl)}
+            for lbl in handler_hist.label_sets()},
+        "api_calls": dict(api.calls.most_common()),
+        "outbox": dict(bot.outbox.stats),
+    }
+
+
+def report(res: dict) -> None:
+    print(f"\nпользователей {res['users']}, дошли до конца {res['completed']}, "
+          f"{res['seconds']:.1f} с, шагов {res['steps']} ({res['steps_per_sec']:.1f}/с)")
+    if res["errors"]:
+        print("ошибки/таймауты по шагам:", res["errors"])
+    print(f"\n{'шаг (глазами пользователя)':<28}{'n':>6}{'p50':>9}{'p95':>9}{'p99':>9}{'max':>9}  мс")
+    for name, st in res["steps_latency"].items():
+        print(f"{name:<28}{st['n']:>6}" + "".join(f"{st[k] * 1000:>9.1f}" for k in ("p50", "p95", "p99", "max")))
+    print(f"\n{'хендлер':<28}{'n':>6}{'mean':>9}{'p50':>9}{'p95':>9}{'p99':>9}  мс")
+    for name, st in sorted(res["handlers"].items(), key=lambda kv: -kv[1]["n"]):
+        print(f"{name:<28}{st['n']:>6}{st['mean'] * 1000:>9.1f}"
+              + "".join(f"{(st[k] or 0) * 1000:>9.1f}" for k in ("p50", "p95", "p99")))
+    print("\nвызовы API:", ", ".join(f"{k} {v}" for k, v in res["api_calls"].items()))
+    print("outbox:", res["outbox"])
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description="Нагрузочный прогон bot.py против фейкового Bot API")
+    ap.add_argument("--users", type=int, default=100)
+    ap.add_argument("--ramp", type=float, default=0.0, help="за сколько секунд подключить всех")
+    ap.add_argument("--think", type=float, default=0.0, help="средняя пауза между действиями, с")
+    ap.add_argument("--api-latency", type=float, default=0.0, help="задержка ответа фейкового API, с")
+    ap.add_argument("--photo-share", type=float, default=0.0, help="доля пользователей с фото")
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--json", type=Path)
+    ap.add_argument("--trace", type=Path, help="писать трассы в JSONL (разбор: python tracing.py FILE)")
+    args = ap.parse_args(argv)
+    if args.trace:
+        args.trace = args.trace.resolve()
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    if args.photo_share > 0 and not (REPO / "yolov8s_playing_cards.pt").exists():
+        print("нет весов модели — сценарий с фото недоступен, запускаю только PBN")
+        args.photo_share = 0.0
+
+    workdir = Path(tempfile.mkdtemp(prefix="bridgeit-load-"))
+    model = REPO / "yolov8s_playing_cards.pt"
+    if model.exists():
+        (workdir / model.name).symlink_to(model)
+    sys.path.insert(0, str(REPO))
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        res = asyncio.run(run(args))
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+    report(res)
+    if args.json:
+        args.json.write_text(json.dumps(res, ensure_ascii=False, indent=1), encoding="utf-8")
+    return 0 if res["completed"] == res["users"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -4,11 +4,15 @@
 from __future__ import annotations
 
 import re
-from typing import Dict, List, Tuple
+from typing import Callable, Dict, List, Tuple, TypeVar
 
 from endplay.types import Deal, Player, Denom, Card
-from endplay.dds.ddtable import calc_dd_table
-from endplay.dds.solve import solve_board
+
+from metrics import Counter, Histogram
+from par import analyse as analyse_par, format_report
+from scoring import STRAINS
+import dds_service
+import tracing
 
 # ─────────── константы ───────────
 PLAYER_MAP: Dict[str, Player] = {p.abbr: p for p in Player}
@@ -32,10 +36,44 @@ ICON2LTR = {v: k for k, v in SUIT_ICONS.items()}
 #     ICON2LTR[icon] = ltr
 #     ICON2LTR[icon.replace("\ufe0f", "")] = ltr
 RANKS = "AKQJT98765432"
+DD_DENOMS = (Denom.clubs, Denom.diamonds, Denom.hearts, Denom.spades, Denom.nt)   # порядок STRAINS
 ZWS = " "
+VARIATIONS_SHOWN = 20           # строк в списке вариантов
+
+T = TypeVar("T")
+
+DDS_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+DDS_SECONDS = Histogram("dds_call_seconds", "Вызовы DDS по методам BridgeLogic",
+                        ("method",), DDS_BUCKETS)
+CACHE_LOOKUPS = Counter("logic_cache_lookups_total", "Обращения к кэшу позиции",
+                        ("key", "result"))
 
 
 # ─────────── утилиты ───────────
+# Обёртки DDS: замер по методу BridgeLogic. При BRIDGEIT_DDS_SOCKET позицию
+# решает dds_service (общий кэш, отдельные процессы), иначе — libdds в процессе;
+# он подгружается при первом анализе, а не при импорте — разбор PBN и показ руки без него.
+def _dds_solve(method: str, deal: Deal) -> list:
+    """solve_board с замером: method — какой метод BridgeLogic спрашивает."""
+    with DDS_SECONDS.time(method), tracing.span("dds." + method):
+        res = dds_service.remote_solve(deal)
+        if res is not None:
+            return res
+        from endplay.dds.solve import solve_board
+        return list(solve_board(deal))
+
+
+def _dds_table(method: str, deal: Deal) -> Tuple[Tuple[int, ...], ...]:
+    """calc_dd_table → [масть C D H S NT][рука N E S W]."""
+    with DDS_SECONDS.time(method), tracing.span("dds." + method):
+        res = dds_service.remote_table(deal)
+        if res is not None:
+            return res
+        from endplay.dds.ddtable import calc_dd_table
+        dd = calc_dd_table(deal)
+        return tuple(tuple(int(dd[d, pl]) for pl in PLAYER_CW) for d in DD_DENOMS)
+
+
 def pbn_ok(pbn: str) -> str:
     return pbn.strip() if ":" in pbn.split()[0] else "N:" + pbn.strip()
 
@@ -129,6 +167,83 @@ def fmt_seq(seq: List[Tuple[Player, Card]]) -> str:
     return "  ".join(fmt_card_full(pl, c) for pl, c in seq)
 
 
+# ─────────── дерево вариантов ───────────
+class PlayNode:
+    """
+    Позиция в дереве вариантов — ход (рука, карта) от родителя.
+
+    Линии с общим началом делят его узлы: память растёт с числом разных
+    сыгранных ходов, а не с числом линий × их длину. На узле — кэш
+    производных позиции (легальные ходы, DD по картам, клавиатуры).
+    """
+    __slots__ = ("parent", "player", "card", "depth", "manual", "equal", "children", "last", "memo")
+
+    def __init__(self, parent: "PlayNode | None" = None, player: Player | None = None, card: Card | None = None):
+        self.parent = parent
+        self.player = player
+        self.card = card
+        self.depth = parent.depth + 1 if parent is not None else 0     # карт от начала
+        self.manual = False
+        self.equal = False
+        self.children: Dict[Card, PlayNode] = {}
+        self.last: PlayNode | None = None       # куда ходили отсюда последний раз — продолжение линии
+        self.memo: Dict[object, object] = {}
+
+    def child(self, player: Player, card: Card) -> "PlayNode":
+        node = self.children.get(card)
+        if node is None:
+            node = self.children[card] = PlayNode(self, player, card)
+        self.last = node
+        return node
+
+    def path(self) -> List["PlayNode"]:
+        """Узлы от первого хода до этого (корень не входит)."""
+        out = []
+        node = self
+        while node.parent is not None:
+            out.append(node)
+            node = node.parent
+        out.reverse()
+        return out
+
+    def line_end(self) -> "PlayNode":
+        """Конец линии через этот узел — по последним посещённым продолжениям."""
+        node = self
+        while node.last is not None:
+            node = node.last
+        return node
+
+    def leaves(self) -> List["PlayNode"]:
+        """Концы всех линий поддерева, в порядке появления ветвей."""
+        out, stack = [], [self]
+        while stack:
+            node = stack.pop()
+            if node.children:
+                stack.extend(reversed(list(node.children.values())))
+            else:
+                out.append(node)
+        return out
+
+    def common_ancestor(self, other: "PlayNode") -> "PlayNode":
+        a, b = self, other
+        while a.depth > b.depth:
+            a = a.parent
+        while b.depth > a.depth:
+            b = b.parent
+        while a is not b:
+            a, b = a.parent, b.parent
+        return a
+
+    def size(self) -> int:
+        """Число узлов поддерева (без самого узла)."""
+        total, stack = 0, [self]
+        while stack:
+            node = stack.pop()
+            total += len(node.children)
+            stack.extend(node.children.values())
+        return total
+
+
 # ─────────── основной класс ───────────
 class BridgeLogic:
     # ───── может быть ValueError ─────
@@ -151,10 +266,68 @@ class BridgeLogic:
         self._auto_plan: List[List[Tuple[Player, Card]]] = []
         self._auto_manual_flags: List[List[bool]] = []
         self._auto_equal_flags: List[List[bool]] = []
+        # версия позиции: растёт при каждом изменении (ход, откат, контракт)
+        self.version = 0
+        # дерево вариантов: корень — исходная позиция; узел текущей позиции
+        # находится по сыгранной линии лениво, при первом обращении после хода
+        self._root = PlayNode()
+        self._node: PlayNode | None = self._root
+        # DD-таблица исходной сдачи от позиции не зависит — считается один раз
+        self._dd_ref: Tuple[Tuple[int, ...], ...] | None = None
 
     def to_pbn(self) -> str:
         return self._pbn_str[2:]
 
+    @property
+    def initial_pbn(self) -> str:
+        """Исходная сдача («N:…») — ключ кэшей анализа всей сдачи."""
+        return self._orig_pbn
+
+    # ───── кэш производных от позиции ─────
+    def _bump(self) -> None:
+        """Позиция изменилась — узел дерева (и его кэш) найдётся заново по линии."""
+        self.version += 1
+        self._node = None
+
+    def _played(self) -> List[Tuple[Player, Card, bool, bool]]:
+        """Сыгранная линия по картам: (рука, карта, ручной ход, ход равен лучшему по DD)."""
+        out = []
+        for tricks, mflags, eqflags in ((self._trick_history, self._trick_manual_flags, self._trick_equal_flags),
+                                        (self._auto_plan, self._auto_manual_flags, self._auto_equal_flags),
+                                        ([self._current], [self._current_manual], [self._current_equal])):
+            for i, seq in enumerate(tricks):
+                mfl = mflags[i] if i < len(mflags) else []
+                eqfl = eqflags[i] if i < len(eqflags) else []
+                for j, (pl, c) in enumerate(seq):
+                    out.append((pl, c, j < len(mfl) and mfl[j], j < len(eqfl) and eqfl[j]))
+        return out
+
+    def _position(self) -> PlayNode:
+        """Узел текущей позиции; недостающие ходы линии добавляются в дерево."""
+        if self._node is None:
+            node = self._root
+            for pl, c, manual, equal in self._played():
+                node = node.child(pl, c)
+                node.manual, node.equal = manual, equal
+            self._node = node
+        return self._node
+
+    def cached(self, key, factory: Callable[[], T]) -> T:
+        """
+        Значение factory(), запомненное на узле текущей позиции: вернувшись
+        в позицию по другой линии, получаем его без пересчёта. Используется и снаружи (бот кэширует так готовые клавиатуры).
+        """
+        kind = key if isinstance(key, str) else str(key[0])
+        memo = self._position().memo
+        try:
+            val = memo[key]
+        except KeyError:
+            CACHE_LOOKUPS.inc(kind, "miss")
+            val = memo[key] = factory()
+            return val
+        CACHE_LOOKUPS.inc(kind, "hit")
+        return val
+
     # ───── допустимые ходы текущего игрока ─────
     def legal_moves(self) -> list[str]:
         """
@@ -164,6 +337,9 @@ class BridgeLogic:
         Формат каждой карты — строка 'RankSuit', например 'AS', '3C'.
         Variation-selector U+FE0F, если он есть, удаляется.
         """
+        return list(self.cached("legal_moves", self._legal_moves))
+
+    def _legal_moves(self) -> list[str]:
         pl = self.current_player()
         if not self.deal[pl]:
             return []
@@ -189,6 +365,9 @@ class BridgeLogic:
 
     # ───── вывод рук + указатель хода ─────
     def display(self) -> str:
+        return self.cached("display", self._display)
+
+    def _display(self) -> str:
         suits = ("S", "H", "D", "C")
 
         def suit_line(pl, s):
@@ -272,34 +451,37 @@ class BridgeLogic:
         return "\n".join(lines)
 
     # ───── DD-таблица исходной сдачи ─────
-    # ───── DD-таблица исходной сдачи ─────
+    def dd_tricks(self) -> Tuple[Tuple[int, ...], ...] | None:
+        """
+        [масть C D H S NT][рука N E S W] → взятки; один вызов DDS на сдачу,
+        дальше — из памяти (и таблица, и пар). None — в сдаче не по 13 карт.
+        """
+        if self._dd_ref is None:
+            if not all(len(self._dd_ref_deal[p]) == 13 for p in Player):
+                return None
+            self._dd_ref = _dds_table("dd_table", self._dd_ref_deal)
+        return self._dd_ref
+
     def dd_table(self) -> str:
-        if not all(len(self._dd_ref_deal[p]) == 13 for p in Player):
+        dd = self.dd_tricks()
+        if dd is None:
             return "В исходной сдаче не по 13 карт — DDS недоступен."
 
-        dd = calc_dd_table(self._dd_ref_deal)
-
-        denoms = [Denom.clubs, Denom.diamonds, Denom.hearts,
-                  Denom.spades, Denom.nt]
-        icon = {Denom.clubs: "♣", Denom.diamonds: "♦", Denom.hearts: "♥",
-                Denom.spades: "♠", Denom.nt: "NT"}
-
-        lines: list[str] = []
-        header = " " + " ".join(f"{icon[d]:>2}" for d in denoms)
-        lines.append(ZWS + header)
-
+        icons = [SUIT_ICONS.get(s, s) for s in STRAINS]
+        lines: list[str] = [ZWS + " " + " ".join(f"{i:>2}" for i in icons)]
         for pl in (Player.north, Player.south, Player.east, Player.west):
-            vals = []
-            for d in denoms:
-                try:
-                    v = dd[d, pl]
-                except Exception:
-                    v = dd[pl, d]
-                vals.append(f"{v:>2}")
-            lines.append(f"{pl.abbr} " + " ".join(vals))
-
+            col = PLAYER_CW.index(pl)
+            lines.append(f"{pl.abbr} " + " ".join(f"{row[col]:>2}" for row in dd))
         return "\n".join(lines)
 
+    # ───── пар и выполняемые контракты ─────
+    def par_table(self, dealer: str = "N", vul: Tuple[bool, bool] = (False, False)) -> str:
+        """Пар, контракты по уровням и жертвы — по той же DD-таблице, без новых вызовов DDS."""
+        dd = self.dd_tricks()
+        if dd is None:
+            return "В исходной сдаче не по 13 карт — DDS недоступен."
+        return format_report(self.cached(("par", dealer, vul), lambda: analyse_par(dd, dealer, vul)))
+
     # ───── контракт ─────
     # ───── может быть ValueError ─────
     def set_contract(self, contract: str, first: str) -> str:
@@ -321,6 +503,8 @@ class BridgeLogic:
 
         self.deal.first = pl
         self.deal.trump = self.contract
+        self._root = PlayNode()         # DD по другой масти — прежние варианты не годятся
+        self._bump()
 
         return f"Задан контракт {contract.upper()}, первый ход у {pl.abbr}."
 
@@ -332,7 +516,7 @@ class BridgeLogic:
         if self.contract is None:
             raise RuntimeError("Сначала задайте контракт.")
         self.deal.trump = self.contract
-        return max(solve_board(self.deal), key=lambda ct: ct[1])[0]
+        return max(_dds_solve("optimal_move", self.deal), key=lambda ct: ct[1])[0]
 
     def show_move_options(self) -> str:
         """
@@ -354,7 +538,7 @@ class BridgeLogic:
             raise RuntimeError("Сначала задайте контракт.")
         self.deal.trump = self.contract
 
-        results = list(solve_board(self.deal))
+        results = _dds_solve("show_move_options", self.deal)
 
         lines: list[str] = [f"Анализ руки {self.deal.first.abbr}:"]
 
@@ -385,11 +569,15 @@ class BridgeLogic:
         после выхода этой картой.
 
         Требует предварительно заданного контракта.
+        Результат кэшируется до следующего изменения позиции.
         """
+        return dict(self.cached("move_options", self._move_options))
+
+    def _move_options(self) -> dict[str, int]:
         pl = self.current_player()
         if not self.deal[pl]:
             return {}
-        results = list(solve_board(self.deal))
+        results = _dds_solve("move_options", self.deal)
         return {f"{card_rank(c)}{card_suit(c)}": tricks for c, tricks in results}
 
     # ───── служебные проверки ─────
@@ -439,6 +627,7 @@ class BridgeLogic:
             self._current.clear()
             self._current_manual.clear()
             self._current_equal.clear()
+        self._bump()
         return msg
 
     # ───── может быть ValueError ─────
@@ -474,9 +663,11 @@ class BridgeLogic:
 
         self._trick_history.append(seq)
         self._trick_manual_flags.append([True, True, True, True])
+        self._trick_equal_flags.append([False, False, False, False])
 
         trump = None if self.contract is Denom.nt else self.contract
         self.deal.first = trick_winner(seq, trump)
+        self._bump()
 
         return f"Разыграна взятка: {fmt_seq(seq)}"
 
@@ -486,87 +677,78 @@ class BridgeLogic:
         if hasattr(self.deal, "_played"):
             self.deal._played.discard(card)
 
+    # ───── переходы по дереву вариантов ─────
+    def _unplay_node(self, node: PlayNode) -> None:
+        """Снимает ход узла со стола: позиция становится позицией его родителя."""
+        if node.depth % 4:
+            self.deal.unplay()
+            return
+        # ход закрыл взятку: карту — в руку, три первые карты взятки — обратно на стол
+        lead = node.parent.parent.parent
+        self._restore_card(node.player, node.card)
+        self.deal.first = lead.player
+        for n in (lead, node.parent.parent, node.parent):
+            self.deal.play(n.card, from_hand=False)
+
+    def _switch(self, target: PlayNode) -> None:
+        """
+        Переход в узел дерева: ходы снимаются до общего предка и делаются
+        вниз до цели — без разбора PBN с начала и без вызовов DDS; флаги
+        ходов (ручной / равный лучшему) берутся из узлов.
+        """
+        node = self._position()
+        anc = node.common_ancestor(target)
+        while node is not anc:
+            self._unplay_node(node)
+            node = node.parent
+        trump = None if self.contract in (None, Denom.nt) else self.contract
+        line = target.path()
+        for n in line[anc.depth:]:
+            self.deal.play(n.card)
+            if n.depth % 4 == 0:
+                self.deal.first = trick_winner([(x.player, x.card) for x in line[n.depth - 4:n.depth]], trump)
+
+        for lst in (self._trick_history, self._trick_manual_flags, self._trick_equal_flags,
+                    self._auto_plan, self._auto_manual_flags, self._auto_equal_flags,
+                    self._current, self._current_manual, self._current_equal):
+            lst.clear()
+        full = len(line) - len(line) % 4
+        for i in range(0, full, 4):
+            trick = line[i:i + 4]
+            self._trick_history.append([(n.player, n.card) for n in trick])
+            self._trick_manual_flags.append([n.manual for n in trick])
+            self._trick_equal_flags.append([n.equal for n in trick])
+        for n in line[full:]:
+            self._current.append((n.player, n.card))
+            self._current_manual.append(n.manual)
+            self._current_equal.append(n.equal)
+        self._bump()
+        self._node = target
+        n = target
+        while n.parent is not None:             # линия цели — продолжение у всех её предков
+            n.parent.last = n
+            n = n.parent
+
     # ───── откат последней взятки ─────
     def undo_last_trick(self) -> str:
         if self._current:
             return "Сначала завершите текущую неполную взятку."
 
-        if self._auto_plan:
-            seq = self._auto_plan.pop()
-            self._auto_manual_flags.pop() if self._auto_manual_flags else None
-            self._auto_equal_flags.pop() if self._auto_equal_flags else None
-        elif self._trick_history:
-            seq = self._trick_history.pop()
-            self._trick_manual_flags.pop()
-            self._trick_equal_flags.pop()
-        else:
+        node = self._position()
+        if node.depth == 0:
             return "Нет информации о предыдущих взятках."
-
-        for pl, card in reversed(seq):
-            try:
-                self.deal.unplay()
-            except RuntimeError:
-                pass
-            self._restore_card(pl, card)
-
-        self.deal.first = seq[0][0]
+        # откатанная взятка остаётся в дереве вариантов
+        self._switch(node.parent.parent.parent.parent)
         return "Откатили последнюю взятку."
 
     # ───── отмена последнего хода (карты) ─────
     def undo_last_card(self) -> str:
-        if self._current:
-            pl, card = self._current.pop()
-            self._current_manual.pop()
-            self._current_equal.pop()
-            try:
-                self.deal.unplay()
-            except RuntimeError:
-                pass
-            self._restore_card(pl, card)
-            return f"Отменили ход: {pl.abbr}{card}"
-
-        if self._auto_plan:
-            seq = self._auto_plan.pop()
-            flags = self._auto_manual_flags.pop() if self._auto_manual_flags else [False] * len(seq)
-            eqfl = self._auto_equal_flags.pop() if self._auto_equal_flags else [False] * len(seq)
-        elif self._trick_history:
-            seq = self._trick_history.pop()
-            flags = self._trick_manual_flags.pop()
-            eqfl = self._trick_equal_flags.pop()
-        else:
+        node = self._position()
+        if node.parent is None:
             return "Нет предыдущих ходов для отмены."
-
-        for pl, card in reversed(seq):
-            try:
-                self.deal.unplay()
-            except RuntimeError:
-                pass
-            self._restore_card(pl, card)
-
-        self._current.clear()
-        self._current_manual.clear()
-        self._current_equal.clear()
-
-        if len(seq) > 1:
-            self.deal.first = seq[0][0]
-            for pl, card, fl in zip(
-                    (p for p, _ in seq[:-1]),
-                    (c for _, c in seq[:-1]),
-                    flags[:-1]):
-                eq_flag = False
-                if self.contract is not None:
-                    opts = self.move_options()  # до хода
-                    if opts:
-                        best = max(opts.values())
-                        code = f"{card_rank(card)}{card_suit(card)}"
-                        eq_flag = opts.get(code) == best
-                self.deal.play(card)  # сам ход
-                self._current.append((pl, card))
-                self._current_manual.append(fl)
-                self._current_equal.append(eq_flag)
-
-        pl_last, card_last = seq[-1]
-        return f"Отменили ход: {pl_last.abbr}{card_last}"
+        # отменённый ход остаётся в дереве вариантов — к нему можно вернуться
+        self._switch(node.parent)
+        return f"Отменили ход: {node.player.abbr}{node.card}"
 
     # ───── может быть ValueError ─────
     def goto_trick(self, no_: int) -> str:
@@ -677,6 +859,78 @@ class BridgeLogic:
             lines.append(f"{idx:2}: {seq}")
         return lines
 
+    # ───── варианты розыгрыша ─────
+    def variations(self) -> List[PlayNode]:
+        """Концы всех линий дерева вариантов (пусто — ещё не было ходов)."""
+        return [n for n in self._root.leaves() if n.depth]
+
+    # ───── может быть ValueError ─────
+    def switch_variation(self, no_: int) -> str:
+        """Переход в конец варианта no_ (нумерация show_variations) — без пересчёта с начала."""
+        leaves = self.variations()
+        if not 1 <= no_ <= len(leaves):
+            raise ValueError("Такого варианта нет.")
+        self._switch(leaves[no_ - 1])
+        return f"Перешли на вариант {no_}."
+
+    def show_variations(self) -> str:
+        """
+        Список вариантов: где вариант отходит от текущей линии, чем
+        (DD для стороны хода — из кэша узла развилки, если считался)
+        и сколько взяток сыграно в нём.
+        """
+        leaves = self.variations()
+        if not leaves:
+            return "Вариантов пока нет: сыграйте хотя бы одну карту."
+        unknown = 13 - self._start_len
+        trump = None if self.contract in (None, Denom.nt) else self.contract
+        main = self._position().line_end()
+
+        out = [f"Варианты розыгрыша (ходов в дереве: {self._root.size()}):", ""]
+        for no_, leaf in enumerate(leaves, 1):
+            if no_ > VARIATIONS_SHOWN:
+                out.append(f"… и ещё {len(leaves) - VARIATIONS_SHOWN}")
+                break
+            line = leaf.path()
+            ns = sum(trick_winner([(n.player, n.card) for n in line[i:i + 4]], trump) in (Player.north, Player.south)
+                     for i in range(0, len(line) - 3, 4))
+            last = fmt_card_full(leaf.player, leaf.card).replace(" ", "")
+            score = f"до {last}, взятки NS {ns} – EW {len(line) // 4 - ns}"
+            if leaf is main:
+                out.append(f"▶{no_:2}. текущая линия, {score}")
+                continue
+            fork = leaf.common_ancestor(main)
+            mine = line[fork.depth]
+            where = f"{unknown + fork.depth // 4 + 1}.{fork.depth % 4 + 1}"
+            text = fmt_card_full(mine.player, mine.card).replace(" ", "")
+            if main.depth > fork.depth:
+                other = main.path()[fork.depth]
+                text += f" вместо {fmt_card_full(other.player, other.card).replace(' ', '')}"
+                opts = fork.memo.get("move_options")
+                if opts:
+                    a = opts.get(f"{card_rank(mine.card)}{card_suit(mine.card)}", "?")
+                    b = opts.get(f"{card_rank(other.card)}{card_suit(other.card)}", "?")
+                    text += f" (DD {a} против {b})"
+            out.append(f"{no_:3}. {where}: {text} → {score}")
+        return "\n".join(out)
+
+    # ───── сыгранная линия для разбора ─────
+    def play_line(self) -> Tuple[str, int, List[Tuple[str, str]]]:
+        """
+        (масть STRAINS, число неизвестных ранних взяток, карты по порядку)
+        — карты парами ('W', 'HK'): рука и карта «масть+ранг», как в
+        endplay Card; включая автодоигрыш и неполную текущую взятку.
+        """
+        if self.contract is None:
+            raise ValueError("Контракт не задан.")
+        seqs: List[List[Tuple[Player, Card]]] = []
+        seqs.extend(self._trick_history)
+        seqs.extend(self._auto_plan)
+        if self._current:
+            seqs.append(self._current)
+        cards = [(pl.abbr, "SHDC"[int(c.suit)] + c.rank.abbr) for trick in seqs for pl, c in trick]
+        return STRAINS[DD_DENOMS.index(self.contract)], 13 - self._start_len, cards
+
     # ───── тихий откат автоплана ─────
     def _clear_auto(self):
         """Снимает автодоигрыш, возвращая карты в deal."""
@@ -688,6 +942,7 @@ class BridgeLogic:
         self._auto_plan.clear()
         self._auto_manual_flags.clear()
         self._auto_equal_flags.clear()
+        self._bump()
 
     # ───── доигрыш + план розыгрыша ─────
     def play_optimal_to_end(self) -> None:
@@ -734,6 +989,7 @@ class BridgeLogic:
             self._auto_equal_flags.append([False] * 4)
             self.deal.first = trick_winner(
                 trick, None if self.contract is Denom.nt else self.contract)
+        self._bump()
 
     def show_current_hand(self) -> str:
         """
@@ -772,71 +1028,16 @@ class BridgeLogic:
         if trick_no <= unknown:
             raise ValueError("Эти ранние взятки неизвестны – откат невозможен.")
 
-        full_tricks = (
-                self._trick_history
-                + self._auto_plan
-                + ([self._current.copy()] if self._current else [])
-        )
-        full_mflags = (
-                self._trick_manual_flags
-                + self._auto_manual_flags
-                + ([self._current_manual.copy()] if self._current else [])
-        )
-        full_eqflags = (
-                self._trick_equal_flags
-                + self._auto_equal_flags
-                + ([self._current_equal.copy()] if self._current else [])
-        )
-
+        line = self._position().path()
         idx = trick_no - unknown - 1
-        if idx >= len(full_tricks):
+        if idx * 4 >= len(line):
             raise ValueError("Такой взятки ещё нет.")
-
-        target_trick = full_tricks[idx]
-        target_mflags = full_mflags[idx] if idx < len(full_mflags) else []
-        target_eqflags = full_eqflags[idx] if idx < len(full_eqflags) else []
-
-        if card_no - 1 >= len(target_trick):
+        depth = idx * 4 + card_no - 1
+        if depth >= len(line):
             raise ValueError("Этой карты во взятке ещё нет.")
 
-        self.deal = Deal.from_pbn(self._orig_pbn)
-
-        self._trick_history.clear()
-        self._trick_manual_flags.clear()
-        self._trick_equal_flags.clear()
-        self._auto_plan.clear()
-        self._auto_manual_flags.clear()
-        self._auto_equal_flags.clear()
-        self._current.clear()
-        self._current_manual.clear()
-        self._current_equal.clear()
-
-        trump = None if self.contract in (None, Denom.nt) else self.contract
-
-        for i in range(idx):
-            seq = full_tricks[i]
-            mfl = full_mflags[i]
-            eqfl = full_eqflags[i]
-
-            self.deal.first = seq[0][0]
-            for _, c in seq:
-                self.deal.play(Card(str(c)))
-
-            self._trick_history.append(seq)
-            self._trick_manual_flags.append(mfl)
-            self._trick_equal_flags.append(eqfl)
-
-            self.deal.first = trick_winner(seq, trump)
-
-        self.deal.first = target_trick[0][0]
-
-        for j in range(card_no - 1):
-            pl, old_card = target_trick[j]
-            new_card = Card(str(old_card))
-            self.deal.play(new_card)
-            self._current.append((pl, new_card))
-            self._current_manual.append(target_mflags[j] if j < len(target_mflags) else False)
-            self._current_equal.append(target_eqflags[j] if j < len(target_eqflags) else False)
+        # позиция — предок текущей в дереве: дальнейшие ходы остаются вариантом
+        self._switch(line[depth - 1] if depth else self._root)
 
         return f"Откатились к взятке {trick_no}, карта {card_no}."
 
@@ -860,6 +1061,7 @@ class BridgeLogic:
         self._current.append((pl, card))
         self._current_manual.append(False)
         self._current_equal.append(False)
+        self._bump()
         msg = f"Оптимальный ход: {fmt_card_full(pl, card)}" if announce else ""
         if len(self._current) == 4:
             trump = None if self.contract is Denom.nt else self.contract
@@ -0,0 +1,287 @@
+#!/usr/bin/env python3
+# metrics.py — метрики процесса в формате Prometheus (/metrics)
+
+from __future__ import annotations
+
+import bisect
+import logging
+import os
+import resource
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Mapping, Sequence, Tuple, Union
+
+# ──────────── константы ────────────
+# секунды: от быстрых правок до тяжёлого распознавания
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+RECENT_WINDOW = 512         # сколько последних наблюдений держим для перцентилей
+
+log = logging.getLogger(__name__)
+
+LabelValues = Tuple[str, ...]
+# колбэк значения: число (метрика без меток) или {метки: значение}
+ValueFn = Callable[[], Union[float, Mapping[LabelValues, float]]]
+
+
+def _fmt_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _escape(v: str) -> str:
+    return str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _fmt_value(v: float) -> str:
+    if v == float("inf"):
+        return "+Inf"
+    return repr(float(v)) if isinstance(v, float) else str(v)
+
+
+# ──────────── реестр ────────────
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, "_Metric"] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Метрика {metric.name} уже зарегистрирована")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def get(self, name: str):
+        return self._metrics.get(name)
+
+    def render(self) -> str:
+        """Текстовый формат экспозиции Prometheus 0.0.4."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines: List[str] = []
+        for m in metrics:
+            try:
+                lines.extend(m.render())
+            except Exception as e:  # один сломанный колбэк не должен ронять весь /metrics
+                log.warning("Метрика %s не собрана: %s", m.name, e)
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+# ──────────── счётчик и датчик ────────────
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help_: str, labelnames: Sequence[str] = (),
+                 fn: ValueFn | None = None, registry: Registry | None = REGISTRY):
+        self.name = name
+        self.help = help_
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[LabelValues, float] = {}
+        self._fn = fn
+        self._lock = threading.Lock()
+        if registry is not None:
+            registry.register(self)
+
+    def set_function(self, fn: ValueFn | None) -> None:
+        """Значение считается при каждом опросе /metrics (очереди, RSS и т. п.)."""
+        self._fn = fn
+
+    def value(self, *labels: str) -> float:
+        return self._collect().get(labels, 0.0)
+
+    def _collect(self) -> Dict[LabelValues, float]:
+        if self._fn is not None:
+            v = self._fn()
+            return dict(v) if isinstance(v, Mapping) else {(): float(v)}
+        with self._lock:
+            return dict(self._values)
+
+    def render(self) -> List[str]:
+        out = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for labels, v in self._collect().items():
+            out.append(f"{self.name}{_fmt_labels(self.labelnames, labels)} {_fmt_value(float(v))}")
+        return out
+
+
+class Counter(_Metric):
+    """Монотонный счётчик: inc(*метки) или колбэк, отдающий накопленное значение."""
+
+    kind = "counter"
+
+    def inc(self, *labels: str, amount: float = 1.0) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+
+class Gauge(_Metric):
+    """Мгновенное значение: set()/inc()/dec() или колбэк."""
+
+    kind = "gauge"
+
+    def set(self, value: float, *labels: str) -> None:
+        with self._lock:
+            self._values[labels] = float(value)
+
+    def inc(self, *labels: str, amount: float = 1.0) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def dec(self, *labels: str, amount: float = 1.0) -> None:
+        self.inc(*labels, amount=-amount)
+
+
+# ──────────── гистограмма ────────────
+class _Timer:
+    __slots__ = ("hist", "labels", "t0")
+
+    def __init__(self, hist: "Histogram", labels: LabelValues):
+        self.hist = hist
+        self.labels = labels
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.hist.observe(time.perf_counter() - self.t0, *self.labels)
+        return False
+
+
+class _HistState:
+    __slots__ = ("counts", "sum", "count", "recent")
+
+    def __init__(self, n_buckets: int):
+        self.counts = [0] * (n_buckets + 1)   # последний — +Inf
+        self.sum = 0.0
+        self.count = 0
+        self.recent: deque = deque(maxlen=RECENT_WINDOW)
+
+
+class Histogram:
+    """
+    Гистограмма с метками. Кроме накопительных корзин для Prometheus
+    хранит скользящее окно последних наблюдений — для перцентилей в логах.
+    """
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help_: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS, registry: Registry | None = REGISTRY):
+        self.name = name
+        self.help = help_
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._states: Dict[LabelValues, _HistState] = {}
+        self._lock = threading.Lock()
+        if registry is not None:
+            registry.register(self)
+
+    def observe(self, value: float, *labels: str) -> None:
+        idx = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            st = self._states.get(labels)
+            if st is None:
+                st = self._states[labels] = _HistState(len(self.buckets))
+            st.counts[idx] += 1
+            st.sum += value
+            st.count += 1
+            st.recent.append(value)
+
+    def time(self, *labels: str) -> _Timer:
+        """with hist.time("label"): ... — замер wall-времени блока."""
+        return _Timer(self, labels)
+
+    def percentile(self, q: float, *labels: str) -> float | None:
+        """Перцентиль q (0..1) по скользящему окну; None — наблюдений нет."""
+        with self._lock:
+            st = self._states.get(labels)
+            data = sorted(st.recent) if st else []
+        if not data:
+            return None
+        k = min(len(data) - 1, max(0, round(q * (len(data) - 1))))
+        return data[k]
+
+    def count(self, *labels: str) -> int:
+        with self._lock:
+            st = self._states.get(labels)
+            return st.count if st else 0
+
+    def total(self, *labels: str) -> float:
+        """Сумма наблюдений (для среднего: total / count)."""
+        with self._lock:
+            st = self._states.get(labels)
+            return st.sum if st else 0.0
+
+    def label_sets(self) -> List[LabelValues]:
+        with self._lock:
+            return list(self._states)
+
+    def render(self) -> List[str]:
+        out = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = [(k, list(v.counts), v.sum, v.count) for k, v in self._states.items()]
+        for labels, counts, total, count in items:
+            acc = 0
+            for bound, c in zip(self.buckets + (float("inf"),), counts):
+                acc += c
+                le = 'le="' + _fmt_value(bound) + '"'
+                out.append(f"{self.name}_bucket{_fmt_labels(self.labelnames, labels, le)} {acc}")
+            out.append(f"{self.name}_sum{_fmt_labels(self.labelnames, labels)} {total!r}")
+            out.append(f"{self.name}_count{_fmt_labels(self.labelnames, labels)} {count}")
+        return out
+
+
+# ──────────── метрики процесса ────────────
+def rss_bytes() -> float:
+    """Текущий RSS из /proc; где его нет — пиковый из getrusage."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+PROCESS_RSS = Gauge("process_resident_memory_bytes", "Резидентная память процесса",
+                    fn=rss_bytes)
+PROCESS_CPU = Counter("process_cpu_seconds_total", "Процессорное время процесса (user+sys)",
+                      fn=lambda: sum(os.times()[:2]))
+_STARTED = time.time()
+PROCESS_START = Gauge("process_start_time_seconds", "Время запуска процесса (unix)",
+                      fn=lambda: _STARTED)
+
+
+# ──────────── HTTP-эндпоинт ────────────
+class _Handler(BaseHTTPRequestHandler):
+    registry: Registry = REGISTRY
+
+    def do_GET(self):
+        if self.path.split("?", 1)[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = self.registry.render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, fmt, *args):  # не засоряем лог бота каждым опросом
+        return
+
+
+def start_metrics_server(port: int, host: str = "127.0.0.1",
+                         registry: Registry = REGISTRY) -> ThreadingHTTPServer:
+    """Поднимает /metrics в фоновом потоке (только локальный интерфейс по умолчанию)."""
+    handler = type("MetricsHandler", (_Handler,), {"registry": registry})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    log.info("Метрики доступны на http://%s:%s/metrics", host, server.server_address[1])
+    return server
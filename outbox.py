@@ -0,0 +1,297 @@
+#!/usr/bin/env python3
+# outbox.py — планировщик исходящих запросов к Telegram
+
+from __future__ import annotations
+
+import asyncio
+import datetime
+import logging
+from collections import Counter, OrderedDict
+from dataclasses import dataclass, field
+from typing import Dict, Optional, Tuple
+
+from telegram import Bot, InlineKeyboardMarkup
+from telegram.error import BadRequest, Forbidden, RetryAfter, TelegramError
+
+import tracing
+
+# ──────────── константы ────────────
+LAST_SENT_LIMIT = 4096      # сколько последних состояний сообщений помним
+SEND_ATTEMPTS = 3           # сколько раз повторяем запрос после 429
+
+log = logging.getLogger(__name__)
+
+Key = Tuple[int, int]       # (chat_id, message_id)
+
+# результат правки, если сообщения больше нет (удалили) — вызывающий может прислать новое
+MESSAGE_GONE = object()
+
+
+def _retry_seconds(e: RetryAfter) -> float:
+    """retry_after бывает int или timedelta в зависимости от версии PTB."""
+    ra = e.retry_after
+    if isinstance(ra, datetime.timedelta):
+        return ra.total_seconds()
+    return float(ra)
+
+
+def _markup_sig(markup) -> str | None:
+    if markup is None:
+        return None
+    if isinstance(markup, InlineKeyboardMarkup):
+        return markup.to_json()
+    return repr(markup)
+
+
+@dataclass
+class _Edit:
+    text: Optional[str]
+    parse_mode: Optional[str]
+    markup: object
+    future: asyncio.Future = field(repr=False)
+    trace: Optional[tracing.Span] = field(default=None, repr=False)   # спан апдейта, поставившего правку
+    attempts: int = 0                                                   # сколько раз получили 429
+
+    def sig(self) -> Tuple[str | None, str | None, str | None]:
+        return self.text, self.parse_mode, _markup_sig(self.markup)
+
+
+# ──────────── основной класс ────────────
+class TelegramOutbox:
+    """
+    Очередь исходящих правок сообщений.
+
+    • по каждому (chat, message) хранится только последняя ожидающая правка —
+      промежуточные состояния быстрых кликов не отправляются вовсе;
+    • правка, совпадающая с последним отправленным текстом и клавиатурой,
+      не уходит в API (никаких «Message is not modified»);
+    • 429 (RetryAfter) блокирует чат на указанное время, правка повторяется
+      (не больше SEND_ATTEMPTS раз, как и прочие запросы);
+    • медиа (фото) уходят через отдельного бота с собственным пулом HTTPX,
+      чтобы долгая загрузка не занимала соединения для мелких правок.
+    """
+
+    def __init__(self):
+        self.bot: Bot | None = None
+        self.media_bot: Bot | None = None
+        self._pending: Dict[Key, _Edit] = {}
+        self._workers: Dict[Key, asyncio.Task] = {}
+        self._last_sent: "OrderedDict[Key, tuple]" = OrderedDict()
+        self._blocked_until: Dict[int, float] = {}
+        self.stats: Counter = Counter()
+
+    def bind(self, bot: Bot, media_bot: Bot | None = None) -> None:
+        self.bot = bot
+        self.media_bot = media_bot or bot
+
+    # ---------- состояние ----------
+    def pending(self) -> int:
+        """Сколько правок ждёт отправки прямо сейчас."""
+        return len(self._pending)
+
+    async def flush(self, timeout: float = 5.0) -> bool:
+        """Ждём, пока уйдут все правки (включая отправляемые сейчас); False — не успели."""
+        workers = list(self._workers.values())
+        if not workers:
+            return True
+        _, not_done = await asyncio.wait(workers, timeout=timeout)
+        return not not_done
+
+    def remember(self, chat_id: int, message_id: int, text: str | None,
+                 parse_mode: str | None = None, markup=None) -> None:
+        """Запоминаем, что сейчас показано в сообщении (после send_*)."""
+        key = (chat_id, message_id)
+        self._last_sent[key] = (text, parse_mode, _markup_sig(markup))
+        self._last_sent.move_to_end(key)
+        while len(self._last_sent) > LAST_SENT_LIMIT:
+            self._last_sent.popitem(last=False)
+
+    def forget(self, chat_id: int, message_id: int) -> None:
+        self._last_sent.pop((chat_id, message_id), None)
+
+    # ---------- правки ----------
+    async def edit_text(self, chat_id: int, message_id: int, text: str, *,
+                        parse_mode: str | None = None, reply_markup=None,
+                        wait: bool = False):
+        """
+        Ставит правку текста (и клавиатуры) в очередь.
+
+        По умолчанию не ждёт отправки: обработчик сразу освобождается,
+        а следующая правка того же сообщения просто заменит эту.
+        wait=True — дождаться фактической отправки (или вытеснения).
+        """
+        fut = self._submit((chat_id, message_id), text, parse_mode, reply_markup)
+        if wait:
+            return await fut
+        return fut
+
+    async def edit_markup(self, chat_id: int, message_id: int, reply_markup=None, *,
+                          wait: bool = False):
+        """Правка только клавиатуры; текст, если он ждёт в очереди, сохраняется."""
+        fut = self._submit((chat_id, message_id), None, None, reply_markup)
+        if wait:
+            return await fut
+        return fut
+
+    async def edit_query(self, query, text: str, *, parse_mode: str | None = None,
+                         reply_markup=None, wait: bool = False):
+        """Аналог query.edit_message_text(...) через очередь."""
+        msg = query.message
+        return await self.edit_text(msg.chat_id, msg.message_id, text,
+                                    parse_mode=parse_mode, reply_markup=reply_markup,
+                                    wait=wait)
+
+    async def edit_query_markup(self, query, reply_markup=None, *, wait: bool = False):
+        """Аналог query.edit_message_reply_markup(...) через очередь."""
+        msg = query.message
+        return await self.edit_markup(msg.chat_id, msg.message_id, reply_markup, wait=wait)
+
+    def _submit(self, key: Key, text, parse_mode, markup) -> asyncio.Future:
+        loop = asyncio.get_running_loop()
+        fut = loop.create_future()
+        prev = self._pending.get(key)
+        if prev is not None:
+            # склеиваем: правка одной клавиатуры не стирает ожидающий текст
+            if text is None:
+                text, parse_mode = prev.text, prev.parse_mode
+            if not prev.future.done():
+                prev.future.set_result(None)
+            self.stats["coalesced"] += 1
+        self._pending[key] = _Edit(text, parse_mode, markup, fut, tracing.current_span())
+        if key not in self._workers:
+            self._workers[key] = asyncio.create_task(self._drain(key))
+        return fut
+
+    async def _drain(self, key: Key) -> None:
+        try:
+            while True:
+                job = self._pending.pop(key, None)
+                if job is None:
+                    return
+                await self._wait_flood(key[0])
+                if job.text is not None and self._last_sent.get(key) == job.sig():
+                    self.stats["skipped_same"] += 1
+                    _resolve(job.future, None)
+                    continue
+                try:
+                    res = await self._send_edit(key, job)
+                except RetryAfter as e:
+                    self._block(key[0], _retry_seconds(e))
+                    job.attempts += 1
+                    if key in self._pending:
+                        _resolve(job.future, None)   # её уже вытеснила новая правка
+                    elif job.attempts >= SEND_ATTEMPTS:
+                        # как и в _call: чат под долгим flood control не держит воркер вечно
+                        self.stats["flood_dropped"] += 1
+                        log.warning("Правка %s отброшена после %d ответов 429", key, job.attempts)
+                        _resolve(job.future, None)
+                    else:
+                        self._pending[key] = job
+                    continue
+                except BadRequest as e:
+                    err = str(e)
+                    if "Message is not modified" in err:
+                        self.stats["not_modified"] += 1
+                        if job.text is not None:
+                            self.remember(*key, job.text, job.parse_mode, job.markup)
+                        _resolve(job.future, None)
+                        continue
+                    if "message to edit not found" in err.lower():     # PTB пишет с заглавной
+                        self.forget(*key)
+                        _resolve(job.future, MESSAGE_GONE)
+                        continue
+                    self.stats["errors"] += 1
+                    log.warning("Правка %s отклонена: %s", key, err)
+                    _resolve(job.future, None)
+                    continue
+                except Forbidden as e:      # бота заблокировали / исключили из чата
+                    self.stats["errors"] += 1
+                    log.warning("Правка %s запрещена: %s", key, e)
+                    self.forget(*key)
+                    _resolve(job.future, MESSAGE_GONE)
+                    continue
+                except Exception as e:  # сеть, таймауты и т. п. — не роняем очередь
+                    self.stats["errors"] += 1
+                    log.warning("Правка %s не отправлена: %s", key, e)
+                    _resolve(job.future, None)
+                    continue
+                self.stats["sent"] += 1
+                if job.text is not None:
+                    self.remember(*key, job.text, job.parse_mode, job.markup)
+                else:
+                    last = self._last_sent.get(key)
+                    if last is not None:
+                        self.remember(*key, last[0], last[1], job.markup)
+                _resolve(job.future, res)
+        finally:
+            self._workers.pop(key, None)
+
+    async def _send_edit(self, key: Key, job: _Edit):
+        # задача _drain живёт дольше апдейта — спан вешаем на трассу того, кто поставил правку
+        chat_id, message_id = key
+        with tracing.child_of(job.trace, "outbox.edit", chat=chat_id,
+                              markup_only=job.text is None):
+            if job.text is None:
+                return await self.bot.edit_message_reply_markup(
+                    chat_id=chat_id, message_id=message_id, reply_markup=job.markup,
+                )
+            return await self.bot.edit_message_text(
+                chat_id=chat_id, message_id=message_id, text=job.text,
+                parse_mode=job.parse_mode, reply_markup=job.markup,
+            )
+
+    # ---------- новые сообщения ----------
+    async def send_message(self, chat_id: int, text: str, **kwargs):
+        msg = await self._call(chat_id, self.bot.send_message, chat_id, text, **kwargs)
+        self.remember(chat_id, msg.message_id, text,
+                      kwargs.get("parse_mode"), kwargs.get("reply_markup"))
+        return msg
+
+    async def send_photo(self, chat_id: int, photo, **kwargs):
+        """Загрузка медиа — через отдельный пул соединений."""
+        return await self._call(chat_id, self.media_bot.send_photo, chat_id, photo, **kwargs)
+
+    async def edit_media(self, chat_id: int, message_id: int, media, **kwargs):
+        return await self._call(chat_id, self.media_bot.edit_message_media,
+                                media=media, chat_id=chat_id, message_id=message_id,
+                                **kwargs)
+
+    async def _call(self, chat_id: int, func, /, *args, **kwargs):
+        with tracing.span("outbox." + func.__name__, chat=chat_id):
+            for attempt in range(SEND_ATTEMPTS):
+                await self._wait_flood(chat_id)
+                try:
+                    res = await func(*args, **kwargs)
+                except RetryAfter as e:
+                    self._block(chat_id, _retry_seconds(e))
+                    tracing.annotate(retries=attempt + 1)
+                    if attempt == SEND_ATTEMPTS - 1:
+                        raise
+                    continue
+                except TelegramError:
+                    self.stats["errors"] += 1
+                    raise
+                self.stats["sent"] += 1
+                return res
+
+    # ---------- flood control ----------
+    def _block(self, chat_id: int, seconds: float) -> None:
+        self.stats["retry_after"] += 1
+        until = asyncio.get_running_loop().time() + seconds
+        self._blocked_until[chat_id] = max(until, self._blocked_until.get(chat_id, 0.0))
+        log.warning("429 для чата %s: пауза %.1f c", chat_id, seconds)
+
+    async def _wait_flood(self, chat_id: int) -> None:
+        until = self._blocked_until.get(chat_id)
+        if until is None:
+            return
+        delay = until - asyncio.get_running_loop().time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        else:
+            self._blocked_until.pop(chat_id, None)
+
+
+def _resolve(fut: asyncio.Future, value) -> None:
+    if not fut.done():
+        fut.set_result(value)
@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+# par.py — пар, выполняемые контракты и жертвы по готовой DD-таблице
+"""
+Всё считается по DD-таблице [масть STRAINS][рука NESW] → взятки, без вызовов
+решателя: таблица берётся из кэша BridgeLogic (одна на сдачу) или из boards
+(board_analysis.py).
+
+Пар — исход торговли с полной информацией: стороны по очереди (начиная со
+сдающего) могут перебить последнюю заявку или спасовать; невыполненный
+контракт контрится, выполненный — нет. Значения для всех 35 заявок считаются
+одним проходом сверху вниз (7NT → 1♣), сдающий и зона влияют на исход.
+
+    analyse(dd, "N", (False, True))        → ParReport одной сдачи
+    analyse_many([(dd, dealer, vul), …])   → отчёты для комплекта сдач
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Iterable, List, Optional, Sequence, Tuple
+
+from scoring import SCORE_TABLE, STRAINS
+
+# ──────────── константы ────────────
+HANDS = "NESW"
+SIDES = ("NS", "EW")
+SIDE_HANDS = ((0, 2), (1, 3))
+BIDS = 35                       # 1♣ … 7NT
+STRAIN_ICONS = {"C": "♣", "D": "♦", "H": "♥", "S": "♠", "NT": "NT"}
+
+DDTable = Sequence[Sequence[int]]
+
+
+# ──────────── результат ────────────
+@dataclass(frozen=True)
+class Sacrifice:
+    contract: str               # «5DXE-2»
+    cost: int                   # сколько отдаёт жертвующая сторона (для выполняемого перебития — 0)
+    gain: int                   # насколько это лучше, чем дать сыграть контракт соперника
+    makes: bool = False         # перебитие выполняется — это уже не жертва
+
+
+@dataclass(frozen=True)
+class ParReport:
+    dealer: str
+    vul: Tuple[bool, bool]
+    score: int                                  # пар, очки NS
+    contracts: Tuple[str, ...]                  # «4HN+1», «4HS+1», «5DXE-2»; пусто — пас
+    makeable: Tuple[Tuple[int, ...], ...]       # [рука NESW][масть STRAINS] → старший выполняемый уровень (0 — нет)
+    best: Optional[str]                         # лучший выполняемый контракт («4HN+1»), против него жертвы
+    best_score: int                             # его очки для разыгрывающей стороны
+    sacrifices: Tuple[Sacrifice, ...]           # ответы другой стороны по мастям
+
+
+# ──────────── очки ────────────
+def _side_tricks(dd: DDTable) -> List[List[int]]:
+    """[сторона][масть] → взятки лучшей руки стороны."""
+    return [[max(dd[s][h] for h in SIDE_HANDS[side]) for s in range(len(STRAINS))] for side in (0, 1)]
+
+
+def _terminal(bid: int, tricks: int, vul: bool) -> int:
+    """Очки разыгрывающего: выполнен — без контры, без лежащих — с контрой."""
+    level, strain = bid // 5 + 1, bid % 5
+    dbl = 0 if tricks >= level + 6 else 1
+    return int(SCORE_TABLE[level, strain, dbl, int(vul), tricks])
+
+
+def _contract_text(bid: int, hand: int, tricks: int) -> str:
+    level, strain = bid // 5 + 1, bid % 5
+    over = tricks - level - 6
+    return f"{level}{STRAINS[strain]}{'X' if over < 0 else ''}{HANDS[hand]}" + (f"{over:+d}" if over else "")
+
+
+# ──────────── анализ ────────────
+def analyse(dd: DDTable, dealer: str = "N", vul: Tuple[bool, bool] = (False, False)) -> ParReport:
+    tricks = _side_tricks(dd)
+    sign = (1, -1)
+    # score[b][side] — очки NS, если торговля кончилась заявкой b стороны side
+    score = [[sign[side] * _terminal(b, tricks[side][b % 5], vul[side]) for side in (0, 1)]
+             for b in range(BIDS)]
+    # val[b][side]: заявка b стороны side, ход соперника — пас или любое перебитие
+    val = [[0, 0] for _ in range(BIDS)]
+    best_above = [None, None]               # лучшее для стороны значение среди заявок выше b
+    # лучшая для стороны заявка выше b, на которой торговля кончится (жертва или перебитие)
+    stop_above: List[List[Optional[int]]] = [[None, None] for _ in range(BIDS)]
+    stop = [None, None]
+    for b in range(BIDS - 1, -1, -1):
+        stop_above[b] = list(stop)
+        for side in (0, 1):
+            if stop[side] is None or sign[side] * score[b][side] > sign[side] * stop[side]:
+                stop[side] = score[b][side]
+        for side in (0, 1):
+            opp = 1 - side
+            v = score[b][side]
+            if best_above[opp] is not None and sign[opp] * best_above[opp] > sign[opp] * v:
+                v = best_above[opp]
+            val[b][side] = v
+        for side in (0, 1):
+            if best_above[side] is None or sign[side] * val[b][side] > sign[side] * best_above[side]:
+                best_above[side] = val[b][side]
+
+    # открытие: сдающий, соперник, партнёр сдающего, четвёртая рука; четыре паса — 0
+    first = SIDE_HANDS[1].count(HANDS.index(dealer))    # 0 — сдаёт NS, 1 — EW
+    value = 0
+    for seat in range(3, -1, -1):
+        side = (first + seat) % 2
+        if sign[side] * best_above[side] > sign[side] * value:
+            value = best_above[side]
+
+    # контракт пара — тот, после которого соперникам нечем улучшить результат
+    contracts: List[str] = []
+    if value != 0:
+        seen = set()
+        for b in range(BIDS):
+            for side in (0, 1):
+                opp_stop = stop_above[b][1 - side]
+                if score[b][side] != value or val[b][side] != value or (
+                        opp_stop is not None and sign[1 - side] * opp_stop > sign[1 - side] * value):
+                    continue
+                for h in SIDE_HANDS[side]:
+                    t = dd[b % 5][h]
+                    if sign[side] * _terminal(b, t, vul[side]) == value and (b % 5, h) not in seen:
+                        seen.add((b % 5, h))                # ниже по уровню — тот же счёт, хватит младшего
+                        contracts.append(_contract_text(b, h, t))
+
+    makeable = tuple(tuple(max(0, dd[s][h] - 6) for s in range(len(STRAINS))) for h in range(4))
+    best, best_score, sacrifices = _sacrifices(dd, tricks, vul)
+    return ParReport(dealer, vul, value, tuple(contracts), makeable, best, best_score, sacrifices)
+
+
+def _sacrifices(dd: DDTable, tricks, vul) -> Tuple[Optional[str], int, Tuple[Sacrifice, ...]]:
+    """Лучший выполняемый контракт (по очкам разыгрывающей стороны) и ответы соперников в каждой масти."""
+    top = None                              # (очки, заявка, сторона)
+    for side in (0, 1):
+        for b in range(BIDS):
+            t = tricks[side][b % 5]
+            if t < b // 5 + 7:
+                continue
+            key = (_terminal(b, t, vul[side]), b, side)
+            if top is None or key[0] > top[0]:                 # при равных очках — младшая заявка
+                top = key
+    if top is None:
+        return None, 0, ()
+    pts, bid, side = top
+    hand = max(SIDE_HANDS[side], key=lambda h: dd[bid % 5][h])
+    opp = 1 - side
+    out = []
+    for strain in range(len(STRAINS)):
+        b = bid + 1 + (strain - bid - 1) % 5       # младшая заявка выше bid в этой масти
+        if b >= BIDS:
+            continue
+        t = tricks[opp][strain]
+        h = max(SIDE_HANDS[opp], key=lambda x: dd[strain][x])
+        own = _terminal(b, t, vul[opp])
+        out.append(Sacrifice(_contract_text(b, h, t), max(0, -own), own + pts, own >= 0))
+    return _contract_text(bid, hand, tricks[side][bid % 5]), pts, tuple(out)
+
+
+def analyse_many(boards: Iterable[Tuple[DDTable, str, Tuple[bool, bool]]]) -> List[ParReport]:
+    """Комплект сдач: [(dd, сдающий, зона)] → отчёты в том же порядке (решатель не нужен)."""
+    return [analyse(dd, dealer, vul) for dd, dealer, vul in boards]
+
+
+# ──────────── показ ────────────
+def _pretty(contract: str) -> str:
+    for s in ("NT", "S", "H", "D", "C"):
+        if contract[1:].startswith(s):
+            return contract[0] + STRAIN_ICONS[s] + contract[1 + len(s):]
+    return contract
+
+
+def format_report(rep: ParReport) -> str:
+    zone = {(False, False): "—", (True, False): "NS", (False, True): "EW", (True, True): "обе"}[rep.vul]
+    side = "NS" if rep.score >= 0 else "EW"
+    lines = [f"Сдаёт {rep.dealer}, зона {zone}",
+             f"Пар: {rep.score:+d} " + (f"{side} ({', '.join(map(_pretty, rep.contracts))})" if rep.contracts else "(пас)"),
+             "",
+             "Выполняется (уровень):",
+             "   " + " ".join(f"{STRAIN_ICONS[s]:>2}" for s in STRAINS)]
+    for h in (0, 2, 1, 3):
+        lines.append(f"{HANDS[h]}  " + " ".join(f"{lv or '-':>2}" for lv in rep.makeable[h]))
+    if rep.best:
+        lines += ["", f"Лучший контракт: {_pretty(rep.best)} {rep.best_score:+d}", "Ответ соперников:"]
+        for sac in rep.sacrifices:
+            if sac.makes:
+                mark = f"выполняется, {sac.gain:+d}"
+            else:
+                mark = f"-{sac.cost}, " + (f"выгодно {sac.gain:+d}" if sac.gain > 0 else
+                                          "вничью" if sac.gain == 0 else f"невыгодно {sac.gain:+d}")
+            lines.append(f"  {_pretty(sac.contract):<8} {mark}")
+    return "\n".join(lines)
@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+# playtrace.py — разбор сыгранной линии: DD после каждой карты, ошибки и график
+"""
+Сколько взяток берёт разыгрывающий по DD после каждой сыгранной карты —
+одним пакетным проходом вместо решения позиции на каждый ход:
+
+    • линия режется на отрезки по PLAY_SEGMENT взяток; отрезок начинается
+      с границы взятки, его позиция — исходная сдача минус сыгранное раньше;
+    • отрезки — одна пачка analyse_all_plays (AnalyseAllPlaysBin: DDS сам
+      раскидывает их по потокам, каждый отрезок — AnalysePlay целиком),
+      пачки уходят в пул процессов board_analysis;
+    • каждый отрезок кэшируется по сдаче и всей линии до его конца: после
+      отката и другой карты пересчитываются только отрезки после неё.
+
+Карта, после которой DD сдвинулся против сыгравшей стороны, — ошибка:
+кто сыграл и сколько взяток отдал. render_chart рисует DD по ходу розыгрыша.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import io
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, List, Sequence, Tuple
+
+import board_analysis
+from logic import DDS_SECONDS
+from scoring import STRAINS
+import tracing
+
+# ──────────── настройки ────────────
+PLAY_SEGMENT = 3                # взяток в одном отрезке AnalysePlay
+TRACE_CACHE_SIZE = 1024         # отрезков в LRU
+HANDS = "NESW"
+SUIT_ICONS = {"S": "♠", "H": "♥", "D": "♦", "C": "♣", "NT": "NT"}
+
+PlayedCard = Tuple[str, str]                        # ('W', 'HK') — рука, масть+ранг
+SegmentKey = Tuple[str, str, Tuple[PlayedCard, ...]]
+
+_cache: "OrderedDict[SegmentKey, Tuple[int, ...]]" = OrderedDict()
+_inflight: Dict[SegmentKey, asyncio.Future] = {}
+
+
+# ──────────── результат ────────────
+@dataclass(frozen=True)
+class CardCost:
+    index: int                  # номер карты в линии, с 0
+    trick: int                  # номер взятки, с 1 (с учётом неизвестных ранних)
+    hand: str
+    card: str                   # «HK»
+    cost: int                   # сколько взяток отдала своя сторона
+    declarer_side: bool
+
+
+@dataclass(frozen=True)
+class PlayTrace:
+    strain: str
+    declarer: str
+    unknown: int                        # неизвестных ранних взяток
+    cards: Tuple[PlayedCard, ...]
+    tricks: Tuple[int, ...]             # взятки разыгрывающего по DD: до первой карты и после каждой
+    errors: Tuple[CardCost, ...]
+
+    @property
+    def lost_by_declarer(self) -> int:
+        return sum(e.cost for e in self.errors if e.declarer_side)
+
+    @property
+    def lost_by_defence(self) -> int:
+        return sum(e.cost for e in self.errors if not e.declarer_side)
+
+
+# ──────────── расчёт (в процессах пула) ────────────
+def trace_segments(pbn: str, strain: str, cards: Sequence[PlayedCard],
+                   bounds: Sequence[Tuple[int, int]]) -> List[Tuple[int, ...]]:
+    """
+    Отрезки [start, end) линии: одна пачка analyse_all_plays.
+    → для каждого отрезка взятки разыгрывающего (всего за сдачу) до его
+    первой карты и после каждой.
+    """
+    from endplay.dds import analyse_all_plays
+    from endplay.types import Card, Deal, Denom, Player
+
+    denoms = dict(zip(STRAINS, (Denom.clubs, Denom.diamonds, Denom.hearts, Denom.spades, Denom.nt)))
+    players = (Player.north, Player.east, Player.south, Player.west)
+    leader = HANDS.index(cards[0][0])
+    decl_side = (leader + 1) % 2            # разыгрывающий — правый от первого хода
+
+    deals, plays, base = [], [], []
+    for start, end in bounds:
+        deal = Deal(pbn)
+        deal.trump = denoms[strain]
+        deal.first = players[leader]
+        won = 0
+        for i, (_, card) in enumerate(cards[:start]):
+            deal.play(Card(card))
+            if i % 4 == 3 and int(deal.first) % 2 == decl_side:
+                won += 1
+        # DDS считает взятки стороны, которая не ходит первой в позиции отрезка
+        flip = int(deal.first) % 2 == decl_side
+        deals.append(deal)
+        plays.append([Card(c) for _, c in cards[start:end]])
+        base.append((won, len(deal[deal.first]), flip))
+
+    out = []
+    for (start, end), (won, left, flip), solved in zip(bounds, base, analyse_all_plays(deals, plays)):
+        vals = [won + (left - t if flip else t) for t in solved]
+        # последнюю взятку DDS не разбирает — там всё вынужденно
+        vals += [vals[-1]] * (end - start + 1 - len(vals))
+        out.append(tuple(vals[:end - start + 1]))
+    return out
+
+
+async def trace_line(pbn: str, strain: str, unknown: int, cards: Sequence[PlayedCard]) -> PlayTrace:
+    """Разбор линии: отрезки из кэша, недостающие — одной параллельной пачкой."""
+    cards = tuple(cards)
+    if not cards:
+        raise ValueError("Ещё не сыграно ни одной карты.")
+    step = PLAY_SEGMENT * 4
+    bounds = [(s, min(s + step, len(cards))) for s in range(0, len(cards), step)]
+    keys = [(pbn, strain, cards[:end]) for _, end in bounds]
+
+    found: Dict[int, Tuple[int, ...]] = {}
+    waits: Dict[int, asyncio.Future] = {}
+    todo: List[int] = []
+    for i, key in enumerate(keys):
+        if key in _cache:
+            _cache.move_to_end(key)
+            found[i] = _cache[key]
+        elif key in _inflight:
+            waits[i] = _inflight[key]
+        else:
+            todo.append(i)
+
+    if todo:
+        loop = asyncio.get_running_loop()
+        own = {i: loop.create_future() for i in todo}
+        for i in todo:
+            _inflight[keys[i]] = own[i]
+        try:
+            with DDS_SECONDS.time("play_trace"), tracing.span("dds.play_trace"):
+                solved = await _solve(pbn, strain, cards, [bounds[i] for i in todo])
+        except Exception as e:
+            for f in own.values():
+                f.set_exception(e)
+                f.exception()       # ожидающих может не быть — не ругаться «never retrieved»
+            raise
+        except BaseException:
+            for f in own.values():
+                f.cancel()
+            raise
+        finally:
+            for i in todo:
+                del _inflight[keys[i]]
+        for i, vals in zip(todo, solved):
+            own[i].set_result(vals)
+            found[i] = _cache[keys[i]] = vals
+        while len(_cache) > TRACE_CACHE_SIZE:
+            _cache.popitem(last=False)
+    for i, fut in waits.items():
+        found[i] = await asyncio.shield(fut)
+
+    tricks = list(found[0])
+    for i in range(1, len(bounds)):
+        tricks += found[i][1:]
+    return _build(strain, unknown, cards, tricks)
+
+
+async def _solve(pbn: str, strain: str, cards: Tuple[PlayedCard, ...],
+                 bounds: List[Tuple[int, int]]) -> List[Tuple[int, ...]]:
+    loop = asyncio.get_running_loop()
+    pool = board_analysis.executor()
+    groups = min(board_analysis.DD_WORKERS, len(bounds))
+    parts = [bounds[i::groups] for i in range(groups)]
+    done = await asyncio.gather(*(loop.run_in_executor(pool, trace_segments, pbn, strain, cards, p)
+                                  for p in parts))
+    by_bound = {b: vals for part, res in zip(parts, done) for b, vals in zip(part, res)}
+    return [by_bound[b] for b in bounds]
+
+
+def _build(strain: str, unknown: int, cards: Tuple[PlayedCard, ...], tricks: List[int]) -> PlayTrace:
+    leader = HANDS.index(cards[0][0])
+    declarer = HANDS[(leader + 3) % 4]
+    errors = []
+    for i, (hand, card) in enumerate(cards):
+        delta = tricks[i + 1] - tricks[i]
+        ours = HANDS.index(hand) % 2 == HANDS.index(declarer) % 2
+        cost = -delta if ours else delta
+        if cost > 0:
+            errors.append(CardCost(i, unknown + i // 4 + 1, hand, card, cost, ours))
+    return PlayTrace(strain, declarer, unknown, cards, tuple(tricks), tuple(errors))
+
+
+# ──────────── показ ────────────
+def _card(hand: str, card: str) -> str:
+    return f"{hand}{SUIT_ICONS[card[0]]}{card[1]}"
+
+
+def format_trace(tr: PlayTrace) -> str:
+    """Итог по DD и список карт, отдавших взятки."""
+    opp = "EW" if tr.declarer in "NS" else "NS"
+    lines = [f"Разбор розыгрыша: {SUIT_ICONS[tr.strain]}, разыгрывает {tr.declarer}",
+             f"DD до первой карты: {tr.tricks[0]}, после последней: {tr.tricks[-1]}"]
+    if not tr.errors:
+        lines += ["", "Ошибок нет — каждая карта сохраняет DD."]
+        return "\n".join(lines)
+    lines += ["", "Карты, отдавшие взятки:"]
+    for e in tr.errors:
+        lines.append(f"{e.trick:2}: {_card(e.hand, e.card)}  -{e.cost}")
+    lines += ["", f"Разыгрывающий отдал: {tr.lost_by_declarer}",
+              f"Защита ({opp}) отдала: {tr.lost_by_defence}"]
+    return "\n".join(lines)
+
+
+def render_chart(tr: PlayTrace) -> bytes:
+    """PNG: взятки разыгрывающего по DD после каждой карты, ошибки отмечены."""
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    n = len(tr.cards)
+    total = 13 - tr.unknown
+    fig = Figure(figsize=(9, 4), dpi=110)
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot()
+    ax.step(range(n + 1), tr.tricks, where="post", color="#2b6cb0", linewidth=2)
+    for k in range(4, n, 4):
+        ax.axvline(k, color="#dddddd", linewidth=0.8, zorder=0)
+    for e in tr.errors:
+        x, y = e.index + 1, tr.tricks[e.index + 1]
+        color = "#c53030" if e.declarer_side else "#2f855a"
+        ax.scatter([x], [y], color=color, zorder=3)
+        ax.annotate(f"{_card(e.hand, e.card)} -{e.cost}", (x, y), textcoords="offset points",
+                    xytext=(4, 8 if e.declarer_side else -14), fontsize=8, color=color)
+    ax.set_xlim(0, max(n, 4))
+    ax.set_ylim(-0.5, total + 0.5)
+    ax.set_xticks([k * 4 + 2 for k in range((n + 3) // 4)])
+    ax.set_xticklabels([str(tr.unknown + k + 1) for k in range((n + 3) // 4)])
+    ax.set_xlabel("взятка")
+    ax.set_ylabel(f"взятки {tr.declarer} по DD")
+    ax.set_title(f"{SUIT_ICONS[tr.strain]}, разыгрывает {tr.declarer}: "
+                 f"разыгрывающий -{tr.lost_by_declarer}, защита -{tr.lost_by_defence}")
+    fig.tight_layout()
+    buf = io.BytesIO()
+    fig.savefig(buf, format="png")
+    return buf.getvalue()
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+# profiling.py — поэтапные замеры времени распознавания
+
+from __future__ import annotations
+
+import logging
+import os
+import time
+from typing import Dict, Tuple
+
+from metrics import Histogram
+import tracing
+
+# ──────────── настройки ────────────
+# BRIDGEIT_PROFILE=1 — включить замеры; по умолчанию выключены и почти бесплатны
+PROFILING = os.getenv("BRIDGEIT_PROFILE", "0") == "1"
+
+STAGE_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+STAGE_WALL = Histogram("recognition_stage_seconds",
+                       "Время этапа распознавания (wall)", ("stage",), STAGE_BUCKETS)
+STAGE_CPU = Histogram("recognition_stage_cpu_seconds",
+                      "Процессорное время этапа распознавания (поток этапа)", ("stage",), STAGE_BUCKETS)
+
+log = logging.getLogger(__name__)
+
+
+class _Stage:
+    __slots__ = ("timer", "name", "w0", "c0", "span")
+
+    def __init__(self, timer: "StageTimer", name: str):
+        self.timer = timer
+        self.name = name
+        self.span = tracing.span("detect." + name)
+
+    def __enter__(self):
+        self.span.__enter__()
+        self.w0 = time.perf_counter()
+        self.c0 = time.thread_time()
+        return self
+
+    def __exit__(self, *exc):
+        self.timer.add(self.name, time.perf_counter() - self.w0, time.thread_time() - self.c0)
+        self.span.__exit__(*exc)
+        return False
+
+
+class StageTimer:
+    """
+    Замеры одного запроса: {этап: (wall, cpu)}.
+
+        with timer.stage("predict"):
+            ...
+
+    CPU — thread_time() потока, где выполнялся этап: внутренние потоки
+    torch сюда не попадают, зато соседние запросы не смешиваются.
+    """
+
+    enabled = True
+
+    def __init__(self, kind: str = "recognition"):
+        self.kind = kind
+        self.stages: Dict[str, Tuple[float, float]] = {}
+
+    def stage(self, name: str) -> _Stage:
+        return _Stage(self, name)
+
+    def add(self, name: str, wall: float, cpu: float = 0.0) -> None:
+        w, c = self.stages.get(name, (0.0, 0.0))
+        self.stages[name] = (w + wall, c + cpu)
+
+    def total(self) -> float:
+        return sum(w for w, _ in self.stages.values())
+
+    def finish(self) -> None:
+        """Сбрасывает замеры в гистограммы и debug-лог."""
+        for name, (wall, cpu) in self.stages.items():
+            STAGE_WALL.observe(wall, name)
+            STAGE_CPU.observe(cpu, name)
+        if log.isEnabledFor(logging.DEBUG):
+            parts = ", ".join(f"{n}={w * 1000:.0f}ms/{c * 1000:.0f}ms"
+                              for n, (w, c) in self.stages.items())
+            log.debug("%s: %.0f ms [%s]", self.kind, self.total() * 1000, parts)
+
+
+class _NullTimer:
+    """Заглушка при выключенном профилировании: ни замеров, ни аллокаций (кроме спанов трассы)."""
+
+    enabled = False
+    stages: Dict[str, Tuple[float, float]] = {}
+
+    def stage(self, name: str):
+        return tracing.span("detect." + name)
+
+    def add(self, name: str, wall: float, cpu: float = 0.0) -> None:
+        return
+
+    def total(self) -> float:
+        return 0.0
+
+    def finish(self) -> None:
+        return
+
+
+NULL_TIMER = _NullTimer()
+
+
+def new_timer(kind: str = "recognition"):
+    return StageTimer(kind) if PROFILING else NULL_TIMER
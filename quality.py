@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+# quality.py — быстрая проверка качества фото до запуска детектора
+
+from __future__ import annotations
+
+import sys
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import List
+
+import numpy as np
+import cv2
+
+# ──────────── пороги ────────────
+# Подобраны по img/test и их испорченным копиям (python quality.py):
+# на нормальных снимках lap ≥ 2296, mean 99–146, стороны ≥ 591×1280,
+# ≥ 39 «карт»; размытие σ=4 даёт lap ≤ 16 (и на 3456×2234), затемнение
+# ×0.15 — mean ≤ 21, пересвет — mean ≥ 204, пустой стол — 0 «карт».
+ANALYSIS_SIDE = 800         # яркость и «карты» считаем на уменьшенной копии
+MIN_SIDE = 480              # меньшая сторона исходника, px
+MIN_LONG_SIDE = 1200        # большая сторона: детектор работает на 1600
+SHARP_TILE = 160            # резкость — по окнам исходника без уменьшения,
+SHARP_GRID = 5              # сетка SHARP_GRID×SHARP_GRID, берём 90-й перцентиль
+BLUR_MIN = 100.0            # дисперсия лапласиана
+FLAT_STD = 5.0              # однотонный кадр: резкость не оцениваем
+BRIGHTNESS_MIN = 40.0       # средняя яркость 0..255
+BRIGHTNESS_MAX = 190.0
+OVEREXPOSED_MAX = 0.6       # доля пересвеченных (>245) пикселей
+MARKS_PER_CARD = 3          # индексы/значки масти на одну видимую карту
+MIN_CARDS = 8               # меньше — на фото, скорее всего, нет раскладки
+
+
+@dataclass
+class QualityReport:
+    width: int
+    height: int
+    blur: float
+    brightness: float
+    overexposed: float
+    cards_est: int
+    seconds: float
+    reasons: List[str] = field(default_factory=list)
+
+    @property
+    def ok(self) -> bool:
+        return not self.reasons
+
+    def message(self) -> str:
+        """Текст для пользователя: что не так с фото."""
+        return "\n".join(f"• {r}" for r in self.reasons)
+
+
+# ──────────── метрики ────────────
+def _count_marks(gray: np.ndarray, hsv: np.ndarray) -> int:
+    """
+    Грубая оценка числа карт: считаем мелкие тёмные/красные пятна
+    (номиналы и значки мастей в углах карт) примерно квадратной формы.
+    """
+    ink = (gray < 90) | ((hsv[..., 1] > 120) & ((hsv[..., 0] < 10) | (hsv[..., 0] > 170)))
+    n, _, stats, _ = cv2.connectedComponentsWithStats(ink.astype(np.uint8))
+    if n <= 1:
+        return 0
+    area = gray.size
+    st = stats[1:]
+    w, h, a = st[:, cv2.CC_STAT_WIDTH], st[:, cv2.CC_STAT_HEIGHT], st[:, cv2.CC_STAT_AREA]
+    ratio = w / np.maximum(h, 1)
+    good = (a > 0.00002 * area) & (a < 0.002 * area) & (ratio > 0.3) & (ratio < 3)
+    return int(good.sum())
+
+
+def _sharpness(img: np.ndarray) -> float:
+    """
+    Резкость в масштабе исходника: уменьшение до ANALYSIS_SIDE «съедает»
+    размытие большого снимка, поэтому лапласиан считаем по сетке окон
+    без ресайза. Перцентиль, а не среднее, — пустой стол вокруг раскладки
+    резкость не занижает.
+    """
+    h, w = img.shape[:2]
+    t = min(SHARP_TILE, h, w)
+    lap = []
+    for y in np.linspace(0, h - t, SHARP_GRID).astype(int):
+        for x in np.linspace(0, w - t, SHARP_GRID).astype(int):
+            tile = cv2.cvtColor(img[y:y + t, x:x + t], cv2.COLOR_BGR2GRAY)
+            lap.append(cv2.Laplacian(tile, cv2.CV_64F).var())
+    return float(np.percentile(lap, 90))
+
+
+def check_photo_quality(img: np.ndarray) -> QualityReport:
+    """Оценивает декодированное BGR-изображение за несколько миллисекунд."""
+    t0 = time.perf_counter()
+    h, w = img.shape[:2]
+    scale = min(1.0, ANALYSIS_SIDE / max(h, w))
+    small = img if scale == 1.0 else cv2.resize(
+        img, (max(1, int(w * scale)), max(1, int(h * scale))), interpolation=cv2.INTER_AREA)
+
+    gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+    hsv = cv2.cvtColor(small, cv2.COLOR_BGR2HSV)
+
+    blur = _sharpness(img)
+    brightness = float(gray.mean())
+    overexposed = float((gray > 245).mean())
+    cards_est = _count_marks(gray, hsv) // MARKS_PER_CARD
+
+    rep = QualityReport(w, h, blur, brightness, overexposed, cards_est, 0.0)
+    if min(h, w) < MIN_SIDE or max(h, w) < MIN_LONG_SIDE:
+        rep.reasons.append(f"слишком маленькое разрешение ({w}×{h})")
+    if brightness < BRIGHTNESS_MIN:
+        rep.reasons.append("фото слишком тёмное")
+    elif brightness > BRIGHTNESS_MAX or overexposed > OVEREXPOSED_MAX:
+        rep.reasons.append("фото пересвечено")
+    if blur < BLUR_MIN and gray.std() >= FLAT_STD:
+        rep.reasons.append("фото размыто или не в фокусе")
+    if cards_est < MIN_CARDS:
+        rep.reasons.append("на фото почти не видно карт")
+    rep.seconds = time.perf_counter() - t0
+    return rep
+
+
+def check_photo_file(path: str) -> QualityReport:
+    img = cv2.imread(str(path))
+    if img is None:
+        raise FileNotFoundError(f"Не удалось открыть изображение: {path}")
+    return check_photo_quality(img)
+
+
+# ──────────── бенчмарк порогов ────────────
+def _variants(img: np.ndarray):
+    yield "исходник", img
+    yield "размытие σ=4", cv2.GaussianBlur(img, (0, 0), 4)
+    yield "темнота ×0.15", (img * 0.15).astype(np.uint8)
+    yield "пересвет", cv2.convertScaleAbs(img, alpha=2.5, beta=80)
+    yield "уменьшено ×0.3", cv2.resize(img, None, fx=0.3, fy=0.3, interpolation=cv2.INTER_AREA)
+    yield "пустой стол", np.full_like(img, 180)
+
+
+if __name__ == "__main__":
+    paths = sys.argv[1:] or sorted(str(p) for p in Path("img/test").iterdir()
+                                   if p.suffix.lower() in (".jpg", ".jpeg", ".png"))
+    times = []
+    print(f"{'файл':<28}{'вариант':<16}{'размер':>11}{'lap':>8}{'mean':>6}{'over':>6}{'карт':>6}{'мс':>7}  итог")
+    for p in paths:
+        img = cv2.imread(p)
+        if img is None:
+            continue
+        for name, var in _variants(img):
+            r = check_photo_quality(var)
+            times.append(r.seconds)
+            verdict = "ok" if r.ok else "✗ " + "; ".join(r.reasons)
+            print(f"{Path(p).name:<28}{name:<16}{f'{r.width}x{r.height}':>11}{r.blur:>8.0f}"
+                  f"{r.brightness:>6.0f}{r.overexposed:>6.2f}{r.cards_est:>6}{r.seconds * 1000:>7.1f}  {verdict}")
+    if times:
+        print(f"\nпроверок: {len(times)}, среднее {np.mean(times) * 1000:.1f} мс, "
+              f"максимум {np.max(times) * 1000:.1f} мс")
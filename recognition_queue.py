@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+# recognition_queue.py — очередь задач распознавания фото
+
+from __future__ import annotations
+
+import asyncio
+import contextvars
+import heapq
+import itertools
+import logging
+import math
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, List, Optional
+
+import tracing
+
+# ──────────── константы ────────────
+DEFAULT_JOB_SECONDS = 8.0   # оценка длительности, пока нет статистики
+EWMA_ALPHA = 0.3            # вес последней задачи в скользящем среднем
+PRIORITY_RESERVE = 4        # сверх max_size — места только для приоритетной полосы
+
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 1
+
+log = logging.getLogger(__name__)
+
+# on_update(position, eta_seconds): position == 0 — задача уже выполняется
+ProgressCallback = Callable[[int, float], Awaitable[None]]
+
+
+class QueueFull(Exception):
+    """Очередь распознавания заполнена — задачу не принимаем."""
+
+
+@dataclass(order=True)
+class _Job:
+    priority: int
+    seq: int
+    func: Callable = field(compare=False)
+    args: tuple = field(compare=False)
+    future: asyncio.Future = field(compare=False, repr=False)
+    on_update: Optional[ProgressCallback] = field(compare=False, default=None)
+    last_pos: int = field(compare=False, default=-1)
+    # контекст отправителя: trace id доезжает до потока исполнителя
+    ctx: contextvars.Context = field(compare=False, default_factory=contextvars.copy_context, repr=False)
+    queued_at: float = field(compare=False, default_factory=time.perf_counter)
+
+
+# ──────────── основной класс ────────────
+class RecognitionQueue:
+    """
+    Ограниченная очередь тяжёлых задач (распознавание фото).
+
+    • одновременно выполняется не больше `concurrency` задач,
+      каждая — в отдельном потоке, event loop бота не блокируется;
+    • приоритетная полоса (PRIORITY_HIGH) обгоняет обычные задачи и
+      имеет небольшой резерв мест сверх max_size;
+    • при изменении очереди ожидающим сообщается позиция и ETA;
+    • переполненная очередь сразу отвечает QueueFull.
+    """
+
+    def __init__(self, concurrency: int = 2, max_size: int = 10):
+        self.concurrency = max(1, concurrency)
+        self.max_size = max_size
+        self._heap: List[_Job] = []
+        self._seq = itertools.count()
+        self._cond: asyncio.Condition | None = None
+        self._workers: List[asyncio.Task] = []
+        self._executor: ThreadPoolExecutor | None = None
+        self.running = 0
+        self.avg_seconds = DEFAULT_JOB_SECONDS
+
+    # ---------- жизненный цикл ----------
+    async def start(self) -> None:
+        if self._workers:
+            return
+        self._cond = asyncio.Condition()
+        self._executor = ThreadPoolExecutor(max_workers=self.concurrency,
+                                            thread_name_prefix="recognition")
+        self._workers = [asyncio.create_task(self._worker())
+                         for _ in range(self.concurrency)]
+
+    async def stop(self) -> None:
+        for w in self._workers:
+            w.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers.clear()
+        for job in self._heap:
+            job.future.cancel()
+        self._heap.clear()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    # ---------- приём задач ----------
+    def waiting(self) -> int:
+        return len(self._heap)
+
+    def is_full(self, priority: int = PRIORITY_NORMAL) -> bool:
+        limit = self.max_size + (PRIORITY_RESERVE if priority == PRIORITY_HIGH else 0)
+        return len(self._heap) >= limit
+
+    def eta(self, position: int) -> float:
+        """Оценка ожидания (сек) для задачи на позиции position (1 — следующая)."""
+        rounds = math.ceil(position / self.concurrency)
+        return rounds * self.avg_seconds
+
+    async def submit(self, func: Callable, *args, priority: int = PRIORITY_NORMAL,
+                     on_update: ProgressCallback | None = None) -> asyncio.Future:
+        """
+        Ставит func(*args) в очередь и возвращает future с её результатом.
+        Если очередь заполнена — QueueFull.
+        """
+        if self._cond is None:
+            raise RuntimeError("Очередь не запущена (start()).")
+        if self.is_full(priority):
+            raise QueueFull()
+        fut = asyncio.get_running_loop().create_future()
+        job = _Job(priority, next(self._seq), func, args, fut, on_update)
+        async with self._cond:
+            heapq.heappush(self._heap, job)
+            self._cond.notify()
+        await self._notify_positions()
+        return fut
+
+    # ---------- исполнение ----------
+    async def _worker(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            async with self._cond:
+                while not self._heap:
+                    await self._cond.wait()
+                job = heapq.heappop(self._heap)
+            if job.future.cancelled():
+                continue
+
+            self.running += 1
+            await self._call_update(job, 0, self.avg_seconds)
+            await self._notify_positions()
+
+            t0 = time.perf_counter()
+            try:
+                with tracing.child_of(job.ctx.get(tracing.CURRENT), "queue.job",
+                                      waited_ms=round((t0 - job.queued_at) * 1000, 1)):
+                    res = await loop.run_in_executor(self._executor, job.ctx.run, job.func, *job.args)
+            except Exception as e:
+                if not job.future.done():
+                    job.future.set_exception(e)
+            else:
+                if not job.future.done():
+                    job.future.set_result(res)
+            finally:
+                self.running -= 1
+                dt = time.perf_counter() - t0
+                self.avg_seconds += EWMA_ALPHA * (dt - self.avg_seconds)
+
+    async def _notify_positions(self) -> None:
+        for pos, job in enumerate(sorted(self._heap), 1):
+            if job.last_pos != pos:
+                job.last_pos = pos
+                await self._call_update(job, pos, self.eta(pos))
+
+    @staticmethod
+    async def _call_update(job: _Job, pos: int, eta: float) -> None:
+        if job.on_update is None:
+            return
+        try:
+            await job.on_update(pos, eta)
+        except Exception as e:  # обратная связь не должна ломать очередь
+            log.warning("Не удалось сообщить позицию в очереди: %s", e)
@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+# recognize_batch.py — распознавание пачки фото раскладов в пуле процессов
+"""
+Заполнение сдач по стопке фото протоколов:
+
+    python recognize_batch.py img/boards --out boards.jsonl
+    python recognize_batch.py "scans/*.jpg" --workers 3 --annotate out/ --dealer S
+
+    • входы — каталоги (все фото в них), маски или отдельные файлы;
+    • фото распознаются в ProcessPoolExecutor (spawn): модель грузится
+      один раз на процесс в initializer, torch делит ядра между процессами;
+    • результат — JSONL, строка на фото: PBN, рука и уверенность по каждой
+      карте, потерянные карты, время по этапам (profiling.StageTimer);
+    • уже обработанные фото пропускаются по sha256 содержимого (хэши берутся
+      из существующего --out), поэтому прерванный прогон просто запускается снова;
+    • --annotate <каталог> — размеченные фото рядом (visualize, debug-разметка).
+
+В конце — сколько фото, ошибок, пропущено и фото/с по всему прогону (stderr).
+"""
+
+from __future__ import annotations
+
+import argparse
+import glob
+import hashlib
+import json
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set
+
+from detection import DEFAULT_CONFIG, ORDER, BridgeCardDetector, DetectorConfig
+
+# ──────────── настройки ────────────
+IMG_EXT = (".jpg", ".jpeg", ".png")
+WORKERS = max(1, min(4, (os.cpu_count() or 2) - 1))
+HASH_BLOCK = 1 << 20
+
+_config: DetectorConfig = DEFAULT_CONFIG
+
+
+# ──────────── входы ────────────
+def image_paths(inputs: Iterable[str]) -> List[Path]:
+    """Каталоги, маски и файлы → фото без повторов, в порядке имён."""
+    found: Dict[Path, None] = {}
+    for item in inputs:
+        p = Path(item)
+        if p.is_dir():
+            names = sorted(p.iterdir())
+        elif p.exists():
+            names = [p]
+        else:
+            names = [Path(x) for x in sorted(glob.glob(item, recursive=True))]
+        for f in names:
+            if f.is_file() and f.suffix.lower() in IMG_EXT and "_annotated" not in f.stem:
+                found.setdefault(f.resolve(), None)
+    return list(found)
+
+
+def file_hash(path: Path) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(HASH_BLOCK), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def done_hashes(out: Path) -> Set[str]:
+    """sha256 успешно обработанных фото из прошлых прогонов (строки с ошибкой — не в счёт)."""
+    if not out.exists():
+        return set()
+    seen = set()
+    with open(out, encoding="utf-8") as f:
+        for line in f:
+            try:
+                row = json.loads(line)
+            except ValueError:
+                continue            # оборванная последняя строка прерванного прогона
+            if row.get("sha256") and not row.get("error"):
+                seen.add(row["sha256"])
+    return seen
+
+
+# ──────────── процесс пула ────────────
+def _init_worker(config: DetectorConfig, threads: int) -> None:
+    """Один раз на процесс: потоки torch и загрузка модели."""
+    global _config
+    _config = config
+    import torch
+    from detection import _get_model
+
+    torch.set_num_threads(threads)
+    _get_model(config.model)
+
+
+def recognise(path: str, sha: str, dealer: str, annotate: Optional[str]) -> dict:
+    """Одно фото → строка JSONL (ошибка распознавания — поле error, а не исключение)."""
+    from profiling import StageTimer
+
+    timer = StageTimer("batch")
+    row = {"image": path, "sha256": sha, "pid": os.getpid()}
+    t0 = time.perf_counter()
+    try:
+        det = BridgeCardDetector(path, config=_config, timer=timer)
+        if annotate:
+            out = Path(annotate) / f"{Path(path).stem}_annotated.jpg"
+            det.visualize(str(out), debug=True)
+            row["annotated"] = str(out)
+    except Exception as e:
+        row["error"] = f"{type(e).__name__}: {e}"
+    else:
+        conf: Dict[str, float] = {}
+        for *_, raw, _, c in (d for d in det._dets if len(d) == 7):
+            card = det._norm_card(raw)
+            conf[card] = max(conf.get(card, 0.0), c)
+        # карты без детекции (дописаны _auto_fill_trivial) — уверенность null
+        row["pbn"] = f"{dealer}:{det.to_pbn(dealer)}"
+        row["complete"] = not det.missing_cards()
+        row["cards"] = {card: {"hand": hand, "conf": round(conf[card], 3) if card in conf else None}
+                        for hand in ORDER for card in det.hand_cards(hand)}
+        row["missing"] = det.missing_cards()
+    row["seconds"] = round(time.perf_counter() - t0, 4)
+    row["stages"] = {n: round(w, 4) for n, (w, _) in timer.stages.items()}
+    return row
+
+
+# ──────────── прогон ────────────
+def run(paths: List[Path], out: Path, *, config: DetectorConfig = DEFAULT_CONFIG, workers: int = WORKERS,
+        dealer: str = "N", annotate: Optional[Path] = None, force: bool = False) -> dict:
+    seen = set() if force else done_hashes(out)
+    todo, skipped = [], 0
+    for p in paths:
+        sha = file_hash(p)
+        if sha in seen:
+            skipped += 1
+            continue
+        seen.add(sha)               # одинаковые файлы внутри прогона — тоже один раз
+        todo.append((p, sha))
+    stats = {"images": len(todo), "skipped": skipped, "errors": 0, "incomplete": 0, "seconds": 0.0}
+    if not todo:
+        return stats
+    if annotate:
+        annotate.mkdir(parents=True, exist_ok=True)
+
+    workers = max(1, min(workers, len(todo)))
+    threads = max(1, (os.cpu_count() or 1) // workers)
+    t0 = time.perf_counter()
+    with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn"),
+                             initializer=_init_worker, initargs=(config, threads)) as pool, \
+            open(out, "a", encoding="utf-8") as f:
+        futs = [pool.submit(recognise, str(p), sha, dealer, str(annotate) if annotate else None)
+                for p, sha in todo]
+        for i, fut in enumerate(as_completed(futs), 1):
+            row = fut.result()
+            f.write(json.dumps(row, ensure_ascii=False) + "\n")
+            f.flush()               # прерванный прогон не теряет готовое
+            if row.get("error"):
+                stats["errors"] += 1
+                state = row["error"]
+            else:
+                stats["incomplete"] += not row["complete"]
+                state = "ок" if row["complete"] else f"потеряно {len(row['missing'])}"
+            elapsed = time.perf_counter() - t0
+            print(f"[{i}/{len(todo)}] {Path(row['image']).name}: {row['seconds']:.2f} с, {state} "
+                  f"({i / elapsed:.2f} фото/с)", file=sys.stderr)
+    stats["seconds"] = time.perf_counter() - t0
+    return stats
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description="Распознавание пачки фото раскладов в пуле процессов")
+    ap.add_argument("inputs", nargs="+", help="каталоги, маски (\"scans/*.jpg\") или файлы")
+    ap.add_argument("--out", type=Path, default=Path("recognized.jsonl"), help="JSONL (дописывается)")
+    ap.add_argument("--workers", type=int, default=WORKERS, help="процессов распознавания")
+    ap.add_argument("--dealer", default="N", choices=ORDER, help="с чьей руки писать PBN")
+    ap.add_argument("--annotate", type=Path, help="каталог для размеченных фото")
+    ap.add_argument("--force", action="store_true", help="не пропускать уже обработанные")
+    ap.add_argument("--model", default=DEFAULT_CONFIG.model, help=".pt / .onnx / *_openvino_model / .engine")
+    ap.add_argument("--imgsz", type=int, default=DEFAULT_CONFIG.imgsz)
+    ap.add_argument("--tta", type=int, choices=(0, 1), default=int(DEFAULT_CONFIG.augment))
+    ap.add_argument("--second-pass", type=int, choices=(0, 1), default=int(DEFAULT_CONFIG.second_pass))
+    args = ap.parse_args(argv)
+
+    paths = image_paths(args.inputs)
+    if not paths:
+        print("Фото не найдены.", file=sys.stderr)
+        return 2
+    cfg = DetectorConfig(model=args.model, imgsz=args.imgsz, augment=bool(args.tta),
+                         second_pass=bool(args.second_pass))
+    print(f"фото: {len(paths)}, {cfg.label()}, процессов: {min(args.workers, len(paths))}", file=sys.stderr)
+    st = run(paths, args.out, config=cfg, workers=args.workers, dealer=args.dealer,
+             annotate=args.annotate, force=args.force)
+    rate = st["images"] / st["seconds"] if st["seconds"] else 0.0
+    print(f"распознано {st['images']} за {st['seconds']:.1f} с ({rate:.2f} фото/с), "
+          f"ошибок {st['errors']}, неполных {st['incomplete']}, пропущено {st['skipped']} → {args.out}",
+          file=sys.stderr)
+    return 1 if st["errors"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
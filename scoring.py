@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+# scoring.py — дубликатный подсчёт: очки за контракт, MP/проценты, кросс-IMP, Butler
+"""
+Очки NS берутся из заранее посчитанной таблицы SCORE_TABLE
+[уровень, масть, контра, зона, взятки] — на вводе результата никакой арифметики
+правил, только индекс.
+
+Ранжирование доски — NumPy сразу по всем столам (и по всем доскам, если
+считаем турнир целиком): результаты сводятся в матрицу [доски × столы],
+пустые клетки — NaN.
+
+TournamentScores держит посчитанные доски и суммы пар. Правка одного
+результата пересчитывает только его доску и поправляет итоги пар, которые
+на ней играли, — турнир целиком не пересчитывается.
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+
+# ──────────── константы ────────────
+STRAINS = ("C", "D", "H", "S", "NT")
+DOUBLES = ("", "X", "XX")
+NS_SIDE = ("N", "S")
+# границы шкалы IMP: разница ≥ IMP_BOUNDS[k] даёт k+1 IMP
+IMP_BOUNDS = np.array([20, 50, 90, 130, 170, 220, 270, 320, 370, 430, 500, 600, 750,
+                       900, 1100, 1300, 1500, 1750, 2000, 2250, 2500, 3000, 3500, 4000])
+BUTLER_TRIM_FROM = 5        # с такого числа столов датум считается без лучшего и худшего результата
+
+
+# ──────────── очки за контракт ────────────
+def _declarer_score(level: int, strain: int, dbl: int, vul: bool, tricks: int) -> int:
+    need = level + 6
+    if tricks < need:
+        down = need - tricks
+        if dbl == 0:
+            return -down * (100 if vul else 50)
+        if vul:
+            pen = 200 + 300 * (down - 1)
+        else:
+            pen = 100 + 200 * min(down - 1, 2) + 300 * max(down - 3, 0)
+        return -pen * dbl      # XX — вдвое больше X
+    per_trick = 20 if strain < 2 else 30
+    trick_score = per_trick * level + (10 if strain == 4 else 0)
+    mult = (1, 2, 4)[dbl]
+    score = trick_score * mult
+    score += (500 if vul else 300) if score >= 100 else 50
+    if level == 6:
+        score += 750 if vul else 500
+    elif level == 7:
+        score += 1500 if vul else 1000
+    score += (0, 50, 100)[dbl]
+    over = tricks - need
+    if dbl == 0:
+        score += over * per_trick
+    else:
+        score += over * (200 if vul else 100) * dbl
+    return score
+
+
+def _build_table() -> np.ndarray:
+    t = np.zeros((8, len(STRAINS), len(DOUBLES), 2, 14), dtype=np.int32)
+    for level in range(1, 8):
+        for strain in range(len(STRAINS)):
+            for dbl in range(len(DOUBLES)):
+                for vul in (0, 1):
+                    for tricks in range(14):
+                        t[level, strain, dbl, vul, tricks] = _declarer_score(level, strain, dbl, bool(vul), tricks)
+    return t
+
+
+SCORE_TABLE = _build_table()     # [уровень 1..7, масть, контра, зона, взятки] → очки разыгрывающего
+
+
+def board_vulnerability(board: int) -> Tuple[bool, bool]:
+    """(NS в зоне, EW в зоне) по стандартной схеме 16 сдач."""
+    i = (board - 1) % 16
+    ns = i in (1, 3, 4, 6, 9, 11, 12, 14)
+    ew = i in (2, 3, 5, 6, 8, 9, 12, 15)
+    return ns, ew
+
+
+def score_ns(contract: str, declarer: Optional[str], tricks: Optional[int], board: int,
+             vul: Optional[Tuple[bool, bool]] = None) -> int:
+    """
+    Очки NS за результат: «4SX», «N», 9, доска 7 → -500.
+    vul — зона сдачи ([Vulnerable] из PBN); None — по номеру доски.
+    """
+    if contract == "PASS":
+        return 0
+    level = int(contract[0])
+    rest = contract[1:]
+    strain = STRAINS.index(rest[:2] if rest.startswith("NT") else rest[0])
+    dbl = rest.count("X")
+    ns_vul, ew_vul = vul if vul is not None else board_vulnerability(board)
+    ns_declares = declarer in NS_SIDE
+    s = int(SCORE_TABLE[level, strain, dbl, int(ns_vul if ns_declares else ew_vul), tricks])
+    return s if ns_declares else -s
+
+
+# ──────────── ранжирование досок ────────────
+def imps(diff: np.ndarray) -> np.ndarray:
+    """Разница очков → IMP со знаком (поэлементно)."""
+    return np.sign(diff) * np.searchsorted(IMP_BOUNDS, np.abs(diff), side="right")
+
+
+def rank_boards(scores: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    scores: [доски × столы] очки NS, NaN — нет результата.
+    → (проценты NS, кросс-IMP NS (среднее по сравнениям), Butler NS), той же формы.
+    """
+    valid = ~np.isnan(scores)
+    n = valid.sum(axis=1, keepdims=True)
+    diff = scores[:, :, None] - scores[:, None, :]          # [B, T, T], NaN там, где хоть одна клетка пуста
+    beats = (diff > 0).sum(axis=2)
+    ties = (diff == 0).sum(axis=2) - 1                      # минус сравнение с собой
+    top = 2 * (n - 1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        pct = np.where(top > 0, (2 * beats + ties) * 100.0 / np.maximum(top, 1), 50.0)
+        ximp = imps(np.nan_to_num(diff)).sum(axis=2) / np.maximum(n - 1, 1)
+
+    filled = np.where(valid, scores, 0.0)
+    total = filled.sum(axis=1, keepdims=True)
+    hi = np.where(valid, scores, -np.inf).max(axis=1, keepdims=True)
+    lo = np.where(valid, scores, np.inf).min(axis=1, keepdims=True)
+    trim = n >= BUTLER_TRIM_FROM
+    with np.errstate(invalid="ignore", divide="ignore"):
+        datum = np.where(trim, (total - hi - lo) / np.maximum(n - 2, 1), total / np.maximum(n, 1))
+    datum = np.round(datum / 10) * 10
+    butler = imps(np.nan_to_num(scores - datum)).astype(float)
+
+    nan = np.where(valid, 0.0, np.nan)
+    return pct + nan, ximp + nan, butler + nan
+
+
+# ──────────── турнир ────────────
+@dataclass
+class BoardScores:
+    board: int
+    tables: List[int]
+    ns: np.ndarray              # номера пар NS по столам
+    ew: np.ndarray
+    score: np.ndarray           # очки NS
+    pct: np.ndarray             # проценты NS (у EW — 100 - pct)
+    ximp: np.ndarray            # кросс-IMP NS (у EW — с минусом)
+    butler: np.ndarray
+
+
+@dataclass
+class PairTotals:
+    pair: int
+    boards: int = 0
+    pct_sum: float = 0.0
+    ximp: float = 0.0
+    butler: float = 0.0
+
+    @property
+    def pct(self) -> float:
+        return self.pct_sum / self.boards if self.boards else 0.0
+
+    def add(self, pct: float, ximp: float, butler: float, sign: int = 1) -> None:
+        self.boards += sign
+        self.pct_sum += sign * pct
+        self.ximp += sign * ximp
+        self.butler += sign * butler
+
+
+class TournamentScores:
+    """Посчитанные доски и итоги пар одного турнира; строки — как в таблице results."""
+
+    def __init__(self):
+        self.rows: Dict[int, Dict[int, dict]] = {}          # доска → стол → строка results
+        self.boards: Dict[int, BoardScores] = {}
+        self.pairs: Dict[int, PairTotals] = {}
+
+    def load(self, rows: Iterable[dict]) -> None:
+        """Полный пересчёт: все доски одной матрицей."""
+        self.rows.clear()
+        self.boards.clear()
+        self.pairs.clear()
+        for r in rows:
+            if r.get("score_ns") is not None:
+                self.rows.setdefault(r["board_number"], {})[r["table_number"]] = r
+        boards = sorted(self.rows)
+        if not boards:
+            return
+        width = max(len(t) for t in self.rows.values())
+        mat = np.full((len(boards), width), np.nan)
+        for i, b in enumerate(boards):
+            tabs = self.rows[b]
+            mat[i, :len(tabs)] = [tabs[t]["score_ns"] for t in sorted(tabs)]
+        pct, ximp, butler = rank_boards(mat)
+        for i, b in enumerate(boards):
+            self._store(b, pct[i], ximp[i], butler[i])
+
+    def apply(self, row: dict) -> Set[int]:
+        """Новый или исправленный результат: пересчёт его доски. → пары, чьи итоги изменились."""
+        b = row["board_number"]
+        old = self.boards.get(b)
+        touched: Set[int] = set()
+        if old is not None:
+            touched |= self._account(old, -1)
+        tabs = self.rows.setdefault(b, {})
+        if row.get("score_ns") is None:
+            tabs.pop(row["table_number"], None)
+        else:
+            tabs[row["table_number"]] = row
+        if not tabs:
+            self.rows.pop(b, None)
+            self.boards.pop(b, None)
+            return touched
+        mat = np.array([[tabs[t]["score_ns"] for t in sorted(tabs)]], dtype=float)
+        pct, ximp, butler = rank_boards(mat)
+        return touched | self._store(b, pct[0], ximp[0], butler[0])
+
+    def _store(self, b: int, pct, ximp, butler) -> Set[int]:
+        tabs = self.rows[b]
+        order = sorted(tabs)
+        n = len(order)
+        bs = BoardScores(
+            board=b, tables=order,
+            ns=np.array([tabs[t]["pair_ns_number"] for t in order]),
+            ew=np.array([tabs[t]["pair_ew_number"] for t in order]),
+            score=np.array([tabs[t]["score_ns"] for t in order]),
+            pct=np.asarray(pct[:n]), ximp=np.asarray(ximp[:n]), butler=np.asarray(butler[:n]),
+        )
+        self.boards[b] = bs
+        return self._account(bs, +1)
+
+    def _account(self, bs: BoardScores, sign: int) -> Set[int]:
+        touched = set()
+        for i in range(len(bs.tables)):
+            for pair, k in ((int(bs.ns[i]), 1), (int(bs.ew[i]), -1)):
+                tot = self.pairs.setdefault(pair, PairTotals(pair))
+                pct = bs.pct[i] if k == 1 else 100.0 - bs.pct[i]
+                tot.add(float(pct), k * float(bs.ximp[i]), k * float(bs.butler[i]), sign)
+                touched.add(pair)
+        return touched
+
+    def standings(self, by: str = "pct") -> List[PairTotals]:
+        """Итоги пар, лучшие сверху; by — pct / ximp / butler."""
+        return sorted((p for p in self.pairs.values() if p.boards),
+                      key=lambda p: -getattr(p, by))
+
+    def board(self, b: int) -> Optional[BoardScores]:
+        return self.boards.get(b)
@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+# tracing.py — трассировка апдейтов: спаны с trace id в JSONL-файл
+"""
+У каждого апдейта свой trace id (start_trace в @timed). Он живёт в contextvars
+и сам доезжает до декораторов, вызовов DDS, этапов детектора (в т. ч. в потоке
+очереди распознавания) и исходящих запросов к Telegram. Каждый закрытый спан —
+одна JSON-строка; запись идёт через QueueHandler/QueueListener, event loop
+на диск не ждёт.
+
+Разбор:
+    python tracing.py                      # 10 самых медленных трасс из trace.jsonl
+    python tracing.py --top 20 --name play_card_handler
+    python tracing.py --trace 3f2a9c…      # разбивка одной трассы по спанам
+"""
+
+from __future__ import annotations
+
+import argparse
+import contextvars
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import secrets
+import sys
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+# ──────────── настройки ────────────
+TRACING = os.getenv("BRIDGEIT_TRACE", "1") == "1"
+TRACE_FILE = os.getenv("BRIDGEIT_TRACE_FILE", "trace.jsonl")
+TRACE_MAX_BYTES = 50 * 2 ** 20     # ротация файла трасс
+TRACE_BACKUPS = 3
+
+_log = logging.getLogger("bridgeit.trace")
+_log.propagate = False
+CURRENT: contextvars.ContextVar[Optional["Span"]] = contextvars.ContextVar("bridgeit_span", default=None)
+_listener: logging.handlers.QueueListener | None = None
+
+
+# ──────────── спаны ────────────
+class Span:
+    __slots__ = ("trace_id", "span_id", "parent_id", "name", "attrs", "ts", "_t0", "_token")
+
+    def __init__(self, name: str, trace_id: str, parent_id: str | None, attrs: dict):
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(4)
+        self.parent_id = parent_id
+        self.name = name
+        self.attrs = attrs
+
+    def __enter__(self):
+        self.ts = time.time()
+        self._t0 = time.perf_counter()
+        self._token = CURRENT.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        ms = (time.perf_counter() - self._t0) * 1000
+        CURRENT.reset(self._token)
+        if exc_type is not None:
+            self.attrs["error"] = exc_type.__name__
+        if _log.handlers:
+            _log.info(json.dumps({"ts": round(self.ts, 6), "trace": self.trace_id,
+                                  "span": self.span_id, "parent": self.parent_id,
+                                  "name": self.name, "ms": round(ms, 3), **self.attrs},
+                                 ensure_ascii=False, default=str))
+        return False
+
+
+class _NoSpan:
+    """Вне трассы спаны ничего не стоят: один общий пустой объект."""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NO_SPAN = _NoSpan()
+
+
+def start_trace(name: str, **attrs):
+    """Корневой спан новой трассы (если трасса уже идёт — дочерний спан)."""
+    if not TRACING:
+        return _NO_SPAN
+    parent = CURRENT.get()
+    if parent is not None:
+        return Span(name, parent.trace_id, parent.span_id, attrs)
+    return Span(name, secrets.token_hex(8), None, attrs)
+
+
+def span(name: str, **attrs):
+    """Дочерний спан текущей трассы; вне трассы — no-op."""
+    return child_of(CURRENT.get(), name, **attrs)
+
+
+def child_of(parent: Span | None, name: str, **attrs):
+    """Спан под явно заданным родителем — для работы, отложенной в чужую задачу (outbox)."""
+    if parent is None:
+        return _NO_SPAN
+    return Span(name, parent.trace_id, parent.span_id, attrs)
+
+
+def annotate(**attrs) -> None:
+    """Дописать атрибуты в текущий спан (например, исход проверки окна)."""
+    cur = CURRENT.get()
+    if cur is not None:
+        cur.attrs.update(attrs)
+
+
+def current_span() -> Span | None:
+    return CURRENT.get()
+
+
+def current_trace_id() -> str | None:
+    cur = CURRENT.get()
+    return cur.trace_id if cur is not None else None
+
+
+# ──────────── запись ────────────
+def setup(path: str = TRACE_FILE) -> None:
+    """Неблокирующая запись трасс: QueueHandler → поток QueueListener → файл."""
+    global _listener
+    if not TRACING or _listener is not None:
+        return
+    q: queue.SimpleQueue = queue.SimpleQueue()
+    fh = logging.handlers.RotatingFileHandler(path, maxBytes=TRACE_MAX_BYTES,
+                                              backupCount=TRACE_BACKUPS, encoding="utf-8")
+    fh.setFormatter(logging.Formatter("%(message)s"))
+    _log.addHandler(logging.handlers.QueueHandler(q))
+    _log.setLevel(logging.INFO)
+    _listener = logging.handlers.QueueListener(q, fh)
+    _listener.start()
+
+
+def shutdown() -> None:
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+    _log.handlers.clear()
+
+
+# ──────────── CLI ────────────
+def _load(path: str) -> Dict[str, List[dict]]:
+    traces: Dict[str, List[dict]] = defaultdict(list)
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                rec = json.loads(line)
+            except ValueError:
+                continue
+            traces[rec["trace"]].append(rec)
+    return traces
+
+
+def _summary(spans: List[dict]) -> dict:
+    start = min(s["ts"] for s in spans)
+    end = max(s["ts"] + s["ms"] / 1000 for s in spans)
+    root = next((s for s in spans if s["parent"] is None), spans[0])
+    return {"start": start, "ms": (end - start) * 1000, "root": root}
+
+
+def _print_tree(spans: List[dict]) -> None:
+    t0 = min(s["ts"] for s in spans)
+    children: Dict[str | None, List[dict]] = defaultdict(list)
+    ids = {s["span"] for s in spans}
+    for s in spans:
+        children[s["parent"] if s["parent"] in ids else None].append(s)
+
+    def walk(parent, depth):
+        for s in sorted(children.get(parent, []), key=lambda x: x["ts"]):
+            extra = {k: v for k, v in s.items()
+                     if k not in ("ts", "trace", "span", "parent", "name", "ms")}
+            print(f"  +{(s['ts'] - t0) * 1000:8.1f} {s['ms']:9.1f} мс  {'  ' * depth}{s['name']}"
+                  + (f"  {extra}" if extra else ""))
+            walk(s["span"], depth + 1)
+
+    walk(None, 0)
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description="Самые медленные трассы из JSONL-лога")
+    ap.add_argument("file", nargs="?", default=TRACE_FILE)
+    ap.add_argument("--top", type=int, default=10)
+    ap.add_argument("--name", help="только трассы с таким корневым спаном (хендлером)")
+    ap.add_argument("--user", type=int, help="только трассы пользователя")
+    ap.add_argument("--trace", help="разбивка одной трассы")
+    ap.add_argument("--details", type=int, default=3, help="для скольких из топа печатать разбивку")
+    args = ap.parse_args(argv)
+
+    traces = _load(args.file)
+    if args.trace:
+        spans = traces.get(args.trace)
+        if not spans:
+            print("трасса не найдена")
+            return 1
+        _print_tree(spans)
+        return 0
+
+    rows = []
+    for tid, spans in traces.items():
+        sm = _summary(spans)
+        root = sm["root"]
+        if args.name and root["name"] != args.name:
+            continue
+        if args.user and root.get("user") != args.user:
+            continue
+        rows.append((sm["ms"], tid, sm, spans))
+    rows.sort(key=lambda r: -r[0])
+    print(f"трасс: {len(rows)}")
+    for i, (ms, tid, sm, spans) in enumerate(rows[:args.top]):
+        root = sm["root"]
+        when = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(sm["start"]))
+        print(f"\n{ms:9.1f} мс  {tid}  {when}  {root['name']}  "
+              f"user={root.get('user')} data={root.get('data', '')}  спанов {len(spans)}")
+        if i < args.details:
+            _print_tree(spans)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())